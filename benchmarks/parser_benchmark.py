@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+"""
+Microbenchmarks for the response parsers. Synthetic responses of different shapes and sizes are streamed through each
+parser in realistic chunks, and the timings are written as JSON so runs on different commits can be compared:
+
+    ./benchmarks/parser_benchmark.py --output before.json
+    ./benchmarks/parser_benchmark.py --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from mentat.agent_handler import AgentHandler
+from mentat.auto_completer import AutoCompleter
+from mentat.code_context import CodeContext
+from mentat.code_file_manager import CodeFileManager
+from mentat.config import Config
+from mentat.conversation import Conversation
+from mentat.llm_api_handler import LlmApiHandler
+from mentat.parsers.block_parser import BlockParser
+from mentat.parsers.file_edit import FileEdit, Replacement
+from mentat.parsers.git_parser import GitParser
+from mentat.parsers.json_parser import JsonParser
+from mentat.parsers.parser import ParsedLLMResponse
+from mentat.parsers.replacement_parser import ReplacementParser
+from mentat.parsers.unified_diff_parser import UnifiedDiffParser
+from mentat.sampler.sampler import Sampler
+from mentat.session_context import SESSION_CONTEXT, SessionContext
+from mentat.session_stream import SessionStream
+from mentat.utils import convert_string_to_asynciter
+from mentat.vision.vision_manager import VisionManager
+
+# Multiplies the number of edits, lines or files in each scenario
+SIZES = {"small": 1, "medium": 10, "large": 50}
+
+
+def _file_lines(name: str, count: int) -> list[str]:
+    # Every line is unique so edits can only be located in one place
+    return [f"{name}_{i} = compute({i})" for i in range(count)]
+
+
+def many_small_edits(scale: int) -> tuple[dict[str, list[str]], dict[str, list[Replacement]]]:
+    """One file with an edit every ten lines."""
+    edit_count = 40 * scale
+    files = {"many_small_edits.py": _file_lines("value", edit_count * 10 + 10)}
+    replacements = [
+        Replacement(10 * k + 5, 10 * k + 6, [f"updated_{k} = compute({k}) + 1", f"extra_{k} = updated_{k} * 2"])
+        for k in range(edit_count)
+    ]
+    return files, {"many_small_edits.py": replacements}
+
+
+def huge_block(scale: int) -> tuple[dict[str, list[str]], dict[str, list[Replacement]]]:
+    """One insertion of thousands of lines."""
+    files = {"huge_block.py": _file_lines("value", 100)}
+    replacements = [Replacement(50, 50, _file_lines("inserted", 1000 * scale))]
+    return files, {"huge_block.py": replacements}
+
+
+def many_files(scale: int) -> tuple[dict[str, list[str]], dict[str, list[Replacement]]]:
+    """Hundreds to thousands of files with one edit each."""
+    files = {f"pkg/module_{k}.py": _file_lines(f"module_{k}", 30) for k in range(100 * scale)}
+    edits = {name: [Replacement(10, 11, [f"changed = compute({k})"])] for k, name in enumerate(files)}
+    return files, edits
+
+
+SCENARIOS = {
+    "many_small_edits": many_small_edits,
+    "huge_block": huge_block,
+    "many_files": many_files,
+}
+
+
+def _unified_diff_message(parsed: ParsedLLMResponse, cwd: Path) -> str:
+    # The unified diff parser can't format its own edits
+    message = [parsed.conversation, "\n\n"]
+    for file_edit in parsed.file_edits:
+        lines = file_edit.previous_file_lines or []
+        name = file_edit.file_path.relative_to(cwd)
+        message.append(f"--- {name}\n+++ {name}\n")
+        for replacement in sorted(file_edit.replacements):
+            message.append("@@ @@\n")
+            start, end = replacement.starting_line, replacement.ending_line
+            hunk = [f" {line}" for line in lines[max(start - 2, 0) : start]]
+            hunk += [f"-{line}" for line in lines[start:end]]
+            hunk += [f"+{line}" for line in replacement.new_lines]
+            hunk += [f" {line}" for line in lines[end : end + 2]]
+            message.append("".join(f"{line}\n" for line in hunk))
+        message.append("@@ end @@\n")
+    return "".join(message)
+
+
+def _json_message(parsed: ParsedLLMResponse, cwd: Path) -> str:
+    # The json parser can't format its own edits either
+    content: list[dict[str, Any]] = [{"type": "comment", "content": parsed.conversation}]
+    for file_edit in parsed.file_edits:
+        for replacement in sorted(file_edit.replacements):
+            content.append(
+                {
+                    "type": "edit",
+                    "filename": str(file_edit.file_path.relative_to(cwd)),
+                    "starting-line": replacement.starting_line + 1,
+                    "ending-line": replacement.ending_line + 1,
+                    "content": "\n".join(replacement.new_lines),
+                }
+            )
+    return json.dumps({"content": content}, indent=2)
+
+
+def _parse_with(parser: Any, chunk_size: int) -> Callable[[str], Awaitable[ParsedLLMResponse]]:
+    async def parse(response: str) -> ParsedLLMResponse:
+        if isinstance(parser, GitParser):
+            return await parser.stream_and_parse_llm_response(convert_string_to_asynciter(response, chunk_size))
+        return await parser.parse_llm_response(response, chunk_size=chunk_size)
+
+    return parse
+
+
+PARSERS = {
+    "block": (BlockParser, lambda parser, parsed, cwd: parser.file_edits_to_llm_message(parsed)),
+    "replacement": (ReplacementParser, lambda parser, parsed, cwd: parser.file_edits_to_llm_message(parsed)),
+    "unified-diff": (UnifiedDiffParser, lambda parser, parsed, cwd: _unified_diff_message(parsed, cwd)),
+    "json": (JsonParser, lambda parser, parsed, cwd: _json_message(parsed, cwd)),
+    "git": (GitParser, lambda parser, parsed, cwd: parser.file_edits_to_llm_message(parsed)),
+}
+
+
+def _create_session_context(cwd: Path) -> SessionContext:
+    stream = SessionStream()
+    session_context = SessionContext(
+        cwd,
+        stream,
+        LlmApiHandler(),
+        Config(),
+        CodeContext(stream, cwd),
+        CodeFileManager(),
+        Conversation(),
+        VisionManager(),
+        AgentHandler(),
+        AutoCompleter(),
+        Sampler(),
+        throttle_output=False,
+    )
+    SESSION_CONTEXT.set(session_context)
+    return session_context
+
+
+def _timings(samples: list[float]) -> dict[str, float]:
+    return {"min": min(samples), "median": statistics.median(samples)}
+
+
+async def run_benchmark(
+    parser_name: str, scenario_name: str, size: str, chunk_size: int, repeat: int, cwd: Path
+) -> dict[str, Any]:
+    parser_class, format_response = PARSERS[parser_name]
+    parser = parser_class()
+    parse = _parse_with(parser, chunk_size)
+    files, edits = SCENARIOS[scenario_name](SIZES[size])
+
+    ctx = _create_session_context(cwd)
+    file_lines = dict[Path, list[str]]()
+    for name, lines in files.items():
+        path = cwd / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(lines))
+        file_lines[path] = lines
+        ctx.code_file_manager.read_file(path)
+    expected = ParsedLLMResponse(
+        "",
+        "I'll make these changes.",
+        [
+            FileEdit(cwd / name, replacements, previous_file_lines=file_lines[cwd / name])
+            for name, replacements in edits.items()
+        ],
+    )
+
+    start = time.perf_counter()
+    response = format_response(parser, expected, cwd)
+    format_time = time.perf_counter() - start
+
+    parse_times = list[float]()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = await parse(response)
+        parse_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for file_edit in parsed.file_edits:
+        file_edit.resolve_conflicts()
+    resolve_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    updated_lines = {
+        file_edit.file_path: file_edit.get_updated_file_lines(
+            ctx.code_file_manager.file_lines.get(file_edit.file_path, [])
+        )
+        for file_edit in parsed.file_edits
+    }
+    updated_lines_time = time.perf_counter() - start
+    # The parsed edits have to make the same changes that were formatted into the response
+    matches = updated_lines == {
+        file_edit.file_path: file_edit.get_updated_file_lines(file_lines[file_edit.file_path])
+        for file_edit in expected.file_edits
+    }
+
+    # Tracing slows everything down, so memory is measured on its own run
+    tracemalloc.start()
+    await parse(response)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    for path in file_lines:
+        path.unlink()
+
+    return {
+        "parser": parser_name,
+        "scenario": scenario_name,
+        "size": size,
+        "chunk_size": chunk_size,
+        "response_chars": len(response),
+        "files": len(files),
+        "edits": sum(len(replacements) for replacements in edits.values()),
+        "matches": matches,
+        "chars_per_second": len(response) / min(parse_times),
+        "peak_memory_bytes": peak_memory,
+        "stages": {
+            "format": format_time,
+            "parse": _timings(parse_times),
+            "resolve_conflicts": resolve_time,
+            "updated_lines": updated_lines_time,
+        },
+    }
+
+
+def _commit() -> str | None:
+    result = subprocess.run(
+        ["git", "rev-parse", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=False
+    )
+    return result.stdout.strip() or None
+
+
+def _compare(results: list[dict[str, Any]], baseline_path: Path):
+    """Adds how each result's parse time and memory compare to the same benchmark in the baseline."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    baseline_results = {(r["parser"], r["scenario"], r["size"], r["chunk_size"]): r for r in baseline["results"]}
+    for result in results:
+        old = baseline_results.get((result["parser"], result["scenario"], result["size"], result["chunk_size"]))
+        if old is None:
+            continue
+        result["baseline"] = {
+            "commit": baseline.get("commit"),
+            "parse_ratio": result["stages"]["parse"]["min"] / old["stages"]["parse"]["min"],
+            "peak_memory_ratio": result["peak_memory_bytes"] / old["peak_memory_bytes"],
+        }
+
+
+async def main(args: argparse.Namespace):
+    results = list[dict[str, Any]]()
+    starting_dir = Path.cwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cwd = Path(temp_dir).resolve()
+        # The git parser resolves file names against the working directory
+        os.chdir(cwd)
+        try:
+            for parser_name in args.parsers:
+                for scenario_name in args.scenarios:
+                    for size in args.sizes:
+                        result = await run_benchmark(
+                            parser_name, scenario_name, size, args.chunk_size, args.repeat, cwd
+                        )
+                        print(
+                            f"{parser_name:>12} {scenario_name:>16} {size:>6}: "
+                            f"{result['stages']['parse']['min']:.4f}s, {result['chars_per_second']:,.0f} chars/s"
+                            + ("" if result["matches"] else " (edits don't match)"),
+                            file=sys.stderr,
+                        )
+                        results.append(result)
+        finally:
+            os.chdir(starting_dir)
+
+    if args.baseline:
+        _compare(results, Path(args.baseline))
+    output = json.dumps(
+        {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "timestamp": datetime.now().isoformat(),
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the response parsers on synthetic responses")
+    parser.add_argument("--parsers", nargs="+", choices=list(PARSERS), default=list(PARSERS))
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"])
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=16,
+        help="Characters per streamed chunk; model responses usually arrive a few tokens at a time",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="Times each response is parsed")
+    parser.add_argument("--output", help="File to write the results to instead of stdout")
+    parser.add_argument("--baseline", help="Results from an earlier run to compare against")
+    asyncio.run(main(parser.parse_args()))
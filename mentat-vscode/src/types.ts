@@ -26,6 +26,8 @@ type ContextUpdateData = {
     auto_context_tokens: number;
     features: string[];
     git_diff_paths: string[];
+    git_untracked_paths: string[];
+    git_diff_stats: Record<string, [number, number]>;
     total_tokens: number;
     maximum_tokens: number;
     total_cost: number;
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import json
+import logging
+import subprocess
+import time
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Set, TypedDict, Union
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, TypedDict, Union
 
+import attr
 from ragdaemon.daemon import Daemon
+from ragdaemon.errors import RagdaemonError
+from ragdaemon.graph import KnowledgeGraph
 
 from mentat.code_feature import CodeFeature, get_consolidated_feature_refs
 from mentat.diff_context import DiffContext
 from mentat.errors import PathValidationError
-from mentat.git_handler import get_git_root_for_path
+from mentat.file_watcher import FileWatcher
+from mentat.git_handler import get_git_root_for_path, get_head_tree_hash, resolve_treeish
+from mentat.graph_snapshot import GraphSnapshot, get_graph_path, get_snapshot_path
 from mentat.include_files import (
     PathType,
     get_code_features_for_path,
@@ -16,11 +25,11 @@ from mentat.include_files import (
     match_path_with_patterns,
     validate_and_format_path,
 )
-from mentat.interval import parse_intervals, split_intervals_from_path
+from mentat.interval import INTERVAL_FILE_END, Interval, IntervalSet, parse_intervals, split_intervals_from_path
 from mentat.llm_api_handler import get_max_tokens
 from mentat.session_context import SESSION_CONTEXT
 from mentat.session_stream import SessionStream
-from mentat.utils import get_relative_path, mentat_dir_path
+from mentat.utils import StatSignature, get_relative_path, get_stat_signature, mentat_dir_path
 
 
 class ContextStreamMessage(TypedDict):
@@ -30,15 +39,36 @@ class ContextStreamMessage(TypedDict):
     features: List[str]
     git_diff_paths: List[str]
     git_untracked_paths: List[str]
+    git_diff_stats: Dict[str, List[int]]
     total_tokens: int
     maximum_tokens: int
     total_cost: float
 
 
+WHOLE_FILE = Interval(1, INTERVAL_FILE_END)
+
 graphs_dir = mentat_dir_path / "ragdaemon"
 graphs_dir.mkdir(parents=True, exist_ok=True)
 
 
+@attr.define
+class ContextSnapshot:
+    """
+    A rendered code message along with everything it was built from. The snapshot can be reused
+    as long as the key is unchanged and none of the files it read have been modified since.
+    """
+
+    key: Hashable = attr.field()
+    file_signatures: dict[Path, Optional[StatSignature]] = attr.field()
+    code_message: str = attr.field()
+    version: int = attr.field()
+
+    def is_valid(self, key: Hashable) -> bool:
+        return key == self.key and all(
+            get_stat_signature(path) == signature for path, signature in self.file_signatures.items()
+        )
+
+
 class CodeContext:
     daemon: Daemon
 
@@ -59,12 +89,31 @@ class CodeContext:
         self.include_files: Dict[Path, List[CodeFeature]] = {}
         self.ignore_files: Set[Path] = set()
 
+        self._snapshot: ContextSnapshot | None = None
+        self.snapshot_version = 0
+
+        self.file_watcher: FileWatcher | None = None
+        self._graph_settings: str | None = None
+        # When the daemon's graph was last built or loaded, and the tree HEAD pointed to then
+        self._graph_built_at_ns: int | None = None
+        self._graph_tree_hash: str | None = None
+        # The watcher ignores .git, so commits, checkouts and staging are caught by comparing git's state instead
+        self._graph_git_state: Hashable = None
+
     async def refresh_daemon(self):
-        """Call before interacting with context to ensure daemon is up to date."""
+        """
+        Call before interacting with context to ensure daemon is up to date.
+        If the file watcher is enabled, the daemon is only updated when files have changed since the last update.
+        """
+        ctx = SESSION_CONTEXT.get()
+
+        if ctx.config.watch_files and self.file_watcher is None:
+            # Started before the first update so no changes are missed while it runs
+            self.file_watcher = FileWatcher(ctx.cwd)
+            self.file_watcher.start()
 
         if not hasattr(self, "daemon"):
             # Daemon is initialized after setup because it needs the embedding_provider.
-            ctx = SESSION_CONTEXT.get()
             cwd = ctx.cwd
             llm_api_handler = ctx.llm_api_handler
 
@@ -82,26 +131,134 @@ class CodeContext:
                 cwd=cwd,
                 annotators=annotators,
                 verbose=False,
-                graph_path=graphs_dir / f"ragdaemon-{cwd.name}.json",
+                graph_path=get_graph_path(graphs_dir, cwd),
                 spice_client=llm_api_handler.spice,
                 model=ctx.config.embedding_model,
                 provider=ctx.config.embedding_provider,
             )
+            self._graph_settings = self._get_graph_settings(annotators)
+            if self.file_watcher is not None:
+                self.file_watcher.pop_changes()
+            if self._load_saved_graph():
+                self._record_graph_build()
+                return
+        elif (
+            self.file_watcher is not None
+            and not self.file_watcher.has_changes()
+            and self.diff_context.git_state() == self._graph_git_state
+        ):
+            return
+        elif self.file_watcher is not None:
+            self.file_watcher.pop_changes()
+
+        # The update saves a graph that the saved snapshot no longer describes; a new one is saved when the session ends
+        get_snapshot_path(self.daemon.graph_path).unlink(missing_ok=True)
+        # Recorded before updating so that changes made during the update count as changes since the build
+        self._record_graph_build()
         await self.daemon.update()
 
+    def _record_graph_build(self):
+        git_root = self.diff_context.git_root
+        self._graph_built_at_ns = time.time_ns()
+        self._graph_git_state = self.diff_context.git_state()
+        # Looked up through the persistent cat-file process, so this doesn't start git
+        self._graph_tree_hash = get_head_tree_hash(git_root) if git_root else None
+
+    def save_graph_snapshot(self):
+        """
+        Called when the session ends. Saves a snapshot of the repository next to the daemon's graph, so the next
+        session can load the graph instead of updating it, as long as nothing changed since the graph was built.
+        """
+        git_root = self.diff_context.git_root
+        if not hasattr(self, "daemon") or git_root is None or self._graph_built_at_ns is None:
+            return
+        try:
+            snapshot = self._take_graph_snapshot()
+        except subprocess.CalledProcessError as e:
+            logging.debug(f"Unable to take graph snapshot: {e}")
+            return
+        if snapshot is None:
+            return
+        graph_files = [
+            self.daemon.cwd / data["ref"]
+            for _, data in self.daemon.graph.nodes(data=True)  # pyright: ignore
+            if data and data.get("type") == "file" and "ref" in data
+        ]
+        if snapshot.matches_graph(self._graph_tree_hash, self._graph_built_at_ns, graph_files, git_root):
+            snapshot.save(get_snapshot_path(self.daemon.graph_path))
+
+    def _get_graph_settings(self, annotators: dict[str, dict[str, Any]]) -> str:
+        ctx = SESSION_CONTEXT.get()
+        git_root = self.diff_context.git_root
+        diff_target = self.diff_context.target
+        return json.dumps(
+            {
+                "annotators": annotators,
+                "diff_target": [
+                    resolve_treeish(git_root, part) if git_root else part for part in diff_target.split(" ") if part
+                ],
+                "embedding_model": ctx.config.embedding_model,
+                "embedding_provider": ctx.config.embedding_provider,
+            },
+            sort_keys=True,
+        )
+
+    def _take_graph_snapshot(self) -> GraphSnapshot | None:
+        git_root = self.diff_context.git_root
+        if git_root is None or self._graph_settings is None:
+            return None
+        return GraphSnapshot.take(git_root, self._graph_settings)
+
+    def _load_saved_graph(self) -> bool:
+        """
+        Loads the graph saved by a previous session if nothing in the repository has changed since it was saved,
+        so the daemon doesn't have to rescan the whole codebase on startup.
+        """
+        graph_path = self.daemon.graph_path
+        saved_snapshot = GraphSnapshot.load(get_snapshot_path(graph_path))
+        git_root = self.diff_context.git_root
+        if saved_snapshot is None or git_root is None or not graph_path.exists():
+            return False
+        snapshot = self._take_graph_snapshot()
+        if snapshot is None or saved_snapshot.changed_files(snapshot, git_root) != set():
+            return False
+
+        # Anything ragdaemon raises means the saved graph can't be used, and the daemon updates it instead
+        try:
+            graph = KnowledgeGraph.load(str(graph_path))
+            if Path(graph.graph.get("cwd", "")) != self.daemon.cwd:
+                return False
+            # The graph only stores checksums; make sure their documents are still in the database
+            checksums = {data["checksum"] for _, data in graph.nodes(data=True) if data.get("checksum")}  # pyright: ignore
+            if checksums and len(self.daemon.db.get(list(checksums))["ids"]) != len(checksums):
+                return False
+        except Exception:
+            return False
+        self.daemon.graph = graph
+        return True
+
+    async def stop_file_watcher(self):
+        if self.file_watcher is not None:
+            await self.file_watcher.stop()
+            self.file_watcher = None
+
     async def refresh_context_display(self):
         """
         Sends a message to the client with the code context. It is called in the main loop.
         """
         ctx = SESSION_CONTEXT.get()
 
-        diff_context_display = self.diff_context.get_display_context()
+        diff_context_display = await self.diff_context.get_display_context()
 
         features = get_consolidated_feature_refs(
             [feature for file_features in self.include_files.values() for feature in file_features]
         )
         git_diff_paths = [str(p) for p in self.diff_context.diff_files()]
         git_untracked_paths = [str(p) for p in self.diff_context.untracked_files()]
+        git_diff_stats = {
+            str(p): [insertions, deletions]
+            for p, (insertions, deletions) in (await self.diff_context.diff_stats()).items()
+        }
 
         total_tokens = await ctx.conversation.count_tokens(include_code_message=True)
 
@@ -114,6 +271,7 @@ class CodeContext:
             features=features,
             git_diff_paths=git_diff_paths,
             git_untracked_paths=git_untracked_paths,
+            git_diff_stats=git_diff_stats,
             total_tokens=total_tokens,
             maximum_tokens=get_max_tokens(),
             total_cost=total_cost,
@@ -132,7 +290,54 @@ class CodeContext:
         If prompt is empty, auto context won't be used.
         'prompt_tokens' argument is the total number of tokens used by the prompt before the code message,
         used to ensure that the code message won't overflow the model's context size
+        The message is cached in a ContextSnapshot and only rebuilt when one of its inputs changes.
         """
+        await self.diff_context.refresh_async()
+        if self.file_watcher is not None and self.file_watcher.has_changes():
+            # Files outside of the snapshot's signatures can change what auto-context selects
+            self.invalidate_snapshot()
+        if self._snapshot is not None and self._snapshot.is_valid(self._snapshot_key(prompt_tokens, prompt)):
+            return self._snapshot.code_message
+
+        code_message, context_paths = await self._build_code_message(prompt_tokens, prompt)
+
+        # Auto-context can add features to include_files, so the key is taken after the build
+        file_signatures = {path: get_stat_signature(path) for path in (*self.include_files.keys(), *context_paths)}
+        self.snapshot_version += 1
+        self._snapshot = ContextSnapshot(
+            key=self._snapshot_key(prompt_tokens, prompt),
+            file_signatures=file_signatures,
+            code_message=code_message,
+            version=self.snapshot_version,
+        )
+        return code_message
+
+    def _snapshot_key(self, prompt_tokens: int, prompt: Optional[str]) -> Hashable:
+        config = SESSION_CONTEXT.get().config
+
+        features = tuple(
+            sorted(str(feature) for file_features in self.include_files.values() for feature in file_features)
+        )
+        # The prompt and its tokens are only used to select auto-context
+        uses_prompt = config.auto_context_tokens > 0 and bool(prompt)
+        return (
+            features,
+            self.diff_context.target,
+            self.diff_context.fingerprint(),
+            tuple(self.diff_context.untracked_files()),
+            prompt if uses_prompt else None,
+            prompt_tokens if uses_prompt else None,
+            config.model,
+            config.auto_context_tokens,
+            config.token_buffer,
+            get_max_tokens(),
+        )
+
+    def invalidate_snapshot(self):
+        """Forces the next call to get_code_message to rebuild the code message."""
+        self._snapshot = None
+
+    async def _build_code_message(self, prompt_tokens: int, prompt: Optional[str]) -> tuple[str, list[Path]]:
         session_context = SESSION_CONTEXT.get()
         config = session_context.config
         llm_api_handler = session_context.llm_api_handler
@@ -142,7 +347,6 @@ class CodeContext:
 
         # Setup the header (Mentat-specific, before ragdaemon context)
         header_lines = list[str]()
-        self.diff_context.refresh()
         if self.diff_context.diff_files():
             header_lines += [f"Diff References: {self.diff_context.name}\n"]
         header_lines += ["Code Files:\n\n"]
@@ -158,19 +362,27 @@ class CodeContext:
         if not self.include_files.values():
             for node in diff_nodes:
                 context_builder.add_diff(node)
+        undecodable_paths = list[Path]()
         for path, features in self.include_files.items():
-            for feature in features:
-                interval_string = feature.interval_string()
-                if interval_string and "-" in interval_string:
-                    start, exclusive_end = interval_string.split("-")
-                    inclusive_end = str(int(exclusive_end) - 1)
-                    interval_string = f"{start}-{inclusive_end}"
-                ref = feature.rel_path(session_context.cwd) + interval_string
-                context_builder.add_ref(ref, tags=["user-included"])
+            try:
+                for feature in features:
+                    interval_string = feature.interval_string()
+                    if interval_string and "-" in interval_string:
+                        start, exclusive_end = interval_string.split("-")
+                        inclusive_end = str(int(exclusive_end) - 1)
+                        interval_string = f"{start}-{inclusive_end}"
+                    ref = feature.rel_path(session_context.cwd) + interval_string
+                    context_builder.add_ref(ref, tags=["user-included"])
+            except RagdaemonError:
+                # Only the start of a file is checked when it's included; ragdaemon reads the rest
+                undecodable_paths.append(path)
+                continue
             relative_path = get_relative_path(path, cwd).as_posix()
             diffs_for_path = [node for node in diff_nodes if f":{relative_path}" in node]
             for diff in diffs_for_path:
                 context_builder.add_diff(diff)
+        for path in undecodable_paths:
+            self._remove_unreadable_file(path, "isn't a text file")
 
         # If auto-context, replace the context_builder with a new one
         if config.auto_context_tokens > 0 and prompt:
@@ -203,13 +415,28 @@ class CodeContext:
 
         # The context message is rendered by ragdaemon (ContextBuilder.render())
         context_message = context_builder.render()
+        context_paths = list[Path]()
         for relative_path in context_builder.context.keys():
             path = Path(cwd / relative_path).resolve()
-            if path not in code_file_manager.file_lines:
-                with open(path, "r") as file:  # Used by code_file_manager to validate file_edits
-                    lines = file.read().split("\n")
-                    code_file_manager.file_lines[path] = lines
-        return "\n".join(header_lines) + context_message
+            context_paths.append(path)
+            try:
+                # Records the lines and stat signature code_file_manager validates file_edits against; cached if unchanged
+                code_file_manager.read_file(path)
+            except FileNotFoundError:
+                # Deleted outside of Mentat (e.g. by a git checkout) since it was included
+                self._remove_unreadable_file(path, "no longer exists")
+            except UnicodeDecodeError:
+                # Only the start of a file is checked when it's included
+                self._remove_unreadable_file(path, "isn't a text file")
+        return "\n".join(header_lines) + context_message, context_paths
+
+    def _remove_unreadable_file(self, path: Path, reason: str):
+        session_context = SESSION_CONTEXT.get()
+        if self.include_files.pop(path, None) is not None:
+            session_context.stream.send(
+                f"{get_relative_path(path, session_context.cwd)} {reason} and was removed from context",
+                style="warning",
+            )
 
     def get_all_features(
         self,
@@ -239,29 +466,36 @@ class CodeContext:
         Adds the given code features to context. If the feature is already included, it will not be added.
         """
         included_paths: Set[Path] = set()
+        # Intervals already included for each path touched, so duplicate checks aren't a scan over every feature
+        included_intervals: Dict[Path, Set[Interval]] = {}
         for code_feature in code_features:
-            if code_feature.path not in self.include_files:
-                self.include_files[code_feature.path] = [code_feature]
+            path = code_feature.path
+            if path not in self.include_files:
+                self.include_files[path] = [code_feature]
+                included_intervals[path] = {code_feature.interval}
                 included_paths.add(Path(str(code_feature)))
-            else:
-                code_feature_not_included = True
-                for included_code_feature in self.include_files[code_feature.path]:
-                    # Intervals can still overlap if user includes intervals different than what chunker breaks up,
-                    # but we merge when making code message and don't duplicate lines
-                    if (
-                        included_code_feature.interval == code_feature.interval
-                        # No need to include an interval if the entire file is already included
-                        or included_code_feature.interval.whole_file()
-                    ):
-                        code_feature_not_included = False
-                        break
-                if code_feature_not_included:
-                    if code_feature.interval.whole_file():
-                        self.include_files[code_feature.path] = []
-                    self.include_files[code_feature.path].append(code_feature)
-                    included_paths.add(Path(str(code_feature)))
+                continue
+
+            if path not in included_intervals:
+                included_intervals[path] = {feature.interval for feature in self.include_files[path]}
+            intervals = included_intervals[path]
+            # Intervals can still overlap if user includes intervals different than what chunker breaks up,
+            # but we merge when making code message and don't duplicate lines
+            if code_feature.interval in intervals or WHOLE_FILE in intervals:
+                # No need to include an interval if the entire file is already included
+                continue
+            if code_feature.interval.whole_file():
+                self.include_files[path] = []
+                intervals.clear()
+            self.include_files[path].append(code_feature)
+            intervals.add(code_feature.interval)
+            included_paths.add(Path(str(code_feature)))
         return included_paths
 
+    def get_included_intervals(self, path: Path) -> IntervalSet:
+        """Returns the lines of the file at path that are in context."""
+        return IntervalSet(feature.interval for feature in self.include_files.get(path, []))
+
     def include(self, path: Path | str, exclude_patterns: Iterable[Path | str] = []) -> Set[Path]:
         """
         Add paths to the context
@@ -329,7 +563,7 @@ class CodeContext:
             session_context.stream.send(f"Path {interval_path} not in context", style="error")
             return excluded_paths
 
-        intervals = parse_intervals(interval_str)
+        intervals = set(parse_intervals(interval_str))
         included_code_features: List[CodeFeature] = []
         for code_feature in self.include_files[interval_path]:
             if code_feature.interval not in intervals:
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from collections import defaultdict
 from pathlib import Path
 from typing import Optional
 
@@ -8,7 +7,7 @@ import attr
 from ragdaemon.utils import get_document
 
 from mentat.errors import MentatError
-from mentat.interval import INTERVAL_FILE_END, Interval
+from mentat.interval import INTERVAL_FILE_END, Interval, IntervalSet
 from mentat.session_context import SESSION_CONTEXT
 from mentat.utils import get_relative_path
 
@@ -72,18 +71,20 @@ def get_consolidated_feature_refs(features: list[CodeFeature]) -> list[str]:
     """
     Return a list of 'path:<interval>,<interval>' strings, merging code features with the same path
     """
-    level_info_by_path = defaultdict[Path, list[Interval | None]](list)
+    # None means the whole file is included
+    intervals_by_path = dict[Path, IntervalSet | None]()
     for f in features:
         if f.interval.whole_file():
-            level_info_by_path[f.path].append(None)
-        else:
-            level_info_by_path[f.path].append(f.interval)
+            intervals_by_path[f.path] = None
+        elif f.path not in intervals_by_path:
+            intervals_by_path[f.path] = IntervalSet([f.interval], merge_adjacent=False)
+        elif (intervals := intervals_by_path[f.path]) is not None:
+            intervals.add(f.interval)
 
     consolidated_refs = list[str]()
-    for path, level_info in level_info_by_path.items():
+    for path, intervals in intervals_by_path.items():
         ref_string = str(path)
-        intervals = sorted([level for level in level_info if level is not None])
-        if intervals and None not in level_info:
+        if intervals is not None:
             ref_string += ":" + ",".join(str(interval) for interval in intervals)
         consolidated_refs.append(ref_string)
 
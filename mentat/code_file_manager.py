@@ -1,38 +1,88 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import os
+from collections import OrderedDict
 from pathlib import Path
-from typing import TYPE_CHECKING, List
+from typing import TYPE_CHECKING, Optional, Sequence
 
 from mentat.edit_history import EditHistory
 from mentat.errors import MentatError
+from mentat.file_transaction import FileTransaction
+from mentat.git_handler import get_git_root_for_path, get_synced_hash_tree
+from mentat.hash_tree import update_hash_trees
 from mentat.interval import Interval
+from mentat.line_buffer import LineBuffer
 from mentat.session_context import SESSION_CONTEXT
 from mentat.session_input import ask_yes_no
-from mentat.utils import get_relative_path, sha256
+from mentat.utils import StatSignature, get_relative_path, get_stat_signature, sha256
 
 if TYPE_CHECKING:
     # This normally will cause a circular import
     from mentat.parsers.file_edit import FileEdit
 
 
+# Total size of the file contents kept in CodeFileManager's cache
+FILE_CACHE_BUDGET = 64 * 1024 * 1024
+
+
 class CodeFileManager:
     def __init__(self):
-        self.file_lines = dict[Path, list[str]]()
+        self.file_lines = dict[Path, Sequence[str]]()
+        # The stat signatures of the files when file_lines was recorded, used to detect changes before editing
+        self.file_signatures = dict[Path, Optional[StatSignature]]()
         self.history = EditHistory()
+        # Least recently read files first
+        self._file_cache = OrderedDict[Path, tuple[StatSignature, LineBuffer]]()
+        self._file_cache_size = 0
+
+    def _cache_file(self, abs_path: Path, signature: Optional[StatSignature], lines: LineBuffer):
+        self._uncache_file(abs_path)
+        if signature is None or signature[1] > FILE_CACHE_BUDGET:
+            return
+        self._file_cache[abs_path] = (signature, lines)
+        self._file_cache_size += signature[1]
+        while self._file_cache_size > FILE_CACHE_BUDGET:
+            _, (evicted_signature, _) = self._file_cache.popitem(last=False)
+            self._file_cache_size -= evicted_signature[1]
+
+    def _uncache_file(self, abs_path: Path):
+        cached = self._file_cache.pop(abs_path, None)
+        if cached is not None:
+            self._file_cache_size -= cached[0][1]
 
-    def read_file(self, path: Path) -> list[str]:
-        # TODO: Change to only ever using this function to read files, then cache files and
-        # only re-read them when their last modified time is updated
+    def read_file(self, path: Path) -> LineBuffer:
+        """
+        Reads a file's lines and records them and the file's stat signature as the version edits are made against.
+        Contents are cached until the file's stat signature changes, so unchanged files are only read once.
+        The lines are shared rather than copied; use copy() to get a list that can be edited.
+        """
         session_context = SESSION_CONTEXT.get()
 
         abs_path = path if path.is_absolute() else session_context.cwd / path
-        with open(abs_path, "r") as f:
-            lines = f.read().split("\n")
+        signature = get_stat_signature(abs_path)
+        cached = self._file_cache.get(abs_path)
+        if cached is not None and cached[0] == signature:
+            self._file_cache.move_to_end(abs_path)
+            lines = cached[1]
+        else:
+            with open(abs_path, "r") as f:
+                lines = LineBuffer(f.read())
+            self._cache_file(abs_path, signature, lines)
         self.file_lines[abs_path] = lines
+        self.file_signatures[abs_path] = signature
         return lines
 
+    def has_changed(self, abs_path: Path) -> bool:
+        """Returns whether a file changed on disk since its lines were last recorded."""
+        signature = self.file_signatures.get(abs_path)
+        if signature is not None and signature == get_stat_signature(abs_path):
+            return False
+        # A different signature doesn't always mean different contents (e.g. the file was only touched)
+        stored_lines = self.file_lines.get(abs_path)
+        return stored_lines is None or stored_lines != self.read_file(abs_path)
+
     def create_file(self, abs_path: Path, content: str = ""):
         ctx = SESSION_CONTEXT.get()
         code_context = ctx.code_context
@@ -42,6 +92,7 @@ class CodeFileManager:
         abs_path.parent.mkdir(parents=True, exist_ok=True)
         with open(abs_path, "w") as f:
             f.write(content)
+        update_hash_trees([abs_path])
 
         if abs_path not in code_context.include_files:
             code_context.include(abs_path)
@@ -55,6 +106,8 @@ class CodeFileManager:
         if abs_path in code_context.include_files:
             code_context.exclude(abs_path)
         abs_path.unlink()
+        self._uncache_file(abs_path)
+        update_hash_trees([abs_path])
 
     def rename_file(self, abs_path: Path, new_abs_path: Path):
         ctx = SESSION_CONTEXT.get()
@@ -64,34 +117,50 @@ class CodeFileManager:
         if abs_path in code_context.include_files:
             code_context.exclude(abs_path)
         os.rename(abs_path, new_abs_path)
+        self._uncache_file(abs_path)
+        update_hash_trees([abs_path, new_abs_path])
         if new_abs_path not in code_context.include_files:
             code_context.include(new_abs_path)
 
-    def write_to_file(self, abs_path: Path, new_lines: List[str]):
+    def _record_file(self, abs_path: Path, lines: LineBuffer):
+        self.file_lines[abs_path] = lines
+        self.file_signatures[abs_path] = get_stat_signature(abs_path)
+        self._cache_file(abs_path, self.file_signatures[abs_path], lines)
+
+    def write_to_file(self, abs_path: Path, new_lines: Sequence[str]):
+        lines = LineBuffer("\n".join(new_lines))
         with open(abs_path, "w") as f:
-            f.write("\n".join(new_lines))
-        self.file_lines[abs_path] = new_lines
+            f.write(lines.text)
+        self._record_file(abs_path, lines)
+        update_hash_trees([abs_path])
 
     # Mainly does checks on if file is in context, file exists, file is unchanged, etc.
     async def write_changes_to_files(
         self,
         file_edits: list[FileEdit],
     ) -> list[FileEdit]:
+        """
+        Checks every edit, then applies them all in one FileTransaction, so either every file is changed or none are.
+        The applied edits become a single history entry.
+        """
         session_context = SESSION_CONTEXT.get()
         stream = session_context.stream
+        code_context = session_context.code_context
         agent_handler = session_context.agent_handler
 
         if not file_edits:
             return []
 
+        transaction = FileTransaction()
         applied_edits: list[FileEdit] = []
+        # The new lines of each file that is written
+        written_lines = dict[Path, LineBuffer]()
         for file_edit in file_edits:
             display_path = get_relative_path(file_edit.file_path, session_context.cwd)
 
             if file_edit.is_creation:
                 if file_edit.file_path.exists():
                     raise MentatError(f"Model attempted to create file {file_edit.file_path} which already exists")
-                self.create_file(file_edit.file_path)
             elif not file_edit.file_path.exists():
                 raise MentatError(f"Attempted to edit non-existent file {file_edit.file_path}")
 
@@ -99,15 +168,13 @@ class CodeFileManager:
                 stream.send(f"Deleting {display_path}...", style="error")
                 # We use the current lines rather than the stored lines for undo
                 file_edit.previous_file_lines = self.read_file(file_edit.file_path)
-                self.delete_file(file_edit.file_path)
+                transaction.delete(file_edit.file_path)
                 applied_edits.append(file_edit)
                 continue
 
             if not file_edit.is_creation:
-                # TODO: We use read_file so much that this probably doesn't work anymore
-                # We should instead make sure the last modified time doesn't change between code message and now
                 stored_lines = self.file_lines[file_edit.file_path]
-                if stored_lines != self.read_file(file_edit.file_path):
+                if self.has_changed(file_edit.file_path):
                     logging.info(f"File '{file_edit.file_path}' changed while generating changes")
                     stream.send(
                         f"File '{display_path}' changed while"
@@ -118,24 +185,58 @@ class CodeFileManager:
                         stream.send(f"Not applying changes to file {display_path}")
                         continue
             else:
-                stored_lines = []
+                stored_lines: Sequence[str] = []
 
-            if file_edit.rename_file_path is not None:
-                if file_edit.rename_file_path.exists():
-                    raise MentatError(
-                        f"Attempted to rename file {file_edit.file_path} to existing"
-                        f" file {file_edit.rename_file_path}"
-                    )
-                self.rename_file(file_edit.file_path, file_edit.rename_file_path)
+            if file_edit.rename_file_path is not None and file_edit.rename_file_path.exists():
+                raise MentatError(
+                    f"Attempted to rename file {file_edit.file_path} to existing file {file_edit.rename_file_path}"
+                )
 
             new_lines = file_edit.get_updated_file_lines(stored_lines)
-            if new_lines != stored_lines:
-                file_path = file_edit.rename_file_path or file_edit.file_path
+            file_path = file_edit.rename_file_path or file_edit.file_path
+            content = None
+            if new_lines != stored_lines or file_edit.is_creation:
+                written_lines[file_path] = LineBuffer("\n".join(new_lines))
+                content = written_lines[file_path].text
+            if file_edit.is_creation:
+                transaction.create(file_path, content or "")
+            elif file_edit.rename_file_path is not None:
+                transaction.rename(file_edit.file_path, file_edit.rename_file_path, content)
+            elif content is not None:
+                transaction.write(file_path, content)
+            if content is not None and not file_edit.is_creation:
                 # We use the current lines rather than the stored lines for undo
-                file_edit.previous_file_lines = self.read_file(file_path)
-                self.write_to_file(file_path, new_lines)
+                file_edit.previous_file_lines = self.read_file(file_edit.file_path)
             applied_edits.append(file_edit)
 
+        try:
+            await asyncio.to_thread(transaction.commit)
+        except OSError as e:
+            raise MentatError(f"Unable to apply changes; no files were changed: {e}")
+
+        changed_paths = list[Path]()
+        for file_edit in applied_edits:
+            changed_paths.append(file_edit.file_path)
+            if file_edit.is_creation:
+                logging.info(f"Created new file {file_edit.file_path}")
+                if file_edit.file_path not in code_context.include_files:
+                    code_context.include(file_edit.file_path)
+            elif file_edit.is_deletion:
+                logging.info(f"Deleted file {file_edit.file_path}")
+                # The file is already gone, so it's dropped directly rather than through exclude(), which validates it
+                code_context.include_files.pop(file_edit.file_path, None)
+                self._uncache_file(file_edit.file_path)
+            elif file_edit.rename_file_path is not None:
+                logging.info(f"Renamed file {file_edit.file_path} to {file_edit.rename_file_path}")
+                code_context.include_files.pop(file_edit.file_path, None)
+                self._uncache_file(file_edit.file_path)
+                if file_edit.rename_file_path not in code_context.include_files:
+                    code_context.include(file_edit.rename_file_path)
+                changed_paths.append(file_edit.rename_file_path)
+        for file_path, lines in written_lines.items():
+            self._record_file(file_path, lines)
+        update_hash_trees(changed_paths)
+
         for applied_edit in applied_edits:
             self.history.add_edit(applied_edit)
         if not agent_handler.agent_enabled:
@@ -144,7 +245,10 @@ class CodeFileManager:
 
     def get_file_checksum(self, path: Path, interval: Interval | None = None) -> str:
         if path.is_dir():
-            return ""  # TODO: Build and maintain a hash tree for git_root
+            git_root = get_git_root_for_path(path, raise_error=False)
+            if git_root is None:
+                return ""
+            return get_synced_hash_tree(git_root).get_hash(Path(os.path.realpath(path))) or ""
         text = path.read_text()
         if interval is not None:
             lines = text.splitlines()
@@ -12,9 +12,9 @@ class CommitCommand(Command, command_name="commit"):
     @override
     async def apply(self, *args: str) -> None:
         if args:
-            commit(args[0])
+            await commit(args[0])
         else:
-            commit(self.__class__.default_message)
+            await commit(self.__class__.default_message)
 
     @override
     @classmethod
@@ -128,6 +128,17 @@ class Config:
         converter=int,
         validator=validators.ge(0),  # pyright: ignore
     )
+    watch_files: bool = attr.field(
+        default=False,
+        metadata={
+            "description": (
+                "Watches the codebase for changes in the background so that the code context is only"
+                " re-scanned when files have changed. Useful for very large repositories."
+            ),
+            "auto_completions": bool_autocomplete,
+        },
+        converter=converters.optional(converters.to_bool),
+    )
 
     # Sample specific settings
     sample_repo: str | None = attr.field(
@@ -16,6 +16,7 @@ from openai.types.chat import (
 )
 from spice.errors import InvalidProviderError, UnknownModelError
 
+from mentat.edit_preview import EditPreview
 from mentat.llm_api_handler import (
     TOKEN_COUNT_WARNING,
     get_max_tokens,
@@ -39,6 +40,9 @@ class Conversation:
         # This contains a list of messages used for transcripts
         self.literal_messages = list[TranscriptMessage]()
 
+        # Previews of the edits in the latest model response
+        self.edit_preview = EditPreview()
+
     # The transcript logger logs tuples containing the actual message sent by the user or LLM
     # and (for LLM messages) the LLM conversation that led to that LLM response
     def add_transcript_message(self, transcript_message: TranscriptMessage):
@@ -94,7 +98,7 @@ class Conversation:
 
         try:
             _messages = await self.get_messages(system_prompt=system_prompt, include_code_message=include_code_message)
-            return ctx.llm_api_handler.spice.count_prompt_tokens(_messages, ctx.config.model, ctx.config.provider)
+            return ctx.llm_api_handler.count_prompt_tokens(_messages, ctx.config.model, ctx.config.provider)
         except (UnknownModelError, InvalidProviderError):
             return 0
 
@@ -129,7 +133,7 @@ class Conversation:
 
         if include_code_message:
             code_message = await ctx.code_context.get_code_message(
-                ctx.llm_api_handler.spice.count_prompt_tokens(_messages, ctx.config.model, ctx.config.provider),
+                ctx.llm_api_handler.count_prompt_tokens(_messages, ctx.config.model, ctx.config.provider),
                 prompt=(
                     prompt  # Prompt can be image as well as text
                     if isinstance(prompt, str)
@@ -189,7 +193,7 @@ class Conversation:
             terminate=True,
         )
 
-        num_prompt_tokens = llm_api_handler.spice.count_prompt_tokens(messages, config.model, config.provider)
+        num_prompt_tokens = llm_api_handler.count_prompt_tokens(messages, config.model, config.provider)
         stream.send(f"Total token count: {num_prompt_tokens}", style="info")
         if num_prompt_tokens > TOKEN_COUNT_WARNING:
             stream.send(
@@ -200,12 +204,16 @@ class Conversation:
             )
 
         stream.send("Streaming...\n")
+        self.edit_preview = EditPreview()
         async with stream.interrupt_catcher(parser.shutdown):
-            parsed_llm_response = await parser.stream_and_parse_llm_response(add_newline(response))
+            parsed_llm_response = await parser.stream_and_parse_llm_response(
+                add_newline(response), on_file_edit=self.edit_preview.file_edit_updated
+            )
+        await self.edit_preview.finish()
 
         # Sampler and History require previous_file_lines
         for file_edit in parsed_llm_response.file_edits:
-            file_edit.previous_file_lines = code_file_manager.file_lines.get(file_edit.file_path, []).copy()
+            file_edit.previous_file_lines = code_file_manager.file_lines.get(file_edit.file_path, [])
 
         llm_api_handler.display_cost_stats(response.current_response())
 
@@ -223,7 +231,7 @@ class Conversation:
         llm_api_handler = session_context.llm_api_handler
 
         messages_snapshot = await self.get_messages(include_code_message=True)
-        tokens_used = llm_api_handler.spice.count_prompt_tokens(messages_snapshot, config.model, config.provider)
+        tokens_used = llm_api_handler.count_prompt_tokens(messages_snapshot, config.model, config.provider)
         raise_if_context_exceeds_max(tokens_used)
 
         try:
@@ -240,7 +248,7 @@ class Conversation:
 
     async def remaining_context(self) -> int | None:
         ctx = SESSION_CONTEXT.get()
-        return get_max_tokens() - ctx.llm_api_handler.spice.count_prompt_tokens(
+        return get_max_tokens() - ctx.llm_api_handler.count_prompt_tokens(
             await self.get_messages(), ctx.config.model, ctx.config.provider
         )
 
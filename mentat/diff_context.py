@@ -1,17 +1,13 @@
-import subprocess
+import logging
 from pathlib import Path
-from typing import List, Literal, Optional
-
-from mentat.git_handler import (
-    check_head_exists,
-    get_diff_for_file,
-    get_files_in_diff,
-    get_git_root_for_path,
-    get_treeish_metadata,
-    get_untracked_files,
-)
+from typing import Dict, Hashable, List, Literal, Optional, Tuple
+
+from mentat.errors import UserError
+from mentat.git_handler import get_git_root_for_path, get_treeish_metadata
+from mentat.git_service import DiffState, GitService, get_git_service
 from mentat.session_context import SESSION_CONTEXT
 from mentat.session_stream import SessionStream
+from mentat.utils import get_stat_signature
 
 
 class DiffContext:
@@ -28,6 +24,7 @@ class DiffContext:
         self.git_root = get_git_root_for_path(cwd, raise_error=False)
         if not self.git_root:
             return
+        self.git_service = get_git_service(self.git_root)
 
         if diff and pr_diff:
             # TODO: Once broadcast queue's unread messages and/or config is moved to client,
@@ -44,7 +41,7 @@ class DiffContext:
             return
 
         name = ""
-        treeish_type = _get_treeish_type(self.git_root, target)
+        treeish_type = _get_treeish_type(self.git_service, target)
         if treeish_type is None:
             stream.send(f"Invalid treeish: {target}", style="failure")
             stream.send("Disabling diff and pr-diff.", style="warning")
@@ -57,7 +54,7 @@ class DiffContext:
 
         if pr_diff:
             name = f"Merge-base {name}"
-            target = _git_command(self.git_root, "merge-base", "HEAD", pr_diff)
+            target = self.git_service.get_merge_base("HEAD", pr_diff)
             if not target:
                 # TODO: Same as above todo
                 stream.send(
@@ -96,61 +93,96 @@ class DiffContext:
             self.refresh()
         return self._untracked_files  # pyright: ignore
 
-    def refresh(self):
+    def _refresh_without_diff(self) -> bool:
+        """Refreshes without asking git when there's nothing to diff, returning whether it did."""
         if not self.git_root:
+            return True
+        if self.target == "HEAD" and not self.git_service.head_exists():
+            self._set_diff_state(DiffState([], []))  # A new repo without any commits
+            return True
+        return False
+
+    def refresh(self):
+        if self._refresh_without_diff():
             return
         ctx = SESSION_CONTEXT.get()
+        self._set_diff_state(self.git_service.get_diff_state(self.target, untracked_paths=[ctx.cwd]))
 
-        if self.target == "HEAD" and not check_head_exists():
-            self._diff_files = []  # A new repo without any commits
-            self._untracked_files = []
-        else:
-            self._diff_files = [(ctx.cwd / f).resolve() for f in get_files_in_diff(self.target)]
-            self._untracked_files = [(ctx.cwd / f).resolve() for f in get_untracked_files(ctx.cwd)]
+    async def refresh_async(self):
+        """Like refresh, but runs git without blocking the event loop."""
+        if self._refresh_without_diff():
+            return
+        ctx = SESSION_CONTEXT.get()
+        self._set_diff_state(await self.git_service.get_diff_state_async(self.target, untracked_paths=[ctx.cwd]))
+
+    def _set_diff_state(self, diff_state: Optional[DiffState]):
+        if diff_state is None:
+            logging.error(f"Error obtaining diff for commit '{self.target}'.")
+            raise UserError()
+        self._diff_files = [f.resolve() for f in diff_state.diff_files]
+        self._untracked_files = [f.resolve() for f in diff_state.untracked_files]
 
-    def get_display_context(self) -> Optional[str]:
+    def git_state(self) -> Hashable:
+        """Changes whenever HEAD, the index or what the target points to does, without running git."""
+        if not self.git_root:
+            return None
+        targets = [part for part in self.target.split(" ") if part]
+        return (
+            self.git_service.get_state_key(),
+            tuple(git_object.hexsha if git_object else None for git_object in self.git_service.lookup(targets)),
+        )
+
+    def fingerprint(self) -> Hashable:
+        """
+        Changes whenever the diff's content might have: when HEAD, the index, the target or any diff file changes.
+        Call refresh first so the diff files are current.
+        """
         if not self.git_root:
             return None
-        diff_files = self.diff_files()
-        if not diff_files:
+        return (self.git_state(), tuple((path, get_stat_signature(path)) for path in self.diff_files()))
+
+    async def diff_stats(self) -> Dict[Path, Tuple[int, int]]:
+        """Returns the lines inserted and deleted in each diff file."""
+        if not self.git_root:
+            return {}
+        if self._diff_files is None:
+            await self.refresh_async()
+        if not self._diff_files:
+            return {}
+        return await self.git_service.get_diff_stats_async(self.target, self._diff_files) or {}
+
+    async def get_display_context(self) -> Optional[str]:
+        if not self.git_root:
+            return None
+        diff_stats = await self.diff_stats()
+        if not self._diff_files:
             return ""
-        num_files = len(diff_files)
-        num_lines = 0
-        for file in diff_files:
-            diff = get_diff_for_file(self.target, file)
-            diff_lines = diff.splitlines()
-            num_lines += len([line for line in diff_lines if line.startswith(("+ ", "- "))])
+        num_files = len(self._diff_files)
+        num_lines = sum(insertions + deletions for insertions, deletions in diff_stats.values())
         return f" {self.name} | {num_files} files | {num_lines} lines"
 
 
 TreeishType = Literal["commit", "branch", "relative", "compare"]
 
 
-def _git_command(git_root: Path, *args: str) -> str | None:
-    try:
-        return subprocess.check_output(["git"] + list(args), cwd=git_root, stderr=subprocess.PIPE, text=True).strip()
-    except subprocess.CalledProcessError:
-        return None
-
-
-def _get_treeish_type(git_root: Path, treeish: str) -> TreeishType | None:
+def _get_treeish_type(git_service: GitService, treeish: str) -> TreeishType | None:
     if " " in treeish:
         parts = treeish.split(" ")
-        types = [_get_treeish_type(git_root, part) for part in parts]
+        types = [_get_treeish_type(git_service, part) for part in parts]
         if not all(types):
             return None
         return "compare"
 
-    object_type = _git_command(git_root, "cat-file", "-t", treeish)
+    git_object = git_service.lookup([treeish])[0]
 
-    if not object_type:
+    if git_object is None:
         return None
 
-    if object_type == "commit":
+    if git_object.object_type == "commit":
         if "~" in treeish or "^" in treeish:
             return "relative"
 
-        if _git_command(git_root, "show-ref", "--heads", treeish):
+        if git_service.is_branch(treeish):
             return "branch"
         else:
             return "commit"
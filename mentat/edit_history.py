@@ -1,33 +1,206 @@
-from typing import List
+from __future__ import annotations
+
+import difflib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, List, Optional, Sequence
+
+import attr
 
 from mentat.errors import HistoryError
-from mentat.parsers.file_edit import FileEdit
+from mentat.parsers.file_edit import FileEdit, Replacement
 from mentat.session_context import SESSION_CONTEXT
+from mentat.utils import mentat_dir_path, sha256
+
+edit_history_dir_path = mentat_dir_path / "edit_history"
+# The number of undoable steps kept; older ones are forgotten
+EDIT_HISTORY_MAX_ENTRIES = 100
+# Characters of edits kept in memory; older entries are dropped and reread from the journal when they're needed
+EDIT_HISTORY_MEMORY_BUDGET = 16 * 1024 * 1024
+
+
+@attr.define(frozen=True)
+class Hunk:
+    """Replaces new_lines, which start at the 0-indexed line start of an edited file, with old_lines."""
+
+    start: int = attr.field()
+    new_lines: list[str] = attr.field()
+    old_lines: list[str] = attr.field()
+
+
+def make_reverse_patch(old_lines: Sequence[str], new_lines: Sequence[str]) -> list[Hunk]:
+    """Returns the hunks that turn new_lines back into old_lines. Only the lines that differ are kept."""
+    limit = min(len(old_lines), len(new_lines))
+    prefix = 0
+    while prefix < limit and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and old_lines[-1 - suffix] == new_lines[-1 - suffix]:
+        suffix += 1
+
+    old_middle = list(old_lines[prefix : len(old_lines) - suffix])
+    new_middle = list(new_lines[prefix : len(new_lines) - suffix])
+    matcher = difflib.SequenceMatcher(None, new_middle, old_middle)
+    return [
+        Hunk(prefix + i1, new_middle[i1:i2], old_middle[j1:j2])
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_reverse_patch(lines: Sequence[str], hunks: list[Hunk]) -> Optional[list[str]]:
+    """Returns the lines with the hunks reverted, or None if the lines the hunks replace aren't there anymore."""
+    reverted = list[str]()
+    position = 0
+    for hunk in hunks:
+        end = hunk.start + len(hunk.new_lines)
+        if hunk.start < position or lines[hunk.start : end] != hunk.new_lines:
+            return None
+        reverted.extend(lines[position : hunk.start])
+        reverted.extend(hunk.old_lines)
+        position = end
+    reverted.extend(lines[position:])
+    return reverted
+
+
+@attr.define
+class _HistoryEdit:
+    """A FileEdit without its previous_file_lines, which are recovered from a reverse patch when it's undone."""
+
+    file_edit: FileEdit = attr.field()
+    # None for creations and renames, which don't need the previous lines to be undone
+    reverse_patch: Optional[list[Hunk]] = attr.field(default=None)
+
+    @classmethod
+    def from_file_edit(cls, file_edit: FileEdit) -> _HistoryEdit:
+        ctx = SESSION_CONTEXT.get()
+
+        reverse_patch = None
+        previous_file_lines = file_edit.previous_file_lines
+        if file_edit.is_creation or previous_file_lines is None:
+            pass
+        elif file_edit.is_deletion:
+            reverse_patch = make_reverse_patch(previous_file_lines, [])
+        elif file_edit.replacements:
+            current_path = file_edit.rename_file_path or file_edit.file_path
+            current_lines = ctx.code_file_manager.file_lines.get(current_path)
+            if current_lines is not None:
+                reverse_patch = make_reverse_patch(previous_file_lines, current_lines)
+        return cls(attr.evolve(file_edit, previous_file_lines=None), reverse_patch)
+
+    def size(self) -> int:
+        lines = [line for replacement in self.file_edit.replacements for line in replacement.new_lines]
+        for hunk in self.reverse_patch or []:
+            lines += hunk.new_lines + hunk.old_lines
+        return sum(len(line) + 1 for line in lines)
+
+    def to_json(self) -> dict[str, Any]:
+        file_edit = self.file_edit
+        return {
+            "file_path": str(file_edit.file_path),
+            "rename_file_path": None if file_edit.rename_file_path is None else str(file_edit.rename_file_path),
+            "is_creation": file_edit.is_creation,
+            "is_deletion": file_edit.is_deletion,
+            "replacements": [[r.starting_line, r.ending_line, r.new_lines] for r in file_edit.replacements],
+            "reverse_patch": (
+                None
+                if self.reverse_patch is None
+                else [[hunk.start, hunk.new_lines, hunk.old_lines] for hunk in self.reverse_patch]
+            ),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> _HistoryEdit:
+        file_edit = FileEdit(
+            Path(data["file_path"]),
+            [Replacement(*replacement) for replacement in data["replacements"]],
+            is_creation=data["is_creation"],
+            is_deletion=data["is_deletion"],
+            rename_file_path=None if data["rename_file_path"] is None else Path(data["rename_file_path"]),
+        )
+        reverse_patch = None if data["reverse_patch"] is None else [Hunk(*hunk) for hunk in data["reverse_patch"]]
+        return cls(file_edit, reverse_patch)
+
+    def undo(self):
+        ctx = SESSION_CONTEXT.get()
+
+        file_edit = self.file_edit
+        current_path = file_edit.rename_file_path or file_edit.file_path
+        if self.reverse_patch is not None:
+            current_lines: Optional[Sequence[str]]
+            if file_edit.is_deletion:
+                current_lines = []
+            else:
+                # The file may have been renamed or deleted since; read_file doesn't need it to be in context
+                try:
+                    current_lines = ctx.code_file_manager.read_file(current_path)
+                except OSError:
+                    current_lines = None  # FileEdit.undo reports the missing file
+            if current_lines is not None:
+                file_edit.previous_file_lines = apply_reverse_patch(current_lines, self.reverse_patch)
+                if file_edit.previous_file_lines is None:
+                    raise HistoryError(f"File {current_path} changed since it was edited; unable to undo edit")
+        try:
+            file_edit.undo()
+        finally:
+            file_edit.previous_file_lines = None
+
+
+@attr.define
+class _HistoryEntry:
+    # None while the edits are only in the journal
+    edits: Optional[list[_HistoryEdit]] = attr.field()
+    size: int = attr.field()
+    journal_offset: Optional[int] = attr.field(default=None)
+
+
+def _edits_to_json(entry: _HistoryEntry) -> list[dict[str, Any]]:
+    return [edit.to_json() for edit in entry.edits or []]
 
 
 # TODO: Keep track of when we create directories so we can undo those as well
 class EditHistory:
+    """
+    Undo and redo stacks of edits. Each edit keeps a reverse patch instead of the whole file it was applied to, and
+    every change to the stacks is appended to a journal under ~/.mentat, so undo and redo work after a restart and old
+    entries can be dropped from memory.
+    """
+
     def __init__(self):
-        self.edits = list[list[FileEdit]]()
-        self.cur_edits = list[FileEdit]()
-        self.undone_edits = list[list[FileEdit]]()
+        self.edits = list[_HistoryEntry]()
+        self.cur_edits = list[_HistoryEdit]()
+        self.undone_edits = list[_HistoryEntry]()
+        self._journal_path: Optional[Path] = None
+        self._loaded = False
 
     def add_edit(self, file_edit: FileEdit):
-        self.cur_edits.append(file_edit)
+        self.cur_edits.append(_HistoryEdit.from_file_edit(file_edit))
 
     def push_edits(self):
         if self.cur_edits:
-            self.edits.append(self.cur_edits)
-            self.cur_edits = list[FileEdit]()
+            self._load()
+            entry = _HistoryEntry(self.cur_edits, sum(edit.size() for edit in self.cur_edits))
+            entry.journal_offset = self._append_to_journal({"type": "push", "edits": _edits_to_json(entry)})
+            self.edits.append(entry)
+            if len(self.edits) > EDIT_HISTORY_MAX_ENTRIES:
+                self.edits.pop(0)
+            self.cur_edits = list[_HistoryEdit]()
+            self._drop_from_memory()
 
     def undo(self) -> List[str]:
+        self._load()
         if not self.edits:
             return ["No edits available to undo"]
 
         # Make sure to go top down
-        cur_edit = self.edits.pop()
+        cur_edit = self._read_edits(self.edits.pop())
+        if cur_edit is None:
+            self._append_to_journal({"type": "undo"})
+            return ["Unable to read edits from the edit history journal"]
         errors = list[str]()
-        undone_edit = list[FileEdit]()
+        undone_edit = list[_HistoryEdit]()
         while cur_edit:
             cur_file_edit = cur_edit.pop()
             try:
@@ -36,24 +209,37 @@ class EditHistory:
             except HistoryError as e:
                 errors.append(str(e))
         if undone_edit:
-            self.undone_edits.append(undone_edit)
+            entry = _HistoryEntry(undone_edit, sum(edit.size() for edit in undone_edit))
+            entry.journal_offset = self._append_to_journal({"type": "undo", "edits": _edits_to_json(entry)})
+            self.undone_edits.append(entry)
+            self._drop_from_memory()
+        else:
+            self._append_to_journal({"type": "undo"})
         return errors
 
     async def redo(self) -> List[str]:
+        self._load()
         if not self.undone_edits:
             return ["No edits available to redo"]
 
         session_context = SESSION_CONTEXT.get()
         code_file_manager = session_context.code_file_manager
 
-        edits_to_redo = self.undone_edits.pop()
-        edits_to_redo.reverse()
-        for edit in edits_to_redo:
-            edit.display_full_edit(code_file_manager.file_lines[edit.file_path])
-        await code_file_manager.write_changes_to_files(edits_to_redo)
+        edits_to_redo = self._read_edits(self.undone_edits.pop())
+        self._append_to_journal({"type": "redo"})
+        if edits_to_redo is None:
+            return ["Unable to read edits from the edit history journal"]
+        file_edits = [edit.file_edit for edit in reversed(edits_to_redo)]
+        for edit in file_edits:
+            # The edits are redone on the current version of the file, which may not have been read this session
+            if not edit.is_creation and edit.file_path.exists():
+                code_file_manager.read_file(edit.file_path)
+            edit.display_full_edit(code_file_manager.file_lines.get(edit.file_path, []))
+        await code_file_manager.write_changes_to_files(file_edits)
         return []
 
     def undo_all(self) -> List[str]:
+        self._load()
         if not self.edits:
             return ["No edits available to undo"]
 
@@ -63,3 +249,96 @@ class EditHistory:
             if error:
                 errors += error
         return errors
+
+    def _load(self):
+        """Restores the stacks from the journal of the session's cwd, then rewrites it with only the live entries."""
+        if self._loaded:
+            return
+        self._loaded = True
+        ctx = SESSION_CONTEXT.get()
+        self._journal_path = edit_history_dir_path / f"{sha256(str(ctx.cwd))[:16]}.jsonl"
+        if not self._journal_path.exists():
+            return
+
+        edits = list[list[dict[str, Any]]]()
+        undone_edits = list[list[dict[str, Any]]]()
+        try:
+            with open(self._journal_path, "rb") as f:
+                for line in f:
+                    try:
+                        operation = json.loads(line)
+                    except ValueError:
+                        continue  # A write that was cut off
+                    if operation["type"] == "push":
+                        edits.append(operation["edits"])
+                        if len(edits) > EDIT_HISTORY_MAX_ENTRIES:
+                            edits.pop(0)
+                    elif operation["type"] == "undo" and edits:
+                        edits.pop()
+                        if "edits" in operation:
+                            undone_edits.append(operation["edits"])
+                    elif operation["type"] == "redo" and undone_edits:
+                        undone_edits.pop()
+        except OSError as e:
+            logging.warning(f"Unable to read edit history journal: {e}")
+            return
+
+        # Undone entries are written as a push followed by an undo, which leaves the undo stack as it was
+        operations = [{"type": "push", "edits": entry} for entry in edits]
+        for entry in undone_edits:
+            operations += [{"type": "push", "edits": entry}, {"type": "undo", "edits": entry}]
+        temp_path = self._journal_path.with_suffix(".tmp")
+        offsets = list[int]()
+        try:
+            with open(temp_path, "wb") as f:
+                for operation in operations:
+                    offsets.append(f.tell())
+                    f.write((json.dumps(operation) + "\n").encode("utf-8"))
+            os.replace(temp_path, self._journal_path)
+        except OSError as e:
+            logging.warning(f"Unable to write edit history journal: {e}")
+            self._journal_path = None
+            return
+
+        self.edits = [_HistoryEntry(None, 0, offset) for offset in offsets[: len(edits)]]
+        self.undone_edits = [_HistoryEntry(None, 0, offset) for offset in offsets[len(edits) + 1 :: 2]]
+
+    def _append_to_journal(self, operation: dict[str, Any]) -> Optional[int]:
+        """Appends an operation to the journal and returns its offset, or None if there is no journal."""
+        if self._journal_path is None:
+            return None
+        try:
+            self._journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self._journal_path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write((json.dumps(operation) + "\n").encode("utf-8"))
+            return offset
+        except OSError as e:
+            logging.warning(f"Unable to write edit history journal: {e}")
+            self._journal_path = None
+            return None
+
+    def _read_edits(self, entry: _HistoryEntry) -> Optional[list[_HistoryEdit]]:
+        if entry.edits is None:
+            if self._journal_path is None or entry.journal_offset is None:
+                return None
+            try:
+                with open(self._journal_path, "rb") as f:
+                    f.seek(entry.journal_offset)
+                    operation = json.loads(f.readline())
+            except (OSError, ValueError) as e:
+                logging.warning(f"Unable to read edit history journal: {e}")
+                return None
+            entry.edits = [_HistoryEdit.from_json(edit) for edit in operation["edits"]]
+        return entry.edits
+
+    def _drop_from_memory(self):
+        """Drops the oldest entries that are in the journal from memory until the rest fit in the memory budget."""
+        entries = [entry for entry in self.edits + self.undone_edits if entry.edits is not None]
+        size = sum(entry.size for entry in entries)
+        for entry in entries:
+            if size <= EDIT_HISTORY_MEMORY_BUDGET:
+                break
+            if entry.journal_offset is not None:
+                entry.edits = None
+                size -= entry.size
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any
+
+import attr
+
+from mentat.errors import MentatError
+from mentat.parsers.file_edit import FileEdit
+from mentat.session_context import SESSION_CONTEXT
+
+
+def get_file_edit_message(file_edit: FileEdit) -> dict[str, Any]:
+    """The edit as it's sent to clients, with the file's content once it's applied."""
+    ctx = SESSION_CONTEXT.get()
+
+    return {
+        "file_path": str(file_edit.file_path),
+        "new_file_path": (None if not file_edit.rename_file_path else str(file_edit.rename_file_path)),
+        "type": ("creation" if file_edit.is_creation else ("deletion" if file_edit.is_deletion else "edit")),
+        "new_content": "\n".join(
+            file_edit.get_updated_file_lines(ctx.code_file_manager.file_lines.get(file_edit.file_path, []))
+        ),
+    }
+
+
+@attr.define
+class _Preview:
+    file_edit: FileEdit = attr.field()
+    # The edit's replacements when it was previewed
+    replacements: list[tuple[int, int, list[str]]] = attr.field()
+    # A copy of the edit with its conflicts resolved
+    resolved: FileEdit = attr.field()
+    message: dict[str, Any] = attr.field()
+
+
+class EditPreview:
+    """
+    While a response streams, every FileEdit whose block is finished is checked, has its conflicts resolved and its
+    new content worked out on a background task, and the edits so far are sent on the model_file_edits_preview channel.
+    This happens on copies, since later blocks can still add to an edit; once the response ends, resolve_conflicts
+    takes the copy's results for every edit that hasn't changed since.
+    """
+
+    def __init__(self):
+        self._previews = dict[int, _Preview]()
+        # Edits that changed since they were last previewed, by id since FileEdits aren't hashable
+        self._pending = dict[int, FileEdit]()
+        self._task: asyncio.Task[None] | None = None
+
+    def file_edit_updated(self, file_edit: FileEdit):
+        self._pending[id(file_edit)] = file_edit
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._preview_pending())
+
+    async def _preview_pending(self):
+        ctx = SESSION_CONTEXT.get()
+
+        while self._pending:
+            # Let the parser get back to the response before (and between) previews
+            await asyncio.sleep(0)
+            file_edit = self._pending.pop(next(iter(self._pending)))
+            self._preview(file_edit)
+        ctx.stream.send(
+            [preview.message for preview in self._previews.values()],
+            channel="model_file_edits_preview",
+        )
+
+    def _preview(self, file_edit: FileEdit):
+        self._previews.pop(id(file_edit), None)
+        if not file_edit.is_valid(quiet=True):
+            return
+        replacements = file_edit.replacements_snapshot()
+        resolved = file_edit.copy()
+        resolved.resolve_conflicts()
+        try:
+            message = get_file_edit_message(resolved)
+        except MentatError:
+            return
+        self._previews[id(file_edit)] = _Preview(file_edit, replacements, resolved, message)
+
+    async def finish(self):
+        """Waits for the edits that are still being previewed."""
+        if self._task is not None:
+            await self._task
+
+    def resolve_conflicts(self, file_edit: FileEdit):
+        preview = self._previews.get(id(file_edit))
+        if (
+            preview is not None
+            and preview.file_edit is file_edit
+            and preview.replacements == file_edit.replacements_snapshot()
+        ):
+            file_edit.adopt_resolved(preview.resolved)
+        else:
+            file_edit.resolve_conflicts()
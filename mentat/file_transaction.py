@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from uuid import uuid4
+
+import attr
+
+# Threads used to write the new contents of files
+FILE_TRANSACTION_MAX_WORKERS = 16
+
+
+@attr.define
+class _Operation:
+    # The file being written, deleted or renamed; for creations, the new file
+    abs_path: Path = attr.field()
+    content: Optional[str] = attr.field(default=None)
+    new_abs_path: Optional[Path] = attr.field(default=None)
+    is_creation: bool = attr.field(default=False)
+    is_deletion: bool = attr.field(default=False)
+    # Where content is written before it's renamed over the target
+    temp_path: Optional[Path] = attr.field(default=None)
+
+    @property
+    def target(self) -> Path:
+        return self.new_abs_path or self.abs_path
+
+
+def _sibling_path(abs_path: Path, kind: str) -> Path:
+    # A hidden file next to the target, so renaming it over the target is atomic
+    return abs_path.parent / f".{abs_path.name}.{uuid4().hex[:8]}.mentat-{kind}"
+
+
+def _write_temp_file(operation: _Operation):
+    assert operation.temp_path is not None and operation.content is not None
+    with open(operation.temp_path, "w") as f:
+        f.write(operation.content)
+        f.flush()
+        os.fsync(f.fileno())
+    if not operation.is_creation:
+        # Keep the permissions (e.g. the executable bit) of the file being replaced
+        os.chmod(operation.temp_path, stat.S_IMODE(os.stat(operation.abs_path).st_mode))
+
+
+def _fsync_directory(directory: Path):
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Directories can't be opened on Windows
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _remove(abs_path: Path):
+    try:
+        os.unlink(abs_path)
+    except OSError:
+        pass
+
+
+class FileTransaction:
+    """
+    Applies writes, creations, deletions and renames of files all at once. New contents are written to temporary
+    files in parallel and then renamed over their targets, moving the originals aside; if anything fails, every file
+    is put back the way it was. Once all renames are done, each affected directory is fsynced once.
+    """
+
+    def __init__(self):
+        self._operations = list[_Operation]()
+
+    def write(self, abs_path: Path, content: str):
+        # Writing through a symlink replaces the file it points to, not the link
+        self._operations.append(_Operation(Path(os.path.realpath(abs_path)), content))
+
+    def create(self, abs_path: Path, content: str = ""):
+        self._operations.append(_Operation(abs_path, content, is_creation=True))
+
+    def delete(self, abs_path: Path):
+        self._operations.append(_Operation(abs_path, is_deletion=True))
+
+    def rename(self, abs_path: Path, new_abs_path: Path, content: Optional[str] = None):
+        """Renames a file, replacing its content if given."""
+        self._operations.append(_Operation(abs_path, content, new_abs_path=new_abs_path))
+
+    def commit(self):
+        """Applies every operation, or raises an OSError after undoing the ones that were applied."""
+        staged = [operation for operation in self._operations if operation.content is not None]
+        rollback = list[Callable[[], None]]()
+        backups = list[Path]()
+        try:
+            for operation in staged:
+                operation.target.parent.mkdir(parents=True, exist_ok=True)
+                operation.temp_path = _sibling_path(operation.target, "tmp")
+            if len(staged) > 1:
+                with ThreadPoolExecutor(max_workers=min(len(staged), FILE_TRANSACTION_MAX_WORKERS)) as executor:
+                    list(executor.map(_write_temp_file, staged))
+            elif staged:
+                _write_temp_file(staged[0])
+
+            for operation in self._operations:
+                self._apply(operation, rollback, backups)
+        except OSError:
+            for undo in reversed(rollback):
+                try:
+                    undo()
+                except OSError:
+                    pass
+            for operation in staged:
+                if operation.temp_path is not None:
+                    _remove(operation.temp_path)
+            raise
+
+        for backup in backups:
+            _remove(backup)
+        for directory in {
+            path.parent for operation in self._operations for path in (operation.abs_path, operation.target)
+        }:
+            _fsync_directory(directory)
+
+    def _apply(self, operation: _Operation, rollback: list[Callable[[], None]], backups: list[Path]):
+        abs_path, target = operation.abs_path, operation.target
+        if (operation.is_creation or target != abs_path) and os.path.lexists(target):
+            raise FileExistsError(f"File {target} already exists")
+
+        if operation.is_creation:
+            assert operation.temp_path is not None
+            os.replace(operation.temp_path, target)
+            rollback.append(lambda: _remove(target))
+            return
+        if operation.content is None and not operation.is_deletion:
+            # A rename that keeps the content
+            os.replace(abs_path, target)
+            rollback.append(lambda: os.replace(target, abs_path))
+            return
+
+        # The original is moved aside rather than overwritten so it can be put back
+        backup = _sibling_path(abs_path, "bak")
+        os.replace(abs_path, backup)
+        rollback.append(lambda: os.replace(backup, abs_path))
+        backups.append(backup)
+        if operation.is_deletion:
+            return
+        assert operation.temp_path is not None
+        os.replace(operation.temp_path, target)
+        rollback.append(lambda: _remove(target))
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Set
+
+from watchfiles import DefaultFilter, awatch
+
+
+class FileWatcher:
+    """
+    Watches a directory in the background and collects the paths that changed since the changes were last popped.
+    Used to skip work (like updating the ragdaemon graph) when nothing in the codebase has changed.
+    """
+
+    def __init__(self, root: Path, debounce: int = 100):
+        self.root = root
+        self.debounce = debounce
+        self.dirty_paths: Set[Path] = set()
+        # The watcher takes a moment to start; until it has we can't trust that nothing changed
+        self._ready = False
+        self._stop_event = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._ready = False
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop_event.set()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _watch(self):
+        try:
+            async for changes in awatch(
+                self.root,
+                watch_filter=DefaultFilter(),
+                debounce=self.debounce,
+                stop_event=self._stop_event,
+                rust_timeout=500,
+                yield_on_timeout=True,
+            ):
+                self._ready = True
+                self.dirty_paths.update(Path(path) for _, path in changes)
+        except Exception as e:
+            # If the watcher dies we fall back to treating everything as dirty
+            logging.error(f"File watcher for {self.root} stopped: {e}")
+
+    def has_changes(self) -> bool:
+        """Always true if the watcher isn't running yet, since we can't know what changed."""
+        return not self.running or not self._ready or bool(self.dirty_paths)
+
+    def pop_changes(self) -> Set[Path]:
+        changes = self.dirty_paths
+        self.dirty_paths = set()
+        return changes
@@ -1,34 +1,29 @@
-import hashlib
+import asyncio
 import logging
 import os
 import subprocess
 from pathlib import Path
 from typing import Optional, Set
 
-from git import Repo  # type: ignore
-
-from mentat.errors import UserError
+from mentat.errors import MentatError, UserError
+from mentat.git_service import GitService, get_git_service
+from mentat.hash_tree import HashTree, get_hash_tree
 from mentat.session_context import SESSION_CONTEXT
-from mentat.utils import is_file_text_encoded
 
 
 def get_untracked_files(root: Path, paths: list[Path] = []) -> list[str]:
-    """Returns untracked files. --directory flag is used to show only directories
-    and not files in the output. A significant performance improvement when things
-    like node_modules are present."""
-    command = [
-        "git",
-        "ls-files",
-        "--exclude-standard",
-        "--others",
-        "--directory",
-    ] + paths
-    result = subprocess.run(command, cwd=root, stdout=subprocess.PIPE)
-    untracked = result.stdout.decode("utf-8").strip()
-    if untracked != "":
-        return untracked.split("\n")
-    else:
+    """Returns untracked files, relative to root. Untracked directories are listed as a whole
+    rather than file by file; a significant performance improvement when things like
+    node_modules are present."""
+    git_root = get_git_root_for_path(root, raise_error=False)
+    if git_root is None:
+        return []
+    diff_state = get_git_service(git_root).get_diff_state(
+        None, include_untracked=True, untracked_paths=[root / path for path in paths] or [root]
+    )
+    if diff_state is None:
         return []
+    return [os.path.relpath(path, root) for path in diff_state.untracked_files]
 
 
 def get_non_gitignored_files(root: Path, visited: set[Path] = set()) -> Set[Path]:
@@ -65,11 +60,20 @@ def get_non_gitignored_files(root: Path, visited: set[Path] = set()) -> Set[Path
     return file_paths
 
 
-def get_git_root_for_path(path: Path, raise_error: bool = True) -> Optional[Path]:
-    if os.path.isdir(path):
-        dir_path = path
-    else:
-        dir_path = os.path.dirname(path)
+# Git roots keyed by the directory containing the `.git` found while walking up from a path.
+# Every directory below that one (without a `.git` of its own) shares its answer, so we only run git once per repo.
+_git_root_cache: dict[Path, Optional[Path]] = {}
+
+
+def _find_git_marker(dir_path: Path) -> Optional[Path]:
+    for directory in (dir_path, *dir_path.parents):
+        # .git is a directory in a regular repo and a file in worktrees and submodules
+        if os.path.lexists(directory / ".git"):
+            return directory
+    return None
+
+
+def _run_git_root_lookup(dir_path: Path) -> Optional[Path]:
     try:
         relative_path = (
             subprocess.check_output(
@@ -78,23 +82,94 @@ def get_git_root_for_path(path: Path, raise_error: bool = True) -> Optional[Path
                     "rev-parse",
                     "--show-prefix",
                 ],
-                cwd=os.path.realpath(dir_path),
+                cwd=dir_path,
                 stderr=subprocess.DEVNULL,
             )
             .decode("utf-8")
             .strip()
         )
-        # --show-toplevel doesn't work in some windows environment with posix paths,
-        # like msys2, so we have to use --show-prefix instead
-        git_root = os.path.abspath(os.path.join(dir_path, "../" * len(Path(relative_path).parts)))
-        # call realpath to resolve symlinks, so all paths match
-        return Path(os.path.realpath(git_root))
     except subprocess.CalledProcessError:
-        if raise_error:
-            logging.error(f"File {path} isn't part of a git project.")
-            raise UserError()
+        return None
+    # --show-toplevel doesn't work in some windows environment with posix paths,
+    # like msys2, so we have to use --show-prefix instead
+    git_root = os.path.abspath(os.path.join(dir_path, "../" * len(Path(relative_path).parts)))
+    # call realpath to resolve symlinks, so all paths match
+    return Path(os.path.realpath(git_root))
+
+
+def get_git_root_for_path(path: Path, raise_error: bool = True) -> Optional[Path]:
+    if os.path.isdir(path):
+        dir_path = path
+    else:
+        dir_path = os.path.dirname(path)
+    dir_path = Path(os.path.realpath(dir_path))
+
+    if "GIT_DIR" in os.environ:
+        # The repository isn't found by walking up from the path, so let git decide
+        git_root = _run_git_root_lookup(dir_path)
+    else:
+        git_marker = _find_git_marker(dir_path)
+        if git_marker is None:
+            git_root = None
         else:
-            return
+            if git_marker not in _git_root_cache:
+                _git_root_cache[git_marker] = _run_git_root_lookup(git_marker)
+            git_root = _git_root_cache[git_marker]
+
+    if git_root is None and raise_error:
+        logging.error(f"File {path} isn't part of a git project.")
+        raise UserError()
+    return git_root
+
+
+def clear_git_root_cache() -> None:
+    _git_root_cache.clear()
+
+
+def get_head_tree_hash(git_root: Path) -> Optional[str]:
+    """Returns the hash of the tree HEAD points to, or None if the repo has no commits yet."""
+    tree = get_git_service(git_root).lookup(["HEAD^{tree}"])[0]
+    return tree.hexsha if tree is not None else None
+
+
+def get_dirty_files(git_root: Path) -> list[Path]:
+    """Returns the files that differ from HEAD, including untracked files, relative to the git root."""
+    if get_head_tree_hash(git_root) is None:
+        tracked_command = ["git", "ls-files", "-c"]
+    else:
+        tracked_command = ["git", "diff", "--name-only", "HEAD", "--"]
+    output = ""
+    for command in [tracked_command, ["git", "ls-files", "-o", "--exclude-standard"]]:
+        output += subprocess.check_output(
+            command,
+            cwd=git_root,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        )
+    return [Path(path) for path in output.split("\n") if path]
+
+
+def resolve_treeish(git_root: Path, treeish: str) -> Optional[str]:
+    """Returns the commit hash a treeish currently points to, or None if it doesn't exist."""
+    commit = get_git_service(git_root).lookup([f"{treeish}^{{commit}}"])[0]
+    return commit.hexsha if commit is not None else None
+
+
+def get_files_changed_between(git_root: Path, old_treeish: str, new_treeish: str) -> Optional[list[Path]]:
+    """
+    Returns the files that differ between two treeishes, relative to the git root.
+    Returns None if either treeish no longer exists (e.g. it was garbage collected).
+    """
+    try:
+        output = subprocess.check_output(
+            ["git", "diff", "--name-only", old_treeish, new_treeish, "--"],
+            cwd=git_root,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        )
+    except subprocess.CalledProcessError:
+        return None
+    return [Path(path) for path in output.split("\n") if path]
 
 
 def get_shared_git_root_for_paths(paths: list[Path]) -> Path:
@@ -119,12 +194,20 @@ def get_shared_git_root_for_paths(paths: list[Path]) -> Path:
     return git_roots.pop()
 
 
-def commit(message: str) -> None:
+async def commit(message: str) -> None:
     """
     Commit all unstaged and staged changes
     """
-    subprocess.run(["git", "add", "."])
-    subprocess.run(["git", "commit", "-m", message])
+    ctx = SESSION_CONTEXT.get()
+    for args in [["git", "add", "."], ["git", "commit", "-m", message]]:
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+        )
+        output, _ = await process.communicate()
+        if process.returncode != 0:
+            # e.g. there is nothing to commit or a hook rejected the commit; git explains why on stdout or stderr
+            ctx.stream.send(output.decode("utf-8", errors="replace").strip(), style="error")
+            return
 
 
 def get_diff_for_file(target: str, path: Path) -> str:
@@ -147,56 +230,30 @@ def get_diff_for_file(target: str, path: Path) -> str:
 
 
 def get_treeish_metadata(git_root: Path, target: str) -> dict[str, str]:
-    try:
-        commit_info = subprocess.check_output(
-            ["git", "log", target, "-n", "1", "--pretty=format:%H %s"],
-            cwd=git_root,
-            text=True,
-            stderr=subprocess.DEVNULL,
-        ).strip()
-
-        # Split the returned string into the hash and summary
-        commit_hash, commit_summary = commit_info.split(" ", 1)
-        return {"hexsha": commit_hash, "summary": commit_summary}
-    except subprocess.CalledProcessError:
+    metadata = get_git_service(git_root).get_commit_metadata([target])[0]
+    if metadata is None:
         logging.error(f"Error obtaining commit data for target '{target}'.")
         raise UserError()
+    return metadata
 
 
 def get_files_in_diff(target: str) -> list[Path]:
-    """Return commit data & diff for target versus active code"""
+    """Return the files that differ between target and active code, relative to the git root"""
     session_context = SESSION_CONTEXT.get()
+    git_root = get_git_root_for_path(session_context.cwd)
+    assert git_root is not None
 
-    try:
-        args = target.split(" ") if target else []
-        diff_content = subprocess.check_output(
-            ["git", "diff", "--name-only", *args, "--"],
-            cwd=session_context.cwd,
-            text=True,
-            stderr=subprocess.DEVNULL,
-        ).strip()
-        if diff_content:
-            paths = [Path(path) for path in diff_content.split("\n") if path]
-            return paths
-        else:
-            return []
-    except subprocess.CalledProcessError:
+    diff_state = get_git_service(git_root).get_diff_state(target, include_untracked=False)
+    if diff_state is None:
         logging.error(f"Error obtaining diff for commit '{target}'.")
         raise UserError()
+    return [path.relative_to(git_root) for path in diff_state.diff_files]
 
 
 def check_head_exists() -> bool:
     session_context = SESSION_CONTEXT.get()
-
-    try:
-        subprocess.check_output(
-            ["git", "rev-parse", "HEAD", "--"],
-            cwd=session_context.cwd,
-            stderr=subprocess.DEVNULL,
-        )
-        return True
-    except subprocess.CalledProcessError:
-        return False
+    git_root = get_git_root_for_path(session_context.cwd, raise_error=False)
+    return git_root is not None and get_git_service(git_root).head_exists()
 
 
 def get_default_branch() -> str:
@@ -217,34 +274,53 @@ def get_default_branch() -> str:
 
 
 def get_git_diff(*args: str, cwd: Optional[Path] = None) -> str:
-    """A wrapper on git diff that always includes new/untracked files."""
+    """
+    A wrapper on git diff that always includes new/untracked files.
+    They are staged in a temporary index, so the user's staging area is left untouched.
+    """
+    git_service = _get_git_service_for_diff(cwd)
+    diff = git_service.get_full_diff(*args)
+    if diff is None:
+        raise MentatError(f"Error obtaining git diff for {' '.join(args)}.")
+    return diff  # Already ends with a newline, as required to form a valid .diff file
+
+
+async def get_git_diff_async(*args: str, cwd: Optional[Path] = None) -> str:
+    """Like get_git_diff, but runs git without blocking the event loop."""
+    git_service = _get_git_service_for_diff(cwd)
+    diff = await git_service.get_full_diff_async(*args)
+    if diff is None:
+        raise MentatError(f"Error obtaining git diff for {' '.join(args)}.")
+    return diff
+
+
+def _get_git_service_for_diff(cwd: Optional[Path]) -> GitService:
     if cwd is None:
         session_context = SESSION_CONTEXT.get()
         cwd = session_context.cwd
+    git_root = get_git_root_for_path(cwd, raise_error=False)
+    if git_root is None:
+        raise MentatError(f"{cwd} isn't part of a git project.")
+    return get_git_service(git_root)
 
-    repo = Repo(cwd)
-    # Stage untracked files so they are included in the diff
-    repo.git.add(all=True)
-    diff = repo.git.diff(*args, unified=1)
-    # Unstage changes again
-    repo.git.reset()
-    return diff + "\n" if diff else ""  # Required to form a valid .diff file
+
+def get_synced_hash_tree(root: Path) -> HashTree:
+    """Returns the hash tree for root, updated to track its non-gitignored files. Only changed files are read."""
+    hash_tree = get_hash_tree(root)
+    hash_tree.sync(root / file_path for file_path in get_non_gitignored_files(root))
+    return hash_tree
 
 
 def get_hexsha_active() -> str:
-    """Return the SHA-1 of the current commit."""
+    """Return a hash of the active code: every non-gitignored text file in the cwd."""
     session_context = SESSION_CONTEXT.get()
     cwd = session_context.cwd
 
-    hexsha = ""
-    all_files: set[Path] = get_non_gitignored_files(cwd)
-    if all_files:
-        hasher = hashlib.sha256()
-        for file_path in sorted(all_files):
-            if file_path.exists() and is_file_text_encoded(file_path):
-                hasher.update(file_path.read_bytes())
-        hexsha = hasher.hexdigest()
-    return hexsha
+    hash_tree = get_synced_hash_tree(cwd)
+    # Nothing to hash, e.g. a new repository; samples record this as ""
+    if hash_tree.is_empty():
+        return ""
+    return hash_tree.get_hash(cwd) or ""
 
 
 # The following utilities give git information for the Mentat project itself. They are
@@ -0,0 +1,506 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import weakref
+from pathlib import Path
+from typing import Any, Hashable, Optional, Sequence
+
+import attr
+
+from mentat.utils import StatSignature, get_stat_signature, run_subprocess_async
+
+
+@attr.define(frozen=True)
+class GitObject:
+    hexsha: str
+    object_type: str
+
+
+@attr.define
+class DiffState:
+    """Files that differ from a diff target and untracked files, as absolute paths."""
+
+    diff_files: list[Path]
+    untracked_files: list[Path]
+
+
+class _CatFileProcess:
+    """
+    A long-running `git cat-file --batch` or `--batch-check` process. Object names are written one per line
+    and answered in order, so any number of lookups cost a single fork for the lifetime of the process.
+    """
+
+    def __init__(self, git_root: Path, contents: bool):
+        self._git_root = git_root
+        self._contents = contents
+        self._process: Optional[subprocess.Popen[bytes]] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> subprocess.Popen[bytes]:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch" if self._contents else "--batch-check"],
+                cwd=self._git_root,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self._process
+
+    def query(self, names: Sequence[str]) -> list[Optional[tuple[GitObject, Optional[bytes]]]]:
+        """Returns each object and, for --batch, its contents; None if the name doesn't resolve."""
+        results: list[Optional[tuple[GitObject, Optional[bytes]]]] = [None] * len(names)
+        # cat-file reads one name per line, so names with newlines can't be asked about
+        indices = [i for i, name in enumerate(names) if name and "\n" not in name]
+        if not indices:
+            return results
+
+        with self._lock:
+            process = self._start()
+            assert process.stdin is not None and process.stdout is not None
+            try:
+                process.stdin.write("".join(names[i] + "\n" for i in indices).encode("utf-8"))
+                process.stdin.flush()
+                for i in indices:
+                    header = process.stdout.readline().decode("utf-8", errors="replace").split()
+                    if not header:
+                        raise EOFError()
+                    # Unknown names are answered with `<name> missing` or `<name> ambiguous`
+                    if len(header) < 3 or not header[-1].isdigit():
+                        continue
+                    hexsha, object_type, size = header[-3:]
+                    contents = None
+                    if self._contents:
+                        # The contents are followed by a newline
+                        contents = process.stdout.read(int(size) + 1)[:-1]
+                    results[i] = (GitObject(hexsha, object_type), contents)
+            except (OSError, ValueError, EOFError):
+                # The process is out of sync or died; the next query starts a fresh one
+                self.close()
+                return [None] * len(names)
+        return results
+
+    def close(self) -> None:
+        if self._process is not None:
+            if self._process.stdin is not None:
+                try:
+                    self._process.stdin.close()
+                except OSError:
+                    pass
+            try:
+                self._process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+            if self._process.stdout is not None:
+                self._process.stdout.close()
+            self._process = None
+
+
+class _TempIndex:
+    """
+    A private copy of a repository's index. Staging files in it lets us diff untracked files without touching the
+    user's staging area. The copy is kept between diffs and only replaced when the real index changes, so each
+    `git add` only rehashes the files that changed since the last diff.
+    """
+
+    def __init__(self):
+        self._directory: Optional[str] = None
+        self._source_signature: Optional[StatSignature] = None
+
+    def get_env(self, index_path: Optional[Path]) -> dict[str, str]:
+        """Returns an environment that points git at the copy, after syncing it with the real index if that changed."""
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix="mentat-index-")
+            self._source_signature = None
+        temp_index_path = os.path.join(self._directory, "index")
+
+        signature = get_stat_signature(index_path) if index_path is not None else None
+        if signature is None or signature != self._source_signature:
+            if index_path is not None and signature is not None:
+                shutil.copyfile(index_path, temp_index_path)
+            elif os.path.exists(temp_index_path):
+                # A repo without an index yet; git creates a fresh one
+                os.remove(temp_index_path)
+            self._source_signature = signature
+        return {**os.environ, "GIT_INDEX_FILE": temp_index_path}
+
+    def close(self) -> None:
+        if self._directory is not None:
+            shutil.rmtree(self._directory, ignore_errors=True)
+            self._directory = None
+
+
+def _close_resources(*resources: _CatFileProcess | _TempIndex) -> None:
+    for resource in resources:
+        resource.close()
+
+
+def _get_git_dir(git_root: Path) -> Optional[Path]:
+    if "GIT_DIR" in os.environ:
+        return Path(os.environ["GIT_DIR"])
+    dot_git = git_root / ".git"
+    if dot_git.is_dir():
+        return dot_git
+    # Worktrees and submodules have a .git file pointing at their git directory
+    try:
+        with open(dot_git, "r") as dot_git_file:
+            line = dot_git_file.readline().strip()
+    except OSError:
+        return None
+    if not line.startswith("gitdir:"):
+        return None
+    return git_root / line[len("gitdir:") :].strip()
+
+
+def _get_index_path(git_root: Path) -> Optional[Path]:
+    if "GIT_INDEX_FILE" in os.environ:
+        return Path(os.environ["GIT_INDEX_FILE"])
+    git_dir = _get_git_dir(git_root)
+    return git_dir / "index" if git_dir is not None else None
+
+
+def _parse_commit_summary(contents: bytes) -> str:
+    """Returns a commit's subject the way `git log --pretty=%s` does: its first paragraph on one line."""
+    message = contents.decode("utf-8", errors="replace").split("\n\n", 1)
+    if len(message) < 2:
+        return ""
+    subject = message[1].strip("\n").split("\n\n", 1)[0]
+    return " ".join(line.strip() for line in subject.split("\n"))
+
+
+class GitService:
+    """
+    Answers the git queries Mentat makes about one repository.
+    Object lookups go through persistent `git cat-file` processes instead of forking git for each query, and results
+    that only depend on HEAD and the index (commit metadata, merge bases) are cached until either changes.
+    Diff stats are also keyed on the stat signatures of the files they cover.
+    Queries that depend on the working tree still run git each time, but are batched into as few calls as possible
+    and have async variants so they don't block the session's event loop.
+    """
+
+    def __init__(self, git_root: Path):
+        self.git_root = git_root
+        self._real_git_root = Path(os.path.realpath(git_root))
+        self._batch_check = _CatFileProcess(git_root, contents=False)
+        self._batch = _CatFileProcess(git_root, contents=True)
+        self._index_path = _get_index_path(git_root)
+        git_dir = _get_git_dir(git_root)
+        self._info_attributes_path = git_dir / "info" / "attributes" if git_dir is not None else None
+        # Attribute states keyed by path and attributes, only trusted while the attribute files that apply stay the same
+        self._attributes_cache: dict[tuple[Path, tuple[str, ...]], tuple[Hashable, dict[str, str]]] = {}
+        self._cache_key: Optional[Hashable] = None
+        self._cache: dict[Hashable, Any] = {}
+        self._temp_index = _TempIndex()
+        # Concurrent diffs would fight over the temporary index's lock file
+        self._temp_index_lock = asyncio.Lock()
+        # A blocking diff can start while an async one is waiting on git, so blocking diffs get an index of their own
+        self._sync_temp_index = _TempIndex()
+        self._sync_temp_index_lock = threading.Lock()
+        # Don't leave git processes or temporary files behind if the service is dropped without being closed
+        self._finalizer = weakref.finalize(
+            self,
+            _close_resources,
+            self._batch_check,
+            self._batch,
+            self._temp_index,
+            self._sync_temp_index,
+        )
+
+    def close(self) -> None:
+        # Resources are recreated if the service is used again, so this doesn't detach the finalizer
+        _close_resources(self._batch_check, self._batch, self._temp_index, self._sync_temp_index)
+
+    def _run(self, *args: str, env: Optional[dict[str, str]] = None, input: Optional[bytes] = None) -> Optional[str]:
+        try:
+            # Decoded by hand rather than with text=True, which would rewrite the \r\n line endings in diffs
+            return subprocess.check_output(
+                ["git", *args],
+                cwd=self.git_root,
+                env=env,
+                input=input,
+                stderr=subprocess.DEVNULL,
+            ).decode("utf-8")
+        except (subprocess.CalledProcessError, OSError, UnicodeDecodeError):
+            return None
+
+    async def _run_async(self, *args: str, env: Optional[dict[str, str]] = None) -> Optional[str]:
+        try:
+            return await run_subprocess_async("git", *args, cwd=self.git_root, env=env, strip=False)
+        except Exception:
+            # run_subprocess_async raises a plain Exception when git fails
+            return None
+
+    def _run_all(self, commands: list[list[str]]) -> list[Optional[str]]:
+        """Runs git commands concurrently, so their startup costs overlap."""
+        processes = [
+            subprocess.Popen(
+                ["git", *args],
+                cwd=self.git_root,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+            for args in commands
+        ]
+        outputs = list[Optional[str]]()
+        for process in processes:
+            stdout, _ = process.communicate()
+            outputs.append(stdout.decode("utf-8") if process.returncode == 0 else None)
+        return outputs
+
+    def get_state_key(self) -> Hashable:
+        """Changes whenever HEAD or the index does."""
+        head = self.lookup(["HEAD"])[0]
+        index_signature = get_stat_signature(self._index_path) if self._index_path is not None else None
+        return (head.hexsha if head is not None else None, index_signature)
+
+    def _get_cache(self) -> dict[Hashable, Any]:
+        cache_key = self.get_state_key()
+        if cache_key != self._cache_key:
+            self._cache_key = cache_key
+            self._cache = {}
+        return self._cache
+
+    def lookup(self, names: Sequence[str]) -> list[Optional[GitObject]]:
+        """Resolves any number of revisions (e.g. `HEAD~2`, `main^{tree}`) with a single round trip."""
+        return [result[0] if result is not None else None for result in self._batch_check.query(names)]
+
+    def head_exists(self) -> bool:
+        return self.lookup(["HEAD"])[0] is not None
+
+    def is_branch(self, name: str) -> bool:
+        return self.lookup([f"refs/heads/{name}"])[0] is not None
+
+    def get_commit_metadata(self, treeishes: Sequence[str]) -> list[Optional[dict[str, str]]]:
+        """Returns the hash and summary of the commit each treeish points to, or None if it doesn't exist."""
+        cache = self._get_cache()
+        missing = [treeish for treeish in dict.fromkeys(treeishes) if ("metadata", treeish) not in cache]
+        if missing:
+            results = self._batch.query([f"{treeish}^{{commit}}" for treeish in missing])
+            for treeish, result in zip(missing, results):
+                metadata = None
+                if result is not None and result[1] is not None:
+                    metadata = {"hexsha": result[0].hexsha, "summary": _parse_commit_summary(result[1])}
+                cache[("metadata", treeish)] = metadata
+        return [cache[("metadata", treeish)] for treeish in treeishes]
+
+    def get_merge_base(self, first: str, second: str) -> Optional[str]:
+        cache = self._get_cache()
+        if ("merge-base", first, second) not in cache:
+            output = self._run("merge-base", first, second)
+            cache[("merge-base", first, second)] = output.strip() if output else None
+        return cache[("merge-base", first, second)]
+
+    def _diff_state_commands(
+        self, target: Optional[str], include_untracked: bool, untracked_paths: Sequence[Path]
+    ) -> list[list[str]]:
+        commands = list[list[str]]()
+        if target is not None:
+            commands.append(["diff", "--name-only", *(target.split(" ") if target else []), "--"])
+        if include_untracked:
+            # --directory lists untracked directories instead of every file in them,
+            # which is much faster when things like node_modules are present
+            commands.append(
+                [
+                    "ls-files",
+                    "--exclude-standard",
+                    "--others",
+                    "--directory",
+                    "--",
+                    *(str(path) for path in untracked_paths),
+                ]
+            )
+        return commands
+
+    def _parse_diff_state(
+        self, target: Optional[str], include_untracked: bool, outputs: Sequence[Optional[str]]
+    ) -> Optional[DiffState]:
+        paths = list[list[Path]]()
+        for output in outputs:
+            if output is None:
+                return None
+            paths.append([self.git_root / path for path in output.split("\n") if path])
+        return DiffState(
+            diff_files=paths[0] if target is not None else [],
+            untracked_files=paths[-1] if include_untracked else [],
+        )
+
+    def get_diff_state(
+        self,
+        target: Optional[str],
+        include_untracked: bool = True,
+        untracked_paths: Sequence[Path] = (),
+    ) -> Optional[DiffState]:
+        """
+        Returns the files that differ between the target and the working tree, and the untracked files
+        (directories are listed as a whole) under untracked_paths, running both git commands at once.
+        A target of None skips the diff, and an empty target diffs against the index.
+        Returns None if git fails, e.g. because the target doesn't exist.
+        """
+        commands = self._diff_state_commands(target, include_untracked, untracked_paths)
+        return self._parse_diff_state(target, include_untracked, self._run_all(commands))
+
+    async def get_diff_state_async(
+        self,
+        target: Optional[str],
+        include_untracked: bool = True,
+        untracked_paths: Sequence[Path] = (),
+    ) -> Optional[DiffState]:
+        """Like get_diff_state, but runs git without blocking the event loop."""
+        commands = self._diff_state_commands(target, include_untracked, untracked_paths)
+        outputs = await asyncio.gather(*(self._run_async(*command) for command in commands))
+        return self._parse_diff_state(target, include_untracked, outputs)
+
+    def _diff_stats_key(self, target: str, paths: Sequence[Path]) -> Hashable:
+        return ("numstat", target, tuple((path, get_stat_signature(path)) for path in paths))
+
+    def _diff_stats_command(self, target: str, paths: Sequence[Path]) -> list[str]:
+        return [
+            "diff",
+            "--numstat",
+            "--no-renames",
+            "-z",
+            *(target.split(" ") if target else []),
+            "--",
+            *(str(path) for path in paths),
+        ]
+
+    def _parse_diff_stats(self, output: str) -> dict[Path, tuple[int, int]]:
+        stats = dict[Path, tuple[int, int]]()
+        for entry in output.split("\0"):
+            # Each entry is `<insertions>\t<deletions>\t<path>`; binary files show - for both counts
+            parts = entry.split("\t", 2)
+            if len(parts) != 3:
+                continue
+            insertions, deletions, path = parts
+            stats[self.git_root / path] = (
+                int(insertions) if insertions.isdigit() else 0,
+                int(deletions) if deletions.isdigit() else 0,
+            )
+        return stats
+
+    async def get_diff_stats_async(self, target: str, paths: Sequence[Path]) -> Optional[dict[Path, tuple[int, int]]]:
+        """
+        Returns the lines inserted and deleted in each path between the target and the working tree, from a single
+        `git diff --numstat` call. Binary files count as 0 lines. Returns None if git fails.
+        Results are cached until HEAD, the index or any of the paths' stat signatures change.
+        """
+        cache = self._get_cache()
+        cache_key = self._diff_stats_key(target, paths)
+        if cache_key not in cache:
+            output = await self._run_async(*self._diff_stats_command(target, paths))
+            if output is None:
+                return None
+            cache[cache_key] = self._parse_diff_stats(output)
+        return cache[cache_key]
+
+    def get_attributes(self, paths: Sequence[Path], attributes: Sequence[str]) -> Optional[list[dict[str, str]]]:
+        """
+        Returns the state of each attribute for each path: "set", "unset", "unspecified" or the attribute's value.
+        The paths that aren't cached are answered by a single `git check-attr` call, which reads the same attribute
+        files and macros git itself does. Answers are cached until a .gitattributes file above the path or the
+        repository's info/attributes changes. Returns None if git fails, e.g. because a path is outside the repository.
+        """
+        if not paths or not attributes:
+            return [{} for _ in paths]
+        attributes = tuple(attributes)
+        # Keyed before running git, so an attribute file that changes while git runs invalidates the answer
+        keys = {path: self._get_attributes_key(path) for path in paths}
+        missing = list[Path]()
+        for path, key in keys.items():
+            cached = self._attributes_cache.get((path, attributes))
+            if cached is None or cached[0] != key:
+                missing.append(path)
+
+        if missing:
+            pathspecs = "".join(f"{path}\0" for path in missing).encode("utf-8")
+            output = self._run("check-attr", "--stdin", "-z", *attributes, input=pathspecs)
+            if output is None:
+                return None
+            # Each answer is `<path>\0<attribute>\0<state>\0`, in the order the paths and attributes were given
+            fields = output.split("\0")[:-1]
+            if len(fields) != 3 * len(missing) * len(attributes):
+                return None
+            for path, i in zip(missing, range(0, len(fields), 3 * len(attributes))):
+                answers = fields[i : i + 3 * len(attributes)]
+                states = {answers[j + 1]: answers[j + 2] for j in range(0, len(answers), 3)}
+                self._attributes_cache[(path, attributes)] = (keys[path], states)
+
+        return [self._attributes_cache[(path, attributes)][1] for path in paths]
+
+    def _get_attributes_key(self, path: Path) -> Hashable:
+        # The attribute files git reads for a path: info/attributes and the .gitattributes of every directory above it
+        attribute_files = [self._info_attributes_path] if self._info_attributes_path is not None else []
+        for directory in path.parents:
+            attribute_files.append(directory / ".gitattributes")
+            if directory == self.git_root or directory == self._real_git_root:
+                break
+        return tuple(get_stat_signature(attribute_file) for attribute_file in attribute_files)
+
+    def get_full_diff(self, *args: str) -> Optional[str]:
+        """
+        Returns `git diff --unified=1` for the given arguments with untracked files included, by staging everything
+        in a temporary index. The user's own index is never modified. Returns None if git fails.
+        """
+        with self._sync_temp_index_lock:
+            env = self._sync_temp_index.get_env(self._index_path)
+            if self._run("add", "--all", env=env) is None:
+                return None
+            return self._run("diff", "--unified=1", *args, env=env)
+
+    async def get_full_diff_async(self, *args: str) -> Optional[str]:
+        """Like get_full_diff, but runs git without blocking the event loop."""
+        async with self._temp_index_lock:
+            env = self._temp_index.get_env(self._index_path)
+            if await self._run_async("add", "--all", env=env) is None:
+                return None
+            return await self._run_async("diff", "--unified=1", *args, env=env)
+
+    def create_snapshot_commit(self, paths: Sequence[Path], message: str) -> Optional[str]:
+        """
+        Commits the working tree on top of HEAD using only plumbing and a temporary index, so the working tree,
+        the user's index, the current branch and the stash are never touched. Tracked files are committed as they
+        are on disk, along with the given paths (e.g. untracked files). No ref points at the commit.
+        Returns the commit's hash, or None if git fails.
+        """
+        # Each snapshot stages its own paths, so every call gets a fresh copy of the index; this also lets snapshots
+        # run concurrently without sharing the copy's lock file
+        snapshot_index = _TempIndex()
+        try:
+            env = snapshot_index.get_env(self._index_path)
+            if self._run("add", "--update", env=env) is None:
+                return None
+            if paths:
+                pathspecs = "".join(f"{path}\0" for path in paths).encode("utf-8")
+                if self._run("add", "--pathspec-from-file=-", "--pathspec-file-nul", env=env, input=pathspecs) is None:
+                    return None
+            tree = self._run("write-tree", env=env)
+            if tree is None:
+                return None
+        finally:
+            snapshot_index.close()
+        head = self.lookup(["HEAD"])[0]
+        parents = ["-p", head.hexsha] if head is not None else []
+        commit = self._run("commit-tree", tree.strip(), *parents, "-m", message)
+        return commit.strip() if commit else None
+
+
+_git_services: dict[Path, GitService] = {}
+
+
+def get_git_service(git_root: Path) -> GitService:
+    """Returns the service for a repository, shared by everything that asks about it."""
+    if git_root not in _git_services:
+        _git_services[git_root] = GitService(git_root)
+    return _git_services[git_root]
+
+
+def close_git_services() -> None:
+    for git_service in _git_services.values():
+        git_service.close()
+    _git_services.clear()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+from json import JSONDecodeError
+from pathlib import Path
+from typing import Iterable, Optional
+
+import attr
+
+from mentat.git_handler import get_dirty_files, get_files_changed_between, get_head_tree_hash
+from mentat.utils import get_stat_signature, sha256
+
+
+def get_graph_path(graphs_dir: Path, cwd: Path) -> Path:
+    """
+    Graphs are keyed by the absolute path of the directory they were built for,
+    so two checkouts with the same directory name don't overwrite each other's graph.
+    """
+    cwd = cwd.resolve()
+    return graphs_dir / f"ragdaemon-{cwd.name}-{sha256(cwd.as_posix())[:12]}.json"
+
+
+def get_snapshot_path(graph_path: Path) -> Path:
+    return graph_path.with_suffix(".snapshot.json")
+
+
+# Some filesystems only store modification times to the second (or two), so a file modified just after a graph was
+# built can look like it was modified just before
+MTIME_MARGIN_NS = 2_000_000_000
+
+
+def _get_signature(path: Path) -> Optional[list[int]]:
+    # Kept as a list, since that's what it's compared against once loaded from JSON
+    signature = get_stat_signature(path)
+    return list(signature) if signature is not None else None
+
+
+def _modified_before(signature: Optional[list[int]], time_ns: int) -> bool:
+    # Signatures end with the modification time
+    return signature is not None and signature[-1] + MTIME_MARGIN_NS < time_ns
+
+
+@attr.define
+class GraphSnapshot:
+    """
+    The state of a git repository when its ragdaemon graph was last saved: the tree HEAD pointed to,
+    the stat signatures of all files that differed from it, and the settings the graph was built with.
+    Comparing two snapshots tells us which files changed between sessions without reading the whole repo.
+    """
+
+    tree_hash: Optional[str]
+    dirty_files: dict[str, Optional[list[int]]]
+    settings: str
+
+    @classmethod
+    def take(cls, git_root: Path, settings: str) -> GraphSnapshot:
+        dirty_files = {path.as_posix(): _get_signature(git_root / path) for path in get_dirty_files(git_root)}
+        return cls(get_head_tree_hash(git_root), dirty_files, settings)
+
+    def matches_graph(
+        self, tree_hash: Optional[str], built_at_ns: int, graph_files: Iterable[Path], git_root: Path
+    ) -> bool:
+        """
+        Whether a graph built at built_at_ns, when HEAD pointed to tree_hash, still matches the repository this
+        snapshot was taken of: HEAD hasn't moved, and no file in the graph or differing from HEAD was created,
+        modified or deleted since the graph was built.
+        """
+        if tree_hash != self.tree_hash:
+            return False
+        return all(_modified_before(signature, built_at_ns) for signature in self.dirty_files.values()) and all(
+            _modified_before(_get_signature(path), built_at_ns) for path in graph_files
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> Optional[GraphSnapshot]:
+        try:
+            with open(path) as snapshot_file:
+                data = json.load(snapshot_file)
+            return cls(data["tree_hash"], data["dirty_files"], data["settings"])
+        except (OSError, JSONDecodeError, KeyError, TypeError):
+            return None
+
+    def save(self, path: Path):
+        try:
+            with open(path, "w") as snapshot_file:
+                json.dump(attr.asdict(self), snapshot_file)
+        except OSError as e:
+            logging.debug(f"Unable to save graph snapshot to {path}: {e}")
+
+    def changed_files(self, current: GraphSnapshot, git_root: Path) -> Optional[set[Path]]:
+        """
+        Returns the files, relative to the git root, that changed between this snapshot and the current one.
+        Returns None if the delta can't be determined and everything should be treated as changed.
+        """
+        if self.settings != current.settings:
+            return None
+
+        changed = set[Path]()
+        if self.tree_hash != current.tree_hash:
+            if self.tree_hash is None or current.tree_hash is None:
+                return None
+            committed = get_files_changed_between(git_root, self.tree_hash, current.tree_hash)
+            if committed is None:
+                return None
+            changed.update(committed)
+
+        for path in self.dirty_files.keys() | current.dirty_files.keys():
+            if self.dirty_files.get(path, None) != current.dirty_files.get(path, None) or (
+                # A file that was dirty and is now clean still differs from the saved graph
+                (path in self.dirty_files) != (path in current.dirty_files)
+            ):
+                changed.add(Path(os.path.normpath(path)))
+        return changed
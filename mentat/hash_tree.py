@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+from mentat.utils import StatSignature, are_files_text_encoded, get_stat_signature
+
+_ROOT = Path(".")
+
+
+class HashTree:
+    """
+    A Merkle tree of the text files under a root directory. File hashes are cached by stat signature and
+    directory hashes are rolled up from their children's, so once the tree is built only files that changed are
+    read again and only their ancestors are rehashed. Binary files are tracked but left out of directory hashes.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._files: dict[Path, tuple[StatSignature, Optional[str]]] = {}
+        self._children: dict[Path, set[str]] = {}
+        # Only directories with no changes below them since they were last hashed
+        self._dir_hashes: dict[Path, str] = {}
+
+    def _relative(self, abs_path: Path) -> Optional[Path]:
+        try:
+            return abs_path.relative_to(self.root)
+        except ValueError:
+            return None
+
+    def _invalidate(self, rel_path: Path) -> None:
+        for parent in rel_path.parents:
+            self._dir_hashes.pop(parent, None)
+
+    def _add(self, rel_path: Path) -> None:
+        for path in (rel_path, *rel_path.parents[:-1]):
+            children = self._children.setdefault(path.parent, set())
+            if path.name in children:
+                break
+            children.add(path.name)
+
+    def _remove(self, rel_path: Path) -> None:
+        del self._files[rel_path]
+        self._invalidate(rel_path)
+        for path in (rel_path, *rel_path.parents[:-1]):
+            children = self._children[path.parent]
+            children.discard(path.name)
+            if children or path.parent == _ROOT:
+                break
+            del self._children[path.parent]
+
+    def update(self, abs_paths: Iterable[Path], force: bool = False) -> None:
+        """
+        Rehashes the given files if their stat signatures changed, adding new files and dropping deleted ones.
+        With force, they are rehashed regardless; edits call this since a write can keep the same signature.
+        """
+        changed = list[tuple[Path, Path, StatSignature]]()
+        for abs_path in abs_paths:
+            rel_path = self._relative(abs_path)
+            if rel_path is None or rel_path == _ROOT:
+                continue
+            signature = get_stat_signature(abs_path)
+            if signature is None or not os.path.isfile(abs_path):
+                if rel_path in self._files:
+                    self._remove(rel_path)
+                continue
+
+            cached = self._files.get(rel_path)
+            if cached is not None and cached[0] == signature and not force:
+                continue
+            changed.append((abs_path, rel_path, signature))
+
+        # Only the changed files are checked, all at once
+        text_encoded = are_files_text_encoded([abs_path for abs_path, _, _ in changed])
+        for (abs_path, rel_path, signature), is_text in zip(changed, text_encoded):
+            file_hash = None
+            if is_text:
+                with open(abs_path, "rb") as f:
+                    file_hash = hashlib.sha256(f.read()).hexdigest()
+            if rel_path not in self._files:
+                self._add(rel_path)
+            self._files[rel_path] = (signature, file_hash)
+            self._invalidate(rel_path)
+
+    def sync(self, abs_paths: Iterable[Path]) -> None:
+        """Makes the tree track exactly the given files, only reading the ones that changed."""
+        abs_paths = list(abs_paths)
+        tracked = {rel_path for rel_path in map(self._relative, abs_paths) if rel_path is not None}
+        for rel_path in [rel_path for rel_path in self._files if rel_path not in tracked]:
+            self._remove(rel_path)
+        self.update(abs_paths)
+
+    def _get_dir_hash(self, rel_path: Path) -> str:
+        if rel_path not in self._dir_hashes:
+            hasher = hashlib.sha256()
+            for name in sorted(self._children.get(rel_path, ())):
+                child_hash = self._get_hash(rel_path / name)
+                if child_hash is not None:
+                    hasher.update(f"{name}\0{child_hash}\0".encode("utf-8"))
+            self._dir_hashes[rel_path] = hasher.hexdigest()
+        return self._dir_hashes[rel_path]
+
+    def _get_hash(self, rel_path: Path) -> Optional[str]:
+        if rel_path in self._files:
+            return self._files[rel_path][1]
+        if rel_path == _ROOT or rel_path in self._children:
+            return self._get_dir_hash(rel_path)
+        return None
+
+    def is_empty(self) -> bool:
+        """Whether the tree tracks no files, text or binary."""
+        return not self._files
+
+    def get_hash(self, abs_path: Path) -> Optional[str]:
+        """Returns the hash of a tracked text file or directory, or None if it isn't in the tree."""
+        rel_path = self._relative(abs_path)
+        if rel_path is None:
+            return None
+        return self._get_hash(rel_path)
+
+
+_hash_trees: dict[Path, HashTree] = {}
+
+
+def get_hash_tree(root: Path) -> HashTree:
+    if root not in _hash_trees:
+        _hash_trees[root] = HashTree(root)
+    return _hash_trees[root]
+
+
+def update_hash_trees(abs_paths: Iterable[Path]) -> None:
+    """Tells every hash tree that files were written, created, deleted or renamed."""
+    abs_paths = list(abs_paths)
+    for hash_tree in _hash_trees.values():
+        hash_tree.update(abs_paths, force=True)
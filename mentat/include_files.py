@@ -10,7 +10,7 @@ from mentat.code_feature import CodeFeature
 from mentat.errors import PathValidationError
 from mentat.git_handler import get_git_root_for_path, get_non_gitignored_files
 from mentat.interval import parse_intervals, split_intervals_from_path
-from mentat.utils import is_file_text_encoded
+from mentat.utils import are_files_text_encoded, is_file_text_encoded
 
 
 class PathType(Enum):
@@ -191,7 +191,9 @@ def get_paths_for_directory(
     for root, dirs, files in os.walk(path, topdown=True):
         root = Path(root)
 
-        if get_git_root_for_path(root, raise_error=False):
+        # We only descend into directories that aren't part of a git repo, so below the top directory
+        # a directory can only be in a repo if it has its own .git; this saves running git for every directory.
+        if (root == path or ".git" in dirs or ".git" in files) and get_git_root_for_path(root, raise_error=False):
             dirs[:] = list[str]()
             git_non_gitignored_paths = get_non_gitignored_files(root)
             for git_path in git_non_gitignored_paths:
@@ -225,7 +227,8 @@ def get_paths_for_directory(
 
             if not recursive:
                 break
-    paths = set(p.resolve() for p in paths if is_file_text_encoded(p))
+    path_list = list(paths)
+    paths = set(p.resolve() for p, text_encoded in zip(path_list, are_files_text_encoded(path_list)) if text_encoded)
 
     return paths
 
@@ -2,7 +2,9 @@ from __future__ import annotations
 
 import math
 import re
+from bisect import bisect_left, bisect_right
 from pathlib import Path
+from typing import Iterable, Iterator
 
 import attr
 
@@ -77,3 +79,124 @@ class Interval:
 
         start, end = interval_parts
         return Interval(int(start), int(end))
+
+
+class IntervalSet:
+    """
+    A sorted set of disjoint intervals. Overlapping intervals are merged as they're added, so membership
+    and coverage queries are a binary search instead of a scan over every interval.
+    If merge_adjacent is False, intervals that only touch (like 1-10 and 10-20) are kept separate,
+    but still count as continuous for coverage queries.
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = (), merge_adjacent: bool = True):
+        self.merge_adjacent = merge_adjacent
+        self._starts = list[int | float]()
+        self._ends = list[int | float]()
+        for interval in sorted(intervals):
+            if interval.end <= interval.start:
+                continue
+            if self._ends and (
+                interval.start < self._ends[-1] or (merge_adjacent and interval.start == self._ends[-1])
+            ):
+                self._ends[-1] = max(self._ends[-1], interval.end)
+            else:
+                self._starts.append(interval.start)
+                self._ends.append(interval.end)
+
+    @property
+    def intervals(self) -> list[Interval]:
+        return [Interval(start, end) for start, end in zip(self._starts, self._ends)]
+
+    def __iter__(self) -> Iterator[Interval]:
+        return iter(self.intervals)
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __bool__(self) -> bool:
+        return bool(self._starts)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IntervalSet):
+            return NotImplemented
+        return self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self) -> str:
+        return f"IntervalSet({self.intervals})"
+
+    def copy(self) -> IntervalSet:
+        interval_set = IntervalSet(merge_adjacent=self.merge_adjacent)
+        interval_set._starts = self._starts.copy()
+        interval_set._ends = self._ends.copy()
+        return interval_set
+
+    def add(self, interval: Interval) -> None:
+        if interval.end <= interval.start:
+            return
+        # Every interval in [lo, hi) overlaps (or touches) the new interval and gets merged into it
+        if self.merge_adjacent:
+            lo = bisect_left(self._ends, interval.start)
+            hi = bisect_right(self._starts, interval.end)
+        else:
+            lo = bisect_right(self._ends, interval.start)
+            hi = bisect_left(self._starts, interval.end)
+        start, end = interval.start, interval.end
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def remove(self, interval: Interval) -> None:
+        if interval.end <= interval.start:
+            return
+        lo = bisect_right(self._ends, interval.start)
+        hi = bisect_left(self._starts, interval.end)
+        if lo >= hi:
+            return
+        starts = list[int | float]()
+        ends = list[int | float]()
+        if self._starts[lo] < interval.start:
+            starts.append(self._starts[lo])
+            ends.append(interval.start)
+        if self._ends[hi - 1] > interval.end:
+            starts.append(interval.end)
+            ends.append(self._ends[hi - 1])
+        self._starts[lo:hi] = starts
+        self._ends[lo:hi] = ends
+
+    def union(self, other: Iterable[Interval]) -> IntervalSet:
+        interval_set = self.copy()
+        for interval in other:
+            interval_set.add(interval)
+        return interval_set
+
+    def difference(self, other: Iterable[Interval]) -> IntervalSet:
+        interval_set = self.copy()
+        for interval in other:
+            interval_set.remove(interval)
+        return interval_set
+
+    def contains(self, line_number: int) -> bool:
+        i = bisect_right(self._starts, line_number) - 1
+        return i >= 0 and line_number < self._ends[i]
+
+    def covers(self, interval: Interval) -> bool:
+        """Whether every line in the interval is in the set. Empty intervals are always covered."""
+        if interval.end <= interval.start:
+            return True
+        i = bisect_right(self._starts, interval.start) - 1
+        if i < 0 or self._ends[i] <= interval.start:
+            return False
+        while self._ends[i] < interval.end:
+            if i + 1 >= len(self._starts) or self._starts[i + 1] != self._ends[i]:
+                return False
+            i += 1
+        return True
+
+    def intersects(self, interval: Interval) -> bool:
+        if interval.end <= interval.start:
+            return False
+        i = bisect_right(self._ends, interval.start)
+        return i < len(self._starts) and self._starts[i] < interval.end
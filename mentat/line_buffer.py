@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from array import array
+from typing import Any, Iterator, Optional, Sequence, overload
+
+
+class LineBuffer(Sequence[str]):
+    """
+    The lines of a file, stored as the file's text and an array of where each line starts rather than a string per
+    line; the array is only built once a line is accessed. Behaves like the list `text.split("\\n")` would, except
+    that it's immutable: slices are views sharing the text, and copy() returns a list for callers that edit the lines.
+    """
+
+    __slots__ = ("_text", "_starts", "_num_lines", "_start", "_stop")
+
+    def __init__(self, text: str):
+        self._text = text
+        # The offset each line starts at, followed by len(text) + 1 so every line ends one before the next one's start
+        self._starts: Optional[array[int]] = None
+        self._num_lines = text.count("\n") + 1
+        self._start = 0
+        self._stop = self._num_lines
+
+    def _get_starts(self) -> array[int]:
+        if self._starts is None:
+            starts = array("I" if len(self._text) < 2**32 - 1 else "Q", [0])
+            find = self._text.find
+            position = find("\n")
+            while position != -1:
+                starts.append(position + 1)
+                position = find("\n", position + 1)
+            starts.append(len(self._text) + 1)
+            self._starts = starts
+        return self._starts
+
+    def __len__(self) -> int:
+        return self._stop - self._start
+
+    def _line(self, index: int) -> str:
+        starts = self._get_starts()
+        return self._text[starts[index] : starts[index + 1] - 1]
+
+    @overload
+    def __getitem__(self, index: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> LineBuffer:
+        ...
+
+    def __getitem__(self, index: int | slice) -> str | LineBuffer:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                raise ValueError("LineBuffer slices can't have a step")
+            view = LineBuffer.__new__(LineBuffer)
+            view._text = self._text
+            view._starts = self._get_starts()
+            view._num_lines = self._num_lines
+            view._start = self._start + start
+            view._stop = self._start + max(start, stop)
+            return view
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("LineBuffer index out of range")
+        return self._line(self._start + index)
+
+    def __iter__(self) -> Iterator[str]:
+        for index in range(self._start, self._stop):
+            yield self._line(index)
+
+    @property
+    def text(self) -> str:
+        """The lines joined by newlines."""
+        if self._start == 0 and self._stop == self._num_lines:
+            return self._text
+        if self._start == self._stop:
+            return ""
+        starts = self._get_starts()
+        return self._text[starts[self._start] : starts[self._stop] - 1]
+
+    def copy(self) -> list[str]:
+        return [] if self._start == self._stop else self.text.split("\n")
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LineBuffer):
+            return len(self) == len(other) and self.text == other.text
+        if isinstance(other, (list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))  # pyright: ignore
+        return NotImplemented
+
+    __hash__ = None  # pyright: ignore
+
+    def __repr__(self) -> str:
+        return f"LineBuffer({self.copy()!r})"
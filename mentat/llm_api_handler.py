@@ -1,13 +1,16 @@
 from __future__ import annotations
 
+import json
 import logging
 import os
 import sys
+from collections import OrderedDict
 from inspect import iscoroutinefunction
 from pathlib import Path
 from typing import (
     Any,
     Callable,
+    Collection,
     List,
     Literal,
     Optional,
@@ -26,7 +29,7 @@ from spice.spice import UnknownModelError, get_model_from_name, get_provider_fro
 
 from mentat.errors import MentatError, ReturnToUser
 from mentat.session_context import SESSION_CONTEXT
-from mentat.utils import mentat_dir_path
+from mentat.utils import mentat_dir_path, sha256
 
 TOKEN_COUNT_WARNING = 32000
 
@@ -144,11 +147,59 @@ def raise_if_context_exceeds_max(tokens: int):
         raise ReturnToUser()
 
 
+class TokenCounter:
+    """
+    Caches the token count of each message, keyed by its content and the model, so that counting a prompt
+    only tokenizes messages that are new or have changed since the last count.
+    """
+
+    def __init__(self, spice: Spice, max_entries: int = 1024):
+        self.spice = spice
+        self.max_entries = max_entries
+        self._message_tokens = OrderedDict[tuple[str, str, Optional[str]], int]()
+        self._prompt_overhead = dict[tuple[str, Optional[str]], int]()
+
+    def _message_hash(self, message: SpiceMessage) -> str:
+        # Only string and list fields are tokenized; other fields (like parsed_llm_response) are metadata
+        fields: dict[str, Any] = {key: value for key, value in message.items() if isinstance(value, (str, list))}
+        return sha256(json.dumps(fields, sort_keys=True))
+
+    def _get_prompt_overhead(self, model: str, provider: Optional[str]) -> int:
+        """The tokens a prompt costs regardless of its messages (i.e. priming the reply)"""
+        if (model, provider) not in self._prompt_overhead:
+            self._prompt_overhead[(model, provider)] = self.spice.count_prompt_tokens([], model, provider)
+        return self._prompt_overhead[(model, provider)]
+
+    def count_message_tokens(self, message: SpiceMessage, model: str, provider: Optional[str]) -> int:
+        key = (self._message_hash(message), model, provider)
+        if key in self._message_tokens:
+            self._message_tokens.move_to_end(key)
+            return self._message_tokens[key]
+
+        tokens = self.spice.count_prompt_tokens([message], model, provider) - self._get_prompt_overhead(model, provider)
+        self._message_tokens[key] = tokens
+        if len(self._message_tokens) > self.max_entries:
+            self._message_tokens.popitem(last=False)
+        return tokens
+
+    def count_prompt_tokens(self, messages: Collection[SpiceMessage], model: str, provider: Optional[str]) -> int:
+        return self._get_prompt_overhead(model, provider) + sum(
+            self.count_message_tokens(message, model, provider) for message in messages
+        )
+
+
 class LlmApiHandler:
     """Used for any functions that require calling the external LLM API"""
 
     def __init__(self):
         self.spice = Spice()
+        self.token_counter = TokenCounter(self.spice)
+
+    def count_prompt_tokens(
+        self, messages: Collection[SpiceMessage], model: str, provider: Optional[str] = None
+    ) -> int:
+        """Counts the tokens in a prompt, only tokenizing messages that haven't been counted before"""
+        return self.token_counter.count_prompt_tokens(messages, model, provider)
 
     async def initialize_client(self):
         ctx = SESSION_CONTEXT.get()
@@ -249,7 +300,7 @@ class LlmApiHandler:
         config = session_context.config
 
         # Confirm that model has enough tokens remaining
-        tokens = self.spice.count_prompt_tokens(messages, model, provider)
+        tokens = self.count_prompt_tokens(messages, model, provider)
         raise_if_context_exceeds_max(tokens)
 
         with sentry_sdk.start_span(description="LLM Call") as span:
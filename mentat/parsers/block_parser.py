@@ -93,9 +93,9 @@ class BlockParser(Parser):
         code_file_manager: CodeFileManager,
         cwd: Path,
         rename_map: dict[Path, Path],
-        special_block: str,
+        special_lines: list[str],
     ) -> tuple[DisplayInformation, FileEdit, bool]:
-        block = special_block.strip().split("\n")
+        block = special_lines
         json_lines = block[1:-1]
         try:
             json_data: dict[str, Any] = json.loads("\n".join(json_lines))
@@ -176,8 +176,7 @@ class BlockParser(Parser):
         self,
         code_file_manager: CodeFileManager,
         rename_map: dict[Path, Path],
-        special_block: str,
-        code_block: str,
+        code_lines: list[str],
         display_information: DisplayInformation,
         file_edit: FileEdit,
     ):
@@ -185,7 +184,7 @@ class BlockParser(Parser):
             Replacement(
                 display_information.first_changed_line,
                 display_information.last_changed_line,
-                code_block.split("\n")[:-2],
+                code_lines[:-1],
             )
         )
 
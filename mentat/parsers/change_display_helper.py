@@ -1,6 +1,8 @@
+from collections import OrderedDict
 from enum import Enum
+from functools import cached_property
 from pathlib import Path
-from typing import List, Tuple, cast
+from typing import Any, List, Sequence, Tuple, cast
 
 import attr
 from pygments import lex
@@ -13,19 +15,25 @@ from mentat.parsers.streaming_printer import FormattedString
 from mentat.session_context import SESSION_CONTEXT
 from mentat.utils import get_relative_path
 
+# Lexers are looked up by file name rather than extension, since pygments matches some full names (like Makefile)
+_lexer_cache = dict[str, Lexer]()
+
 
 def get_lexer(file_path: Path):
-    try:
-        lexer: Lexer = get_lexer_for_filename(file_path)
-    except ClassNotFound:
-        lexer = TextLexer()
-    lexer.stripnl = False
-    lexer.stripall = False
-    lexer.ensurenl = False
+    lexer = _lexer_cache.get(file_path.name)
+    if lexer is None:
+        try:
+            lexer = get_lexer_for_filename(file_path)
+        except ClassNotFound:
+            lexer = TextLexer()
+        lexer.stripnl = False
+        lexer.stripall = False
+        lexer.ensurenl = False
+        _lexer_cache[file_path.name] = lexer
     return lexer
 
 
-def get_line_number_buffer(file_lines: list[str]):
+def get_line_number_buffer(file_lines: Sequence[str]):
     return 1
 
 
@@ -51,9 +59,9 @@ def get_file_action_type(is_creation: bool, is_deletion: bool, new_name: Path |
 @attr.define(slots=False)
 class DisplayInformation:
     file_name: Path = attr.field()
-    file_lines: list[str] = attr.field()
-    added_block: list[str] = attr.field()
-    removed_block: list[str] = attr.field()
+    file_lines: Sequence[str] = attr.field()
+    added_block: Sequence[str] = attr.field()
+    removed_block: Sequence[str] = attr.field()
     file_action_type: FileActionType = attr.field()
     first_changed_line: int = attr.field(default=0)
     last_changed_line: int = attr.field(default=0)
@@ -63,13 +71,17 @@ class DisplayInformation:
         ctx = SESSION_CONTEXT.get()
 
         self.line_number_buffer = get_line_number_buffer(self.file_lines)
-        self.lexer = get_lexer(self.file_name)
 
         if self.file_name.is_absolute():
             self.file_name = get_relative_path(self.file_name, ctx.cwd)
         if self.new_name is not None and self.new_name.is_absolute():
             self.new_name = get_relative_path(self.new_name, ctx.cwd)
 
+    @cached_property
+    def lexer(self) -> Lexer:
+        # Only looked up once something is highlighted, so parsing without printing never needs it
+        return get_lexer(self.file_name)
+
 
 def _remove_empty_lines(lines: list[str]) -> list[str]:
     if not lines:
@@ -93,12 +105,12 @@ def _remove_empty_lines(lines: list[str]) -> list[str]:
     return lines[start : end + 1]
 
 
-def _prefixed_lines(line_number_buffer: int, lines: list[str], prefix: str) -> str:
+def _prefixed_lines(line_number_buffer: int, lines: Sequence[str], prefix: str) -> str:
     return "\n".join([prefix + " " * (line_number_buffer - len(prefix)) + line.strip("\n") for line in lines])
 
 
 def _get_code_block(
-    code_lines: list[str],
+    code_lines: Sequence[str],
     line_number_buffer: int,
     prefix: str,
     color: str | None,
@@ -212,12 +224,17 @@ def get_removed_lines(
     )
 
 
-def highlight_text(text: str, lexer: Lexer) -> FormattedString:
-    formatter = TerminalFormatter(bg="dark")  # type: ignore
-    string: FormattedString = []
-    for ttype, value in lex(text, lexer):
-        # We use TerminalFormatter's color scheme; TODO: Hook this up to our style themes instead
-        color = cast(str, formatter._get_color(ttype))  # type: ignore
+# The most recently highlighted texts and their lexers, with the token runs they were split into
+HIGHLIGHT_CACHE_SIZE = 1024
+_highlight_cache = OrderedDict[tuple[Lexer, str], list[tuple[str, str | None]]]()
+_token_colors = dict[Any, str | None]()
+# We use TerminalFormatter's color scheme; TODO: Hook this up to our style themes instead
+_formatter = TerminalFormatter(bg="dark")  # type: ignore
+
+
+def _token_color(ttype: Any) -> str | None:
+    if ttype not in _token_colors:
+        color = cast(str, _formatter._get_color(ttype))  # type: ignore
 
         # Convert Pygment styles to Rich styles
         if color.startswith("*"):
@@ -229,11 +246,22 @@ def highlight_text(text: str, lexer: Lexer) -> FormattedString:
         if color.startswith("bright"):
             color = color.replace("bright", "bright_")
 
-        if not color:
-            color = None
+        _token_colors[ttype] = color or None
+    return _token_colors[ttype]
+
 
-        string.append((value, {"color": color}))
-    return string
+def highlight_text(text: str, lexer: Lexer) -> FormattedString:
+    key = (lexer, text)
+    runs = _highlight_cache.get(key)
+    if runs is None:
+        runs = [(value, _token_color(ttype)) for ttype, value in lex(text, lexer)]
+        _highlight_cache[key] = runs
+        if len(_highlight_cache) > HIGHLIGHT_CACHE_SIZE:
+            _highlight_cache.popitem(last=False)
+    else:
+        _highlight_cache.move_to_end(key)
+    # Styles are modified by the printer, so every caller gets its own
+    return [(value, {"color": color}) for value, color in runs]
 
 
 def get_previous_lines(
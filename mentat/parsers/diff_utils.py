@@ -1,28 +1,81 @@
-def matching_index(orig_lines: list[str], new_lines: list[str]) -> int:
-    orig_lines = orig_lines.copy()
-    new_lines = new_lines.copy()
-    index = _exact_match(orig_lines, new_lines)
-    if index == -1:
-        orig_lines = [s.lower() for s in orig_lines]
-        new_lines = [s.lower() for s in new_lines]
-        index = _exact_match(orig_lines, new_lines)
-        if index == -1:
-            orig_lines = [s.strip() for s in orig_lines]
-            new_lines = [s.strip() for s in new_lines]
-            index = _exact_match(orig_lines, new_lines)
-            if index == -1:
-                new_orig_lines = [s for s in orig_lines if s]
-                new_new_lines = [s for s in new_lines if s]
-                index = _exact_match(new_orig_lines, new_new_lines)
-                if new_orig_lines and index != -1:
-                    index = orig_lines.index(new_orig_lines[index])
+from __future__ import annotations
+
+from typing import Callable, Sequence
+
+# Each pass normalizes the lines further than the one before it
+_NORMALIZATIONS: list[Callable[[str], str]] = [
+    lambda line: line,
+    lambda line: line.lower(),
+    lambda line: line.strip(),
+]
+
+
+def _build_index(lines: list[str]) -> dict[str, list[int]]:
+    index = dict[str, list[int]]()
+    for i, line in enumerate(lines):
+        index.setdefault(line, []).append(i)
     return index
 
 
-def _exact_match(orig_lines: list[str], new_lines: list[str]) -> int:
-    if "".join(new_lines).strip() == "" and "".join(orig_lines).strip() == "":
+def _find(lines: list[str], index: dict[str, list[int]], needle: list[str]) -> int:
+    if not needle:
         return 0
-    for i in range(len(orig_lines) - (len(new_lines) - 1)):
-        if orig_lines[i : i + len(new_lines)] == new_lines:
-            return i
+    if len(needle) > len(lines):
+        return -1
+    # Only positions of the needle's rarest line can start a match
+    anchor = min(range(len(needle)), key=lambda j: len(index.get(needle[j], ())))
+    for position in index.get(needle[anchor], ()):
+        start = position - anchor
+        if 0 <= start <= len(lines) - len(needle) and lines[start : start + len(needle)] == needle:
+            return start
     return -1
+
+
+class HunkLocator:
+    """
+    Finds where hunks match the lines of a file, trying exact, lowercased, stripped and blank-line-free comparisons
+    in that order. The normalized lines and an index of where each line occurs are built once per comparison, the
+    first time a hunk needs it, so every hunk matched against the same file version shares them.
+    """
+
+    def __init__(self, orig_lines: Sequence[str]):
+        self.orig_lines = orig_lines
+        self._is_blank = not "".join(orig_lines).strip()
+        self._levels = list[tuple[list[str], dict[str, list[int]]]]()
+        # Stripped lines without the blank ones, with their indices in orig_lines
+        self._nonblank: tuple[list[str], dict[str, list[int]], list[int]] | None = None
+
+    def _level(self, level: int) -> tuple[list[str], dict[str, list[int]]]:
+        while len(self._levels) <= level:
+            normalize = _NORMALIZATIONS[len(self._levels)]
+            previous = self._levels[-1][0] if self._levels else self.orig_lines
+            lines = [normalize(line) for line in previous]
+            self._levels.append((lines, _build_index(lines)))
+        return self._levels[level]
+
+    def find(self, new_lines: Sequence[str]) -> int:
+        """Returns the index in orig_lines where new_lines start, or -1 if they can't be found."""
+        if self._is_blank and not "".join(new_lines).strip():
+            return 0
+
+        needle = list(new_lines)
+        for level, normalize in enumerate(_NORMALIZATIONS):
+            needle = [normalize(line) for line in needle]
+            index = _find(*self._level(level), needle)
+            if index != -1:
+                return index
+
+        if self._nonblank is None:
+            stripped_lines = self._level(len(_NORMALIZATIONS) - 1)[0]
+            positions = [i for i, line in enumerate(stripped_lines) if line]
+            lines = [stripped_lines[i] for i in positions]
+            self._nonblank = (lines, _build_index(lines), positions)
+        lines, line_index, positions = self._nonblank
+        if not lines:
+            return -1
+        index = _find(lines, line_index, [line for line in needle if line])
+        return -1 if index == -1 else positions[index]
+
+
+def matching_index(orig_lines: Sequence[str], new_lines: Sequence[str]) -> int:
+    return HunkLocator(orig_lines).find(new_lines)
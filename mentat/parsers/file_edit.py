@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Any
+from typing import Any, Sequence
 
 import attr
 
 from mentat.errors import HistoryError, MentatError
+from mentat.interval import Interval
 from mentat.parsers.change_display_helper import (
     DisplayInformation,
     FileActionType,
@@ -62,7 +63,12 @@ class FileEdit:
     rename_file_path: Path | None = attr.field(default=None)
 
     # Used for undo
-    previous_file_lines: list[str] | None = attr.field(default=None)
+    previous_file_lines: Sequence[str] | None = attr.field(default=None)
+
+    # The lines get_updated_file_lines last applied the replacements to, what they were, and the result
+    _updated_file_lines: tuple[Sequence[str], list[tuple[int, int, list[str]]], list[str]] | None = attr.field(
+        default=None, init=False, eq=False, repr=False
+    )
 
     @file_path.validator  # pyright: ignore
     def is_abs_path(self, attribute: attr.Attribute[Path], value: Any):
@@ -78,7 +84,7 @@ class FileEdit:
         display_information = DisplayInformation(self.file_path, [], added_lines, [], FileActionType.CreateFile)
         display_full_change(display_information, prefix=prefix)
 
-    def _display_deletion(self, file_lines: list[str], prefix: str = ""):
+    def _display_deletion(self, file_lines: Sequence[str], prefix: str = ""):
         display_information = DisplayInformation(
             self.file_path,
             [],
@@ -99,7 +105,7 @@ class FileEdit:
         )
         display_full_change(display_information, prefix=prefix)
 
-    def _display_replacement(self, replacement: Replacement, file_lines: list[str], prefix: str = ""):
+    def _display_replacement(self, replacement: Replacement, file_lines: Sequence[str], prefix: str = ""):
         removed_block = file_lines[replacement.starting_line : replacement.ending_line]
         display_information = DisplayInformation(
             self.file_path,
@@ -113,11 +119,11 @@ class FileEdit:
         )
         display_full_change(display_information, prefix=prefix)
 
-    def _display_replacements(self, file_lines: list[str], prefix: str = ""):
+    def _display_replacements(self, file_lines: Sequence[str], prefix: str = ""):
         for replacement in self.replacements:
             self._display_replacement(replacement, file_lines, prefix=prefix)
 
-    def display_full_edit(self, file_lines: list[str], prefix: str = ""):
+    def display_full_edit(self, file_lines: Sequence[str], prefix: str = ""):
         """Displays the full edit as if it were altering a file with the lines given"""
         if self.is_deletion:
             self._display_deletion(file_lines, prefix=prefix)
@@ -128,7 +134,11 @@ class FileEdit:
         else:
             self._display_replacements(file_lines, prefix=prefix)
 
-    def is_valid(self) -> bool:
+    def is_valid(self, quiet: bool = False) -> bool:
+        """
+        Checks that the edit can be applied, warning about the problems that cancel it (or its rename).
+        When quiet, nothing is sent and the edit isn't changed, so it can be checked before the response ends.
+        """
         session_context = SESSION_CONTEXT.get()
         stream = session_context.stream
         code_context = session_context.code_context
@@ -137,30 +147,34 @@ class FileEdit:
 
         if self.is_creation:
             if self.file_path.exists():
-                stream.send(
-                    f"File {display_path} already exists, canceling creation.",
-                    style="warning",
-                )
+                if not quiet:
+                    stream.send(
+                        f"File {display_path} already exists, canceling creation.",
+                        style="warning",
+                    )
                 return False
         else:
             if not self.file_path.exists():
-                stream.send(
-                    f"File {display_path} does not exist, canceling all edits to file.",
-                    style="warning",
-                )
+                if not quiet:
+                    stream.send(
+                        f"File {display_path} does not exist, canceling all edits to file.",
+                        style="warning",
+                    )
                 return False
-            file_features_in_context = code_context.include_files.get(self.file_path, [])
-            if not file_features_in_context or not all(
-                any(f.interval.contains(i) for f in file_features_in_context)
-                for r in self.replacements
-                for i in range(r.starting_line + 1, r.ending_line + 1)
+            intervals_in_context = code_context.get_included_intervals(self.file_path)
+            if not intervals_in_context or not all(
+                intervals_in_context.covers(Interval(r.starting_line + 1, r.ending_line + 1)) for r in self.replacements
             ):
-                stream.send(
-                    f"File {display_path} not in context, canceling all edits to file.",
-                    style="warning",
-                )
+                if not quiet:
+                    stream.send(
+                        f"File {display_path} not in context, canceling all edits to file.",
+                        style="warning",
+                    )
                 return False
 
+        if quiet:
+            return True
+
         if self.rename_file_path is not None and self.rename_file_path.exists():
             rel_rename_path = None
             if self.rename_file_path.is_relative_to(session_context.cwd):
@@ -183,9 +197,9 @@ class FileEdit:
             self._display_creation()
             if not await _ask_user_change("Create this file?"):
                 return False
-            file_lines = []
+            file_lines: Sequence[str] = []
         else:
-            file_lines = code_file_manager.file_lines[self.file_path].copy()
+            file_lines = code_file_manager.file_lines[self.file_path]
 
         if self.is_deletion:
             self._display_deletion(file_lines)
@@ -223,20 +237,59 @@ class FileEdit:
                     # Insertion conflict (nothing to do)
                     pass
 
-    def get_updated_file_lines(self, file_lines: list[str]):
+    def replacements_snapshot(self) -> list[tuple[int, int, list[str]]]:
+        """The replacements as they are now, to tell later whether they've changed."""
+        return [
+            (replacement.starting_line, replacement.ending_line, list(replacement.new_lines))
+            for replacement in self.replacements
+        ]
+
+    def copy(self) -> FileEdit:
+        """A copy whose replacements can be changed without changing this edit's."""
+        return attr.evolve(self, replacements=[attr.evolve(replacement) for replacement in self.replacements])
+
+    def adopt_resolved(self, resolved: FileEdit):
+        """
+        Takes the replacements of a copy of this edit that already had its conflicts resolved,
+        along with the updated lines it worked out, instead of resolving them again.
+        """
+        self.replacements = resolved.replacements
+        self._updated_file_lines = resolved._updated_file_lines
+
+    def get_updated_file_lines(self, file_lines: Sequence[str]) -> list[str]:
+        """
+        Returns the file's lines with the replacements applied. The given lines aren't modified; the result is
+        remembered for the same lines and replacements, so callers shouldn't modify it either.
+        """
         self.replacements.sort(reverse=True)
+        replacements = self.replacements_snapshot()
+        if (
+            self._updated_file_lines is not None
+            and self._updated_file_lines[0] is file_lines
+            and self._updated_file_lines[1] == replacements
+        ):
+            return self._updated_file_lines[2]
+
         earliest_line = None
-        for replacement in self.replacements:
-            if earliest_line is not None and replacement.ending_line > earliest_line:
+        for starting_line, ending_line, _ in replacements:
+            if earliest_line is not None and ending_line > earliest_line:
                 # This should never happen if resolve conflicts is called
                 raise MentatError("Error: Line overlap in Replacements")
-            if replacement.ending_line > len(file_lines):
-                file_lines += [""] * (replacement.ending_line - len(file_lines))
-            earliest_line = replacement.starting_line
-            file_lines = (
-                file_lines[: replacement.starting_line] + replacement.new_lines + file_lines[replacement.ending_line :]
-            )
-        return file_lines
+            earliest_line = starting_line
+
+        # Replacements are sorted last to first, so unchanged lines are copied once going backwards through them
+        updated_lines = list[str]()
+        cur_line = 0
+        for starting_line, ending_line, new_lines in reversed(replacements):
+            updated_lines.extend(file_lines[cur_line:starting_line])
+            if starting_line > len(file_lines):
+                updated_lines.extend([""] * (starting_line - max(cur_line, len(file_lines))))
+            updated_lines.extend(new_lines)
+            cur_line = ending_line
+        updated_lines.extend(file_lines[cur_line:])
+
+        self._updated_file_lines = (file_lines, replacements, updated_lines)
+        return updated_lines
 
     def undo(self):
         ctx = SESSION_CONTEXT.get()
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any
+
+_structural = re.compile(r'[\[\]{}",:]')
+_string_end = re.compile(r'["\\]')
+
+
+class JsonItemStream:
+    """
+    Scans JSON as it streams in and decodes each item of the root object's array under items_key as soon as the
+    item is complete, without waiting for the rest of the document. Every character is only scanned once.
+    This doesn't check that the JSON is valid; the whole document still has to be parsed once it's complete.
+    """
+
+    def __init__(self, items_key: str = "content"):
+        self.items_key = items_key
+        # The open objects ({) and arrays ([)
+        self._stack = list[str]()
+        self._in_string = False
+        self._escaped = False
+        # The root object is expecting a key rather than a value
+        self._expecting_key = False
+        self._key_parts: list[str] | None = None
+        self._key: str | None = None
+        # Depth of the items array once it's open
+        self._items_depth: int | None = None
+        self._item_parts: list[str] | None = None
+
+    def feed(self, text: str) -> list[Any]:
+        """Scans the next part of the JSON and returns the items completed in it."""
+        items = list[Any]()
+        item_start = 0
+        pos = 0
+        while pos < len(text):
+            if self._in_string:
+                pos = self._scan_string(text, pos)
+                continue
+
+            match = _structural.search(text, pos)
+            if match is None:
+                break
+            char = match.group()
+            pos = match.end()
+            depth = len(self._stack)
+            if char == '"':
+                self._in_string = True
+                if depth == 1 and self._expecting_key:
+                    self._key_parts = []
+            elif char in "{[":
+                if char == "{" and self._items_depth is not None and depth == self._items_depth:
+                    self._item_parts = []
+                    item_start = pos - 1
+                elif char == "[" and depth == 1 and self._key == self.items_key and self._items_depth is None:
+                    self._items_depth = depth + 1
+                self._stack.append(char)
+                self._expecting_key = char == "{" and depth == 0
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if self._item_parts is not None and len(self._stack) == self._items_depth:
+                    self._item_parts.append(text[item_start:pos])
+                    items.append(json.loads("".join(self._item_parts)))
+                    self._item_parts = None
+                elif self._items_depth is not None and len(self._stack) < self._items_depth:
+                    # Only the first array under the key is scanned
+                    self._items_depth = -1
+            elif char == "," and depth == 1:
+                self._expecting_key = True
+            elif char == ":" and depth == 1:
+                self._expecting_key = False
+
+        if self._item_parts is not None:
+            self._item_parts.append(text[item_start:])
+        return items
+
+    def _scan_string(self, text: str, pos: int) -> int:
+        start = pos
+        while True:
+            if self._escaped:
+                self._escaped = False
+                pos += 1
+                if pos > len(text):
+                    # The escaped character is in the next part
+                    self._escaped = True
+                    pos = len(text)
+                    break
+                continue
+            match = _string_end.search(text, pos)
+            if match is None:
+                pos = len(text)
+                break
+            pos = match.end()
+            if match.group() == "\\":
+                self._escaped = True
+                continue
+            self._in_string = False
+            break
+
+        if self._key_parts is not None:
+            self._key_parts.append(text[start:pos])
+            if not self._in_string:
+                # The parts include the closing quote
+                self._key = json.loads('"' + "".join(self._key_parts))
+                self._key_parts = None
+        return pos
@@ -3,15 +3,17 @@ import json
 import logging
 from json import JSONDecodeError
 from pathlib import Path
-from typing import AsyncIterator, Dict
+from typing import Any, AsyncIterator, Callable, Dict, cast
 
-from jsonschema import ValidationError, validate
+from jsonschema import ValidationError, validators
+from jsonschema.protocols import Validator
 from openai.types.chat.completion_create_params import ResponseFormat
 from typing_extensions import override
 
 from mentat.errors import ModelError
 from mentat.llm_api_handler import chunk_to_lines
 from mentat.parsers.file_edit import FileEdit, Replacement
+from mentat.parsers.json_item_stream import JsonItemStream
 from mentat.parsers.parser import ParsedLLMResponse, Parser
 from mentat.parsers.streaming_printer import StreamingPrinter
 from mentat.prompts.prompts import read_prompt
@@ -60,26 +62,43 @@ rename_schema = {
     },
 }
 
+item_schema = {
+    "anyOf": [
+        comment_schema,
+        edit_schema,
+        creation_schema,
+        deletion_schema,
+        rename_schema,
+    ]
+}
+
 output_schema = {
     "type": "object",
     "properties": {
         "content": {
             "type": "array",
-            "items": {
-                "anyOf": [
-                    comment_schema,
-                    edit_schema,
-                    creation_schema,
-                    deletion_schema,
-                    rename_schema,
-                ]
-            },
+            "items": item_schema,
         }
     },
 }
 
+# validator_for's return type is unknown, but it always returns a class implementing the Validator protocol
+validator_for = cast(Callable[[Any], type[Validator]], validators.validator_for)  # pyright: ignore[reportUnknownMemberType]
+
+
+def _build_validator(schema: dict[str, Any]) -> Validator:
+    validator_class = validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema)
+
 
 class JsonParser(Parser):
+    def __init__(self):
+        super().__init__()
+        # Building a validator checks its schema, so it's only done once
+        self._output_validator = _build_validator(output_schema)
+        self._item_validator = _build_validator(item_schema)
+
     @override
     def get_system_prompt(self) -> str:
         return read_prompt(json_parser_prompt_filename)
@@ -93,17 +112,32 @@ class JsonParser(Parser):
         return 0
 
     @override
-    async def stream_and_parse_llm_response(self, response: AsyncIterator[str]) -> ParsedLLMResponse:
+    async def stream_and_parse_llm_response(
+        self,
+        response: AsyncIterator[str],
+        on_file_edit: Callable[[FileEdit], None] | None = None,
+    ) -> ParsedLLMResponse:
+        """
+        Each item of the content array is validated and added as soon as it's complete. Once the response ends,
+        the whole JSON is validated; if the items turn out to be different, the edits are made from the whole JSON.
+        The FileEdits already passed to on_file_edit are then superseded: the returned edits are new objects.
+        """
         session_context = SESSION_CONTEXT.get()
         stream = session_context.stream
 
-        printer = StreamingPrinter()
+        printer = StreamingPrinter(throttle=session_context.throttle_output)
         printer_task = asyncio.create_task(printer.print_lines())
-        message = ""
-        conversation = ""
+        message = list[str]()
+        conversation = list[str]()
         rename_map: Dict[Path, Path] = {}
+        file_edits: Dict[Path, FileEdit] = {}
+        item_stream = JsonItemStream()
+        items = list[Any]()
+        items_valid = True
+        interrupted = False
         async for chunk in response:
             if self.shutdown.is_set():
+                interrupted = True
                 printer.shutdown_printer()
                 await printer_task
                 stream.send("\n\nInterrupted by user. Using the response up to this point.")
@@ -112,81 +146,113 @@ class JsonParser(Parser):
             for content in chunk_to_lines(chunk):
                 if not content:
                     continue
-                message += content
+                message.append(content)
                 printer.add_string(content, end="")
+                if not items_valid:
+                    continue
+                try:
+                    for obj in item_stream.feed(content):
+                        self._item_validator.validate(obj)
+                        items.append(obj)
+                        file_edit = self._add_object(obj, file_edits, rename_map, conversation)
+                        if file_edit is not None and on_file_edit is not None:
+                            on_file_edit(file_edit)
+                except (JSONDecodeError, ValidationError):
+                    # The whole JSON won't be valid either, which is reported once it's complete
+                    items_valid = False
         else:
             # Only finish printing if we don't quit from ctrl-c
             printer.wrap_it_up()
             await printer_task
+        full_message = "".join(message)
         logging.debug("LLM Response:")
-        logging.debug(message)
+        logging.debug(full_message)
+
+        if interrupted:
+            # The JSON isn't complete, so we use the items that were
+            return ParsedLLMResponse(
+                full_message,
+                "".join(conversation),
+                [file_edit for file_edit in file_edits.values()],
+                interrupted,
+            )
 
         try:
-            response_json = json.loads(message)
-            validate(instance=response_json, schema=output_schema)
+            response_json = json.loads(full_message)
+            self._output_validator.validate(response_json)
         except JSONDecodeError:
             # Should never happen with OpenAI's response_format set to json
             stream.send("Error processing model response: Invalid JSON", style="error")
-            return ParsedLLMResponse(message, "", [])
+            return ParsedLLMResponse(full_message, "", [])
         except ValidationError:
             stream.send("Error processing model response: Invalid format given", style="error")
-            return ParsedLLMResponse(message, "", [])
+            return ParsedLLMResponse(full_message, "", [])
 
-        file_edits: Dict[Path, FileEdit] = {}
-        for obj in response_json["content"]:
-            filename = (session_context.cwd / obj.get("filename", "")).resolve()
-            if filename in rename_map:
-                filename = rename_map[filename]
-            match obj["type"]:
-                case "comment":
-                    conversation += obj["content"]
-                    fileedit = None
-                case "edit":
-                    fileedit = FileEdit(
-                        filename,
-                        [
-                            Replacement(
-                                obj["starting-line"] - 1,
-                                obj["ending-line"] - 1,
-                                obj["content"].split("\n"),
-                            )
-                        ],
-                        False,
-                        False,
-                        None,
-                    )
-                case "creation":
-                    fileedit = FileEdit(filename, [], True, False, None)
-                case "deletion":
-                    fileedit = FileEdit(filename, [], False, True, None)
-                case "rename":
-                    new_filename = session_context.cwd / obj["new-filename"]
-                    fileedit = FileEdit(filename, [], False, False, new_filename)
-                    rename_map[new_filename] = filename
-                case _:
-                    # Should never happen with JSON validation
-                    raise ModelError("Invalid JSON type")
-            if fileedit is None:
-                continue
-            if filename not in file_edits:
-                file_edits[filename] = fileedit
-            else:
-                # TODO: Add merge function to fileedit
-                old_fileedit = file_edits[filename]
-                file_edits[filename] = FileEdit(
-                    filename,
-                    fileedit.replacements + old_fileedit.replacements,
-                    fileedit.is_creation or old_fileedit.is_creation,
-                    fileedit.is_deletion or old_fileedit.is_deletion,
-                    (
-                        fileedit.rename_file_path
-                        if fileedit.rename_file_path is not None
-                        else old_fileedit.rename_file_path
-                    ),
-                )
+        if items != response_json["content"]:
+            conversation = list[str]()
+            rename_map = {}
+            file_edits = {}
+            for obj in response_json["content"]:
+                self._add_object(obj, file_edits, rename_map, conversation)
 
         return ParsedLLMResponse(
-            message,
-            conversation,
+            full_message,
+            "".join(conversation),
             [file_edit for file_edit in file_edits.values()],
         )
+
+    def _add_object(
+        self,
+        obj: dict[str, Any],
+        file_edits: Dict[Path, FileEdit],
+        rename_map: Dict[Path, Path],
+        conversation: list[str],
+    ) -> FileEdit | None:
+        """Adds a validated item of the content array, returning the FileEdit it added to if any."""
+        session_context = SESSION_CONTEXT.get()
+
+        filename = (session_context.cwd / obj.get("filename", "")).resolve()
+        if filename in rename_map:
+            filename = rename_map[filename]
+        match obj["type"]:
+            case "comment":
+                conversation.append(obj["content"])
+                return None
+            case "edit":
+                fileedit = FileEdit(
+                    filename,
+                    [
+                        Replacement(
+                            obj["starting-line"] - 1,
+                            obj["ending-line"] - 1,
+                            obj["content"].split("\n"),
+                        )
+                    ],
+                    False,
+                    False,
+                    None,
+                )
+            case "creation":
+                fileedit = FileEdit(filename, [], True, False, None)
+            case "deletion":
+                fileedit = FileEdit(filename, [], False, True, None)
+            case "rename":
+                new_filename = session_context.cwd / obj["new-filename"]
+                fileedit = FileEdit(filename, [], False, False, new_filename)
+                rename_map[new_filename] = filename
+            case _:
+                # Should never happen with JSON validation
+                raise ModelError("Invalid JSON type")
+        if filename not in file_edits:
+            file_edits[filename] = fileedit
+            return fileedit
+
+        # TODO: Add merge function to fileedit
+        # Merged into the existing edit, so it stays the same object while the response streams
+        old_fileedit = file_edits[filename]
+        old_fileedit.replacements = fileedit.replacements + old_fileedit.replacements
+        old_fileedit.is_creation = fileedit.is_creation or old_fileedit.is_creation
+        old_fileedit.is_deletion = fileedit.is_deletion or old_fileedit.is_deletion
+        if fileedit.rename_file_path is not None:
+            old_fileedit.rename_file_path = fileedit.rename_file_path
+        return old_fileedit
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Sequence
 
 from typing_extensions import override
 
@@ -36,9 +37,9 @@ class ReplacementParser(Parser):
         code_file_manager: CodeFileManager,
         cwd: Path,
         rename_map: dict[Path, Path],
-        special_block: str,
+        special_lines: list[str],
     ) -> tuple[DisplayInformation, FileEdit, bool]:
-        info = special_block.strip().split(" ")[1:]
+        info = "\n".join(special_lines).split(" ")[1:]
         if len(info) == 0:
             raise ModelError("Error: Invalid model output")
 
@@ -54,7 +55,7 @@ class ReplacementParser(Parser):
         if len(info) == 2:
             starting_line = 0
             ending_line = 0
-            removed_lines = []
+            removed_lines: Sequence[str] = []
             match info[1]:
                 case "+":
                     file_action_type = FileActionType.CreateFile
@@ -108,8 +109,7 @@ class ReplacementParser(Parser):
         self,
         code_file_manager: CodeFileManager,
         rename_map: dict[Path, Path],
-        special_block: str,
-        code_block: str,
+        code_lines: list[str],
         display_information: DisplayInformation,
         file_edit: FileEdit,
     ):
@@ -117,7 +117,7 @@ class ReplacementParser(Parser):
             Replacement(
                 display_information.first_changed_line,
                 display_information.last_changed_line,
-                code_block.split("\n")[:-2],
+                code_lines[:-1],
             )
         )
 
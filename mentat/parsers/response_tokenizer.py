@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import attr
+
+if TYPE_CHECKING:
+    # This normally will cause a circular import
+    from mentat.parsers.parser import Parser
+
+
+@attr.define
+class LineText:
+    """
+    Printable text of a line that isn't part of a special block: conversation, or code when in a code block.
+    The first LineText of a line holds all of the line so far; later ones only hold the newly streamed text.
+    """
+
+    text: str = attr.field()
+    # The line so far, including text
+    line: str = attr.field()
+    starts_line: bool = attr.field()
+    # Whether the line is inside a code block
+    is_code: bool = attr.field()
+    # The line could have been special until it was complete, so it's only printed now
+    complete: bool = attr.field(default=False)
+
+
+@attr.define
+class BlockHeader:
+    """A complete special block, with the whitespace around it stripped."""
+
+    lines: list[str] = attr.field()
+
+
+@attr.define
+class BlockEnd:
+    """A complete code block, or whatever of it was streamed if the response ended, without newlines."""
+
+    lines: list[str] = attr.field()
+
+
+ParserEvent = LineText | BlockHeader | BlockEnd
+
+
+class ResponseTokenizer:
+    """
+    Splits a streamed model response into events in a single pass, using the parser to tell special lines apart.
+    Streamed text is kept in lists that are only joined once, so long responses and code blocks take linear time.
+    After a BlockHeader, the consumer sets in_code_lines if a code block follows it.
+    """
+
+    def __init__(self, parser: Parser):
+        self.parser = parser
+        self.in_special_lines = False
+        self.in_code_lines = False
+        self._message = list[str]()
+        self._cur_line = ""
+        self._line_printed = False
+        # The complete lines of the current special or code block
+        self._block_lines = list[str]()
+
+    @property
+    def message(self) -> str:
+        return "".join(self._message)
+
+    def feed(self, content: str) -> list[ParserEvent]:
+        """Takes the next part of the response, which never continues past the end of a line."""
+        events = list[ParserEvent]()
+        self._message.append(content)
+        self._cur_line += content
+
+        # Print if not in special lines and line is confirmed not special
+        if not self.in_special_lines:
+            if not self._line_printed:
+                if not self.parser._could_be_special(self._cur_line):  # pyright: ignore[reportPrivateUsage]
+                    self._line_printed = True
+                    events.append(LineText(self._cur_line, self._cur_line, True, self.in_code_lines))
+            else:
+                events.append(LineText(content, self._cur_line, False, self.in_code_lines))
+
+        if "\n" in content:
+            events.extend(self._end_line())
+        return events
+
+    def _end_line(self) -> list[ParserEvent]:
+        parser = self.parser
+        events = list[ParserEvent]()
+        cur_line = self._cur_line
+        # Now that full line is in, give _could_be_special full line (including newline)
+        # and see if it should be printed or not
+        if (
+            not self.in_special_lines and not self._line_printed and not parser._could_be_special(cur_line)  # pyright: ignore[reportPrivateUsage]
+        ):
+            events.append(LineText(cur_line, cur_line, True, self.in_code_lines, complete=True))
+
+        stripped_line = cur_line.strip()
+        if parser._starts_special(stripped_line):  # pyright: ignore[reportPrivateUsage]
+            self.in_special_lines = True
+        if self.in_special_lines or self.in_code_lines:
+            self._block_lines.append(cur_line)
+
+        if self.in_special_lines and parser._ends_special(stripped_line):  # pyright: ignore[reportPrivateUsage]
+            self.in_special_lines = False
+            events.append(BlockHeader("".join(self._block_lines).strip().split("\n")))
+            self._block_lines = list[str]()
+        elif self.in_code_lines and parser._ends_code(stripped_line):  # pyright: ignore[reportPrivateUsage]
+            events.append(self._end_code_block())
+        self._line_printed = False
+        self._cur_line = ""
+        return events
+
+    def _end_code_block(self) -> BlockEnd:
+        self.in_code_lines = False
+        # Every block line ends with a newline
+        block_end = BlockEnd([line[:-1] for line in self._block_lines])
+        self._block_lines = list[str]()
+        return block_end
+
+    def finish(self) -> list[BlockEnd]:
+        """Ends the response; if the model didn't close out the code lines, we might as well do it for it."""
+        return [self._end_code_block()] if self.in_code_lines else []
@@ -1,9 +1,15 @@
+from __future__ import annotations
+
 import asyncio
+import math
 from collections import deque
-from typing import Any, Dict, List, Literal, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Tuple
 
 from mentat.session_context import SESSION_CONTEXT
 
+if TYPE_CHECKING:
+    from mentat.session_stream import SessionStream
+
 # TODO: Make this a class
 FormattedString = str | Tuple[str, Dict[str, Any]] | List[Tuple[str, Dict[str, Any]]]
 
@@ -21,13 +27,26 @@ def send_formatted_string(string: FormattedString):
         ctx.stream.send(string[0], **string[1])
 
 
+# While throttled, output is sent once per frame
+FRAME_TIME = 1 / 60
+
+
 class StreamingPrinter:
-    def __init__(self):
+    """
+    Prints strings gradually, as if they were being typed. Consecutive strings with the same styles are combined, and
+    each frame sends what's due as one message per run of styles. Without throttling, strings are sent as soon as
+    they're added; clients that nobody is watching (like the python client and the server) should use that.
+    """
+
+    def __init__(self, throttle: bool = True):
         self.strings_to_print: deque[Tuple[str, Dict[str, Any]]] = deque()
+        self.chars_to_print = 0
+        self.throttle = throttle
         self.finishing = False
         self.shutdown = False
         self.cur_file: str | None = None
         self.cur_file_display: Tuple[str, Literal["edit", "creation", "deletion", "rename"]] | None = None
+        self._strings_added = asyncio.Event()
 
     def add_string(
         self,
@@ -56,9 +75,15 @@ class StreamingPrinter:
         if not string:
             if allow_empty:
                 self.strings_to_print.append(("", styles))
+                self._strings_added.set()
             return
 
-        self.strings_to_print.extend((char, styles) for char in string)
+        if self.strings_to_print and self.strings_to_print[-1][0] and self.strings_to_print[-1][1] == styles:
+            self.strings_to_print[-1] = (self.strings_to_print[-1][0] + string, styles)
+        else:
+            self.strings_to_print.append((string, styles))
+        self.chars_to_print += len(string)
+        self._strings_added.set()
         if end:
             self.add_string(end, end="")
 
@@ -66,11 +91,26 @@ class StreamingPrinter:
         self.add_string(("", {"delimiter": True}), end="", allow_empty=True)
 
     def sleep_time(self) -> float:
+        return FRAME_TIME if self.throttle else 0
+
+    def frame_size(self) -> int:
+        """The number of characters to send this frame; a backlog is printed at a rate of its size per second."""
+        if not self.throttle:
+            return self.chars_to_print
         max_finish_time = 1.0
-        required_sleep_time = max_finish_time / (len(self.strings_to_print) + 1)
-        max_sleep = 0.002 if self.finishing else 0.006
-        min_sleep = 0.001
-        return max(min(max_sleep, required_sleep_time), min_sleep)
+        char_time = 0.002 if self.finishing else 0.006
+        return max(math.ceil(FRAME_TIME / char_time), math.ceil(self.chars_to_print * FRAME_TIME / max_finish_time))
+
+    def _print_frame(self, stream: SessionStream):
+        chars_left = self.frame_size()
+        while self.strings_to_print and (chars_left > 0 or not self.strings_to_print[0][0]):
+            queued, styles = self.strings_to_print.popleft()
+            string = queued[:chars_left]
+            if len(queued) > chars_left:
+                self.strings_to_print.appendleft((queued[chars_left:], styles))
+            stream.send(string, end="", **styles)
+            chars_left -= len(string)
+            self.chars_to_print -= len(string)
 
     async def print_lines(self):
         session_context = SESSION_CONTEXT.get()
@@ -78,14 +118,19 @@ class StreamingPrinter:
 
         while not self.shutdown:
             if self.strings_to_print:
-                next_string = self.strings_to_print.popleft()
-                stream.send(next_string[0], end="", **next_string[1])
+                self._print_frame(stream)
             elif self.finishing:
                 break
+            else:
+                self._strings_added.clear()
+                await self._strings_added.wait()
+                continue
             await asyncio.sleep(self.sleep_time())
 
     def wrap_it_up(self):
         self.finishing = True
+        self._strings_added.set()
 
     def shutdown_printer(self):
         self.shutdown = True
+        self._strings_added.set()
@@ -1,5 +1,6 @@
 from enum import Enum
 from pathlib import Path
+from typing import AsyncIterator, Callable, Sequence
 
 from typing_extensions import override
 
@@ -9,9 +10,9 @@ from mentat.parsers.change_display_helper import (
     get_file_action_type,
     highlight_text,
 )
-from mentat.parsers.diff_utils import matching_index
+from mentat.parsers.diff_utils import HunkLocator
 from mentat.parsers.file_edit import FileEdit, Replacement
-from mentat.parsers.parser import Parser
+from mentat.parsers.parser import ParsedLLMResponse, Parser
 from mentat.parsers.streaming_printer import FormattedString
 from mentat.prompts.prompts import read_prompt
 
@@ -26,6 +27,29 @@ class UnifiedDiffDelimiter(Enum):
 
 
 class UnifiedDiffParser(Parser):
+    def __init__(self):
+        super().__init__()
+        # Shared by every hunk for a file within a response
+        self._hunk_locators = dict[Path, HunkLocator]()
+
+    @override
+    async def stream_and_parse_llm_response(
+        self,
+        response: AsyncIterator[str],
+        on_file_edit: Callable[[FileEdit], None] | None = None,
+    ) -> ParsedLLMResponse:
+        try:
+            return await super().stream_and_parse_llm_response(response, on_file_edit)
+        finally:
+            self._hunk_locators.clear()
+
+    def _get_hunk_locator(self, file_path: Path, file_lines: Sequence[str]) -> HunkLocator:
+        locator = self._hunk_locators.get(file_path)
+        if locator is None or locator.orig_lines is not file_lines:
+            locator = HunkLocator(file_lines)
+            self._hunk_locators[file_path] = locator
+        return locator
+
     @override
     def get_system_prompt(self) -> str:
         return read_prompt(unified_diff_parser_prompt_filename)
@@ -35,7 +59,7 @@ class UnifiedDiffParser(Parser):
         return False
 
     @override
-    def _code_line_beginning(self, display_information: DisplayInformation, cur_block: str) -> FormattedString:
+    def _code_line_beginning(self, display_information: DisplayInformation) -> FormattedString:
         return ("", {})
 
     @override
@@ -44,7 +68,6 @@ class UnifiedDiffParser(Parser):
         display_information: DisplayInformation,
         content: str,
         cur_line: str,
-        cur_block: str,
     ) -> FormattedString:
         if cur_line == UnifiedDiffDelimiter.MidChange.value:
             return [("", {"delimiter": True}), ("\n", {})]
@@ -85,9 +108,9 @@ class UnifiedDiffParser(Parser):
         code_file_manager: CodeFileManager,
         cwd: Path,
         rename_map: dict[Path, Path],
-        special_block: str,
+        special_lines: list[str],
     ) -> tuple[DisplayInformation, FileEdit, bool]:
-        lines = special_block.strip().split("\n")
+        lines = special_lines
         file_name = lines[0][4:]
         new_name = lines[1][4:]
         is_creation = file_name == "/dev/null"
@@ -125,15 +148,17 @@ class UnifiedDiffParser(Parser):
         self,
         code_file_manager: CodeFileManager,
         rename_map: dict[Path, Path],
-        special_block: str,
-        code_block: str,
+        code_lines: list[str],
         display_information: DisplayInformation,
         file_edit: FileEdit,
     ):
-        file_lines = self._get_file_lines(code_file_manager, rename_map, file_edit.file_path).copy()
+        base_file_lines = self._get_file_lines(code_file_manager, rename_map, file_edit.file_path)
+        locator: HunkLocator | None = self._get_hunk_locator(file_edit.file_path, base_file_lines)
+        file_lines = list(base_file_lines)
 
         # First, we split by the symbols that separate changes.
-        lines = code_block.split("\n")
+        # A code block the model didn't close ends with an empty context line
+        lines = [*code_lines, ""]
         changes = list[list[str]]()
         cur_lines = list[str]()
         for line in lines:
@@ -171,7 +196,10 @@ class UnifiedDiffParser(Parser):
                 replacements.append(Replacement(0, 0, [line[1:] for line in change]))
                 continue
 
-            start_index = matching_index(file_lines, search_lines)
+            if locator is None:
+                # Lines were added to file_lines for an earlier change, so the shared index no longer fits
+                locator = HunkLocator(list(file_lines))
+            start_index = locator.find(search_lines)
             if start_index == -1:
                 return
 
@@ -190,6 +218,7 @@ class UnifiedDiffParser(Parser):
                     change.insert(cur_change_index, "")
                 elif not cur_change_line.strip() and cur_file_line.strip():
                     file_lines.insert(cur_file_index, "")
+                    locator = None
                 cur_file_index += 1
                 cur_change_index += 1
 
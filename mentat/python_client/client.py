@@ -109,6 +109,7 @@ class PythonClient:
             self.diff,
             self.pr_diff,
             self.config,
+            throttle_output=False,
         )
         self.session.start()
         self.acc_task = asyncio.create_task(self._accumulate_messages())
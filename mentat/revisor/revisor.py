@@ -1,6 +1,6 @@
 import difflib
 from pathlib import Path
-from typing import List
+from typing import List, Sequence
 
 from openai.types.chat import (
     ChatCompletionAssistantMessageParam,
@@ -22,13 +22,13 @@ revisor_prompt_filename = Path("revisor_prompt.txt")
 revisor_prompt = read_prompt(revisor_prompt_filename)
 
 
-def _get_stored_lines(file_edit: FileEdit) -> List[str]:
+def _get_stored_lines(file_edit: FileEdit) -> Sequence[str]:
     ctx = SESSION_CONTEXT.get()
 
     if file_edit.is_creation:
         return []
     else:
-        return ctx.code_file_manager.file_lines[file_edit.file_path].copy()
+        return ctx.code_file_manager.file_lines[file_edit.file_path]
 
 
 def _file_edit_diff(file_edit: FileEdit) -> str:
@@ -59,7 +59,7 @@ async def revise_edit(file_edit: FileEdit):
         ChatCompletionSystemMessageParam(content=f"Diff:\n{diff}", role="system"),
     ]
     code_message = await ctx.code_context.get_code_message(
-        ctx.llm_api_handler.spice.count_prompt_tokens(messages, ctx.config.model, ctx.config.provider)
+        ctx.llm_api_handler.count_prompt_tokens(messages, ctx.config.model, ctx.config.provider)
     )
     messages.insert(1, ChatCompletionSystemMessageParam(content=code_message, role="system"))
 
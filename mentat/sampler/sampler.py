@@ -1,20 +1,20 @@
+import asyncio
 import json
-import subprocess
 from pathlib import Path
 from uuid import uuid4
 
-from git import GitCommandError, Repo  # type: ignore
+from git import Repo  # type: ignore
 
 from mentat.code_feature import get_consolidated_feature_refs
 from mentat.errors import SampleError
-from mentat.git_handler import get_git_diff, get_git_root_for_path, get_hexsha_active
+from mentat.git_handler import get_git_diff_async, get_git_root_for_path, get_hexsha_active
 from mentat.parsers.git_parser import GitParser
 from mentat.parsers.parser import ParsedLLMResponse
 from mentat.sampler.sample import Sample
 from mentat.sampler.utils import get_active_snapshot_commit
 from mentat.session_context import SESSION_CONTEXT
 from mentat.session_input import collect_user_input
-from mentat.utils import get_relative_path
+from mentat.utils import get_relative_path, run_subprocess_async
 
 
 class Sampler:
@@ -23,7 +23,7 @@ class Sampler:
     last_sample_id: str | None = None
     last_sample_hexsha: str | None = None
 
-    def set_active_diff(self):
+    async def set_active_diff(self):
         # Create a temporary commit with the active changes
         ctx = SESSION_CONTEXT.get()
         git_root = get_git_root_for_path(ctx.cwd, raise_error=False)
@@ -31,11 +31,12 @@ class Sampler:
             return
         repo = Repo(git_root)
         try:
-            self.commit_active = get_active_snapshot_commit(repo)
+            # Snapshotting runs git several times and hashes every changed file, so keep it off the event loop
+            self.commit_active = await asyncio.to_thread(get_active_snapshot_commit, repo)
             # If changes were made since the last sample, don't list it as parent.
             if not self.last_sample_hexsha:
                 return
-            if self.last_sample_hexsha != get_hexsha_active():
+            if self.last_sample_hexsha != await asyncio.to_thread(get_hexsha_active):
                 self.last_sample_id = None
                 self.last_sample_hexsha = None
         except SampleError as e:
@@ -66,9 +67,8 @@ class Sampler:
             response = (await collect_user_input()).data.strip()
             if response == "y":
                 try:
-                    mb = git_repo.merge_base(git_repo.head.commit, target)[0]
-                    assert mb and hasattr(mb, "hexsha"), "No merge base found"
-                    merge_base = mb.hexsha
+                    merge_base = await run_subprocess_async("git", "merge-base", "HEAD", target, cwd=git_root)
+                    assert merge_base, "No merge base found"
                 except Exception as e:
                     stream.send(f"Error getting merge base from tar: {e}", style="error")
         if not merge_base:
@@ -82,19 +82,16 @@ class Sampler:
                 merge_base = response
         try:
             assert merge_base is not None, "No merge base found"
-            diff_merge_base = get_git_diff(merge_base, "HEAD")
-        except (AssertionError, GitCommandError) as e:
+            diff_merge_base = await get_git_diff_async(merge_base, "HEAD")
+        except Exception as e:
             raise SampleError(f"Error getting diff for merge base: {e}")
 
         repo = config.sample_repo
         if not repo:
             remote_url = ""
             try:
-                remote_url = subprocess.check_output(
-                    ["git", "config", "--get", "remote.origin.url"],
-                    text=True,
-                ).strip()
-            except subprocess.CalledProcessError:
+                remote_url = await run_subprocess_async("git", "config", "--get", "remote.origin.url")
+            except Exception:
                 pass
             stream.send(f"Found repo URL: {remote_url}. Press 'ENTER' to accept, or enter a new URL.")
             response = (await collect_user_input()).data.strip()
@@ -156,11 +153,11 @@ class Sampler:
             raise SampleError("No LLM response found.")
         message_edit = response_edit.conversation.strip()
         if self.commit_active:
-            diff_active = get_git_diff("HEAD", self.commit_active)
+            diff_active = await get_git_diff_async("HEAD", self.commit_active)
         else:
             diff_active = ""
         if response_edit.file_edits:
-            diff_edit = get_git_diff(self.commit_active or "HEAD")
+            diff_edit = await get_git_diff_async(self.commit_active or "HEAD")
         else:
             diff_edit = ""
 
@@ -7,7 +7,8 @@ from git import GitCommandError, Repo  # type: ignore
 
 from mentat.errors import SampleError
 from mentat.git_handler import get_non_gitignored_files
-from mentat.utils import is_file_text_encoded
+from mentat.git_service import get_git_service
+from mentat.utils import are_files_text_encoded
 
 CLONE_TO_DIR = Path("benchmarks/benchmark_repos")
 
@@ -99,40 +100,18 @@ def setup_repo(
 
 
 def get_active_snapshot_commit(repo: Repo) -> str | None:
-    """Returns the commit hash of the current active snapshot, or None if there are no active changes."""
+    """
+    Returns the commit hash of the current active snapshot, or None if there are no active changes.
+    The commit is built with a temporary index, so the working tree, index, branch and stash are left as they are.
+    """
     if not repo.is_dirty() and not repo.untracked_files:
         return None
     if not repo.config_reader().has_option("user", "name"):
         raise SampleError("ERROR: Git user.name not set. Please run 'git config --global user.name" ' "Your Name"\'.')
-    try:
-        # Stash active changes and record the current position
-        for file in get_non_gitignored_files(Path(repo.working_dir)):
-            if is_file_text_encoded(file):
-                repo.git.add(file)
-        repo.git.stash("push", "-u")
-        detached_head = repo.head.is_detached
-        if detached_head:
-            current_state = repo.head.commit.hexsha
-        else:
-            current_state = repo.active_branch.name
-        # Commit them on a temporary branch
-        temp_branch = f"sample_{uuid4().hex}"
-        repo.git.checkout("-b", temp_branch)
-        repo.git.stash("apply")
-        repo.git.commit("-am", temp_branch)
-        # Save the commit hash for diffing against later
-        new_commit = repo.head.commit.hexsha
-        # Reset repo to how it was before
-        repo.git.checkout(current_state)
-        repo.git.branch("-D", temp_branch)
-        repo.git.stash("apply")
-        repo.git.stash("drop")
-        # Return the hexsha of the new commit
-        return new_commit
-
-    except Exception as e:
-        raise SampleError(
-            "WARNING: Mentat encountered an error while making temporary git changes:"
-            f" {e}. If your active changes have disappeared, they can most likely be "
-            "recovered using 'git stash pop'."
-        )
+    git_root = Path(os.path.realpath(repo.working_dir))
+    files = [git_root / file for file in get_non_gitignored_files(git_root)]
+    text_files = [file for file, text_encoded in zip(files, are_files_text_encoded(files)) if text_encoded]
+    new_commit = get_git_service(git_root).create_snapshot_commit(text_files, f"sample_{uuid4().hex}")
+    if new_commit is None:
+        raise SampleError("WARNING: Mentat encountered an error while making a snapshot commit of the active changes.")
+    return new_commit
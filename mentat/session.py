@@ -18,7 +18,9 @@ from mentat.code_edit_feedback import get_user_feedback_on_edits
 from mentat.code_file_manager import CodeFileManager
 from mentat.config import Config
 from mentat.conversation import Conversation
+from mentat.edit_preview import get_file_edit_message
 from mentat.errors import MentatError, ReturnToUser, SessionExit, UserError
+from mentat.git_service import close_git_services
 from mentat.llm_api_handler import LlmApiHandler, is_test_environment
 from mentat.logging_config import setup_logging
 from mentat.parsers.file_edit import FileEdit
@@ -52,6 +54,8 @@ class Session:
         # Set to false for clients that apply the edits themselves (like vscode)
         apply_edits: bool = True,
         show_update: bool = True,
+        # Set to false for clients that don't display the response as it streams (like the python client)
+        throttle_output: bool = True,
     ):
         # All errors thrown here need to be caught here
         self.stopped = Event()
@@ -97,6 +101,7 @@ class Session:
             agent_handler,
             auto_completer,
             sampler,
+            throttle_output,
         )
         self.ctx = session_context
         SESSION_CONTEXT.set(session_context)
@@ -111,8 +116,6 @@ class Session:
         if len(code_context.include_files) == 0 and (diff or pr_diff):
             for file in code_context.diff_context.diff_files():
                 code_context.include(file)
-        if config.sampler:
-            sampler.set_active_diff()
 
         self.apply_edits = apply_edits
 
@@ -131,21 +134,7 @@ class Session:
     def send_file_edits(self, file_edits: List[FileEdit]):
         ctx = SESSION_CONTEXT.get()
         ctx.stream.send(
-            [
-                {
-                    "file_path": str(file_edit.file_path),
-                    "new_file_path": (None if not file_edit.rename_file_path else str(file_edit.rename_file_path)),
-                    "type": (
-                        "creation" if file_edit.is_creation else ("deletion" if file_edit.is_deletion else "edit")
-                    ),
-                    "new_content": "\n".join(
-                        file_edit.get_updated_file_lines(
-                            ctx.code_file_manager.file_lines.get(file_edit.file_path, []).copy()
-                        )
-                    ),
-                }
-                for file_edit in file_edits
-            ],
+            [get_file_edit_message(file_edit) for file_edit in file_edits],
             channel="model_file_edits",
         )
 
@@ -160,6 +149,8 @@ class Session:
         try:
             await session_context.llm_api_handler.initialize_client()
             await code_context.refresh_daemon()
+            if session_context.config.sampler:
+                await session_context.sampler.set_active_diff()
 
             check_model()
 
@@ -184,13 +175,13 @@ class Session:
                     parsed_llm_response = await conversation.get_model_response()
                     file_edits = [file_edit for file_edit in parsed_llm_response.file_edits if file_edit.is_valid()]
                     for file_edit in file_edits:
-                        file_edit.resolve_conflicts()
+                        conversation.edit_preview.resolve_conflicts(file_edit)
                     if file_edits:
                         if session_context.config.revisor:
                             await revise_edits(file_edits)
 
                         if session_context.config.sampler:
-                            session_context.sampler.set_active_diff()
+                            await session_context.sampler.set_active_diff()
 
                         self.send_file_edits(file_edits)
                         if self.apply_edits:
@@ -311,6 +302,9 @@ class Session:
         vision_manager = session_context.vision_manager
 
         vision_manager.close()
+        await session_context.code_context.stop_file_watcher()
+        session_context.code_context.save_graph_snapshot()
+        close_git_services()
         logging.shutdown()
 
         for task in self._tasks:
@@ -34,3 +34,5 @@ class SessionContext:
     agent_handler: AgentHandler = attr.field()
     auto_completer: AutoCompleter = attr.field()
     sampler: Sampler = attr.field()
+    # Whether model responses are printed gradually; clients that nobody watches turn this off
+    throttle_output: bool = attr.field(default=True)
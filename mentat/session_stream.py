@@ -55,6 +55,10 @@ class SessionStream:
         ...
     ]
 
+    model_file_edits_preview: While the model is still responding, sends a list of the file edits parsed so far,
+    whenever they change. Uses the same schema as model_file_edits; every message replaces the previous one,
+    and edits may still change or be dropped before model_file_edits is sent. Clients can ignore this channel.
+
     edits_complete: A boolean sent when edits have been completed. True if any edits were accepted.
 
     *completion_request: Sent by the client, retrieves completions for given data. Valid kwargs: command_autocomplete
@@ -74,6 +78,8 @@ class SessionStream:
         "auto_context_tokens": The number of auto context tokens,
         "features": ["List of user included features"],
         "git_diff_paths": ["List of all paths with git diffs; used to color the changed included features"],
+        "git_untracked_paths": ["List of all untracked paths"],
+        "git_diff_stats": {"path": [lines inserted, lines deleted] for each path with git diffs},
         "total_tokens": Total tokens in context,
         "maximum_tokens": Maximum tokens allowed in context,
         "total_cost": Total cost so far
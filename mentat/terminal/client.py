@@ -88,6 +88,7 @@ class TerminalClient:
                 features,
                 git_diff_paths,
                 git_untracked_paths,
+                git_diff_stats,
                 total_tokens,
                 total_cost,
             ) = (
@@ -97,6 +98,7 @@ class TerminalClient:
                 data["features"],
                 set(Path(path) for path in data["git_diff_paths"]),
                 set(Path(path) for path in data["git_untracked_paths"]),
+                {Path(path): (stats[0], stats[1]) for path, stats in data["git_diff_stats"].items()},
                 data["total_tokens"],
                 data["total_cost"],
             )
@@ -107,6 +109,7 @@ class TerminalClient:
                 features,
                 git_diff_paths,
                 git_untracked_paths,
+                git_diff_stats,
                 total_tokens,
                 total_cost,
             )
@@ -3,7 +3,7 @@ from __future__ import annotations
 import os
 from asyncio import Event
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 
 from rich.console import RenderableType
 from rich.markup import escape
@@ -146,6 +146,7 @@ class ContextContainer(Static):
         children: Dict[str, Any],
         git_diff_paths: Set[Path],
         untracked_paths: Set[Path],
+        git_diff_stats: Dict[Path, Tuple[int, int]],
         untracked: bool = False,
     ):
         for child, grandchildren in children.items():
@@ -158,6 +159,9 @@ class ContextContainer(Static):
             if not grandchildren:
                 if new_path in git_diff_paths:
                     label = f"[green]* {child}[/green]"
+                    if new_path in git_diff_stats:
+                        insertions, deletions = git_diff_stats[new_path]
+                        label += f" [green]+{insertions}[/green] [red]-{deletions}[/red]"
                 root.add_leaf(label)
             else:
                 child_node = root.add(label, expand=True)
@@ -167,6 +171,7 @@ class ContextContainer(Static):
                     grandchildren,
                     git_diff_paths,
                     untracked_paths,
+                    git_diff_stats,
                     path_untracked,
                 )
 
@@ -176,11 +181,12 @@ class ContextContainer(Static):
         cwd: Path,
         git_diff_paths: Set[Path],
         untracked_paths: Set[Path],
+        git_diff_stats: Dict[Path, Tuple[int, int]],
     ) -> Tree[Any]:
         path_tree = self._build_path_tree(files, cwd)
         tree: Tree[Any] = Tree(f"[blue]{cwd.name}[/blue]")
         tree.root.expand()
-        self._build_sub_tree(cwd, tree.root, path_tree, git_diff_paths, untracked_paths)
+        self._build_sub_tree(cwd, tree.root, path_tree, git_diff_paths, untracked_paths, git_diff_stats)
         return tree
 
     def update_context(
@@ -191,10 +197,11 @@ class ContextContainer(Static):
         features: List[str],
         git_diff_paths: Set[Path],
         git_untracked_paths: Set[Path],
+        git_diff_stats: Dict[Path, Tuple[int, int]],
         total_tokens: int,
         total_cost: float,
     ):
-        feature_tree = self._build_tree_widget(features, cwd, git_diff_paths, git_untracked_paths)
+        feature_tree = self._build_tree_widget(features, cwd, git_diff_paths, git_untracked_paths, git_diff_stats)
 
         context_header = ""
         context_header += "[blue bold]Code Context:[/blue bold]"
@@ -295,6 +302,7 @@ class TerminalApp(App[None]):
         features: List[str],
         git_diff_paths: Set[Path],
         git_untracked_paths: Set[Path],
+        git_diff_stats: Dict[Path, Tuple[int, int]],
         total_tokens: int,
         total_cost: float,
     ):
@@ -306,6 +314,7 @@ class TerminalApp(App[None]):
             features,
             git_diff_paths,
             git_untracked_paths,
+            git_diff_stats,
             total_tokens,
             total_cost,
         )
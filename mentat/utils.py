@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import asyncio
+import codecs
 import hashlib
+import locale
+import os
 from importlib import resources
 from importlib.abc import Traversable
 from pathlib import Path
-from typing import TYPE_CHECKING, AsyncIterator, List, Literal, Optional, Union
+from typing import TYPE_CHECKING, AsyncIterator, List, Literal, Optional, Sequence, Union
 
 from jinja2 import Environment, PackageLoader, select_autoescape
 
@@ -25,9 +28,13 @@ def sha256(data: str) -> str:
     return hashlib.sha256(data.encode("utf-8")).hexdigest()
 
 
-async def run_subprocess_async(*args: str) -> str:
+async def run_subprocess_async(
+    *args: str, cwd: Optional[Path] = None, env: Optional[dict[str, str]] = None, strip: bool = True
+) -> str:
     process = await asyncio.create_subprocess_exec(
         *args,
+        cwd=cwd,
+        env=env,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
         start_new_session=True,
@@ -38,7 +45,9 @@ async def run_subprocess_async(*args: str) -> str:
         error_output = stderr.decode("utf-8").strip() if stderr else ""
         raise Exception(f"Subprocess failed with error: {error_output}")
 
-    output = stdout.decode("utf-8").strip() if stdout else ""
+    output = stdout.decode("utf-8") if stdout else ""
+    if strip:
+        output = output.strip()
 
     return output
 
@@ -118,13 +127,94 @@ def get_relative_path(path: Path, target: Path) -> Path:
     return relative_path
 
 
-# TODO: replace this with something that doesn't load the file into memory
-def is_file_text_encoded(abs_path: Path):
-    """Checks if a file is text encoded."""
+# (inode, size, mtime) of a file; as long as it's unchanged, the file's contents can be assumed to be too
+StatSignature = tuple[int, int, int]
+
+
+def get_stat_signature(path: Path) -> Optional[StatSignature]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+# Git only looks at the start of a file when deciding if it's binary; so do we
+TEXT_SNIFF_BYTES = 8000
+
+# Verdicts keyed by path, only trusted while the file's (inode, size, mtime) stay the same
+_text_encoded_cache: dict[Path, tuple[tuple[int, int, int, bool], bool]] = {}
+
+
+def _sniff_text_encoded(abs_path: Path, size: int, check_nul: bool) -> bool:
+    with open(abs_path, "rb") as f:
+        prefix = f.read(TEXT_SNIFF_BYTES)
+    if check_nul and b"\0" in prefix:
+        return False
+    # Decode the same way open() would; a multibyte character cut off at the end of the prefix isn't an error
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))()
     try:
-        # The ultimate filetype test
-        with open(abs_path, "r") as f:
-            f.read()
+        decoder.decode(prefix, final=size <= len(prefix))
         return True
     except UnicodeDecodeError:
         return False
+
+
+def _get_text_attributes(abs_paths: Sequence[Path]) -> dict[Path, dict[str, str]]:
+    # git_handler imports this module
+    from mentat.git_handler import get_git_root_for_path
+    from mentat.git_service import get_git_service
+
+    paths_by_root = dict[Path, list[Path]]()
+    for abs_path in abs_paths:
+        # Attributes only apply inside a repository
+        git_root = get_git_root_for_path(abs_path, raise_error=False)
+        if git_root is not None:
+            paths_by_root.setdefault(git_root, []).append(abs_path)
+
+    attributes = dict[Path, dict[str, str]]()
+    for git_root, paths in paths_by_root.items():
+        # git resolves symlinks in the repository's path, so the paths it's asked about have to be resolved too
+        results = get_git_service(git_root).get_attributes(
+            [Path(os.path.realpath(path)) for path in paths], ["binary", "diff", "text"]
+        )
+        if results is not None:
+            attributes.update(zip(paths, results))
+    return attributes
+
+
+def are_files_text_encoded(abs_paths: Sequence[Path]) -> list[bool]:
+    """
+    Checks which files are text encoded, without reading more than the start of each.
+    A file is treated as binary if its gitattributes mark it -text, -diff or binary, or if its start contains a NUL byte
+    (git's own heuristic) or doesn't decode. Files marked text or diff skip the NUL check.
+    The attributes of all the files are looked up with at most one `git check-attr` call per repository.
+    """
+    abs_paths = [Path(os.path.abspath(abs_path)) for abs_path in abs_paths]
+    stats = [os.stat(abs_path) for abs_path in abs_paths]
+    # Attributes aren't part of the verdict's key since .gitattributes can change without the file changing;
+    # the git service caches them on the attribute files instead
+    all_attributes = _get_text_attributes(abs_paths)
+
+    verdicts = list[bool]()
+    for abs_path, stat in zip(abs_paths, stats):
+        attributes = all_attributes.get(abs_path, {})
+        if "unset" in (attributes.get("text"), attributes.get("diff")) or attributes.get("binary") == "set":
+            verdicts.append(False)
+            continue
+        check_nul = attributes.get("text") != "set" and attributes.get("diff") != "set"
+
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns, check_nul)
+        cached = _text_encoded_cache.get(abs_path)
+        if cached is not None and cached[0] == signature:
+            verdicts.append(cached[1])
+            continue
+        text_encoded = _sniff_text_encoded(abs_path, stat.st_size, check_nul)
+        _text_encoded_cache[abs_path] = (signature, text_encoded)
+        verdicts.append(text_encoded)
+    return verdicts
+
+
+def is_file_text_encoded(abs_path: Path) -> bool:
+    """Checks if a file is text encoded; see are_files_text_encoded."""
+    return are_files_text_encoded([abs_path])[0]
@@ -1,13 +1,17 @@
+import asyncio
 import os
+import time
 from pathlib import Path
 from textwrap import dedent
 from unittest import TestCase
 
 import pytest
+from ragdaemon.database import LiteDB
 
 from mentat.code_context import CodeContext
 from mentat.config import Config
 from mentat.git_handler import get_non_gitignored_files
+from mentat.graph_snapshot import get_snapshot_path
 from mentat.include_files import is_file_text_encoded
 from mentat.interval import Interval
 from tests.conftest import run_git_command
@@ -410,3 +414,197 @@ def test_exclude_single_directory(mock_code_context):
 def test_exclude_missing_directory(mock_code_context):
     mock_code_context.exclude("this_directory_does_not_exist")
     assert len(mock_code_context.include_files) == 0
+
+
+@pytest.mark.asyncio
+async def test_code_message_snapshot(mocker, temp_testbed, mock_code_context):
+    mock_code_context.include("multifile_calculator/calculator.py")
+    refresh_daemon = mocker.spy(mock_code_context, "refresh_daemon")
+
+    code_message = await mock_code_context.get_code_message(0)
+    assert await mock_code_context.get_code_message(0) == code_message
+    assert refresh_daemon.call_count == 1
+    version = mock_code_context.snapshot_version
+
+    # Without auto-context the prompt doesn't change the message, so it's reused
+    assert await mock_code_context.get_code_message(10, prompt="a different prompt") == code_message
+    assert refresh_daemon.call_count == 1
+
+    # An edit to an included file rebuilds the snapshot
+    with open(temp_testbed / "multifile_calculator" / "calculator.py", "a") as f:
+        f.write("\n# new line\n")
+    new_code_message = await mock_code_context.get_code_message(10)
+    assert refresh_daemon.call_count == 2
+    assert mock_code_context.snapshot_version == version + 1
+    assert "# new line" in new_code_message
+
+    # So does another edit to a file that's already in the diff
+    with open(temp_testbed / "multifile_calculator" / "operations.py", "a") as f:
+        f.write("\n# first change\n")
+    await mock_code_context.get_code_message(10)
+    with open(temp_testbed / "multifile_calculator" / "operations.py", "a") as f:
+        f.write("# second change\n")
+    await mock_code_context.get_code_message(10)
+    assert mock_code_context.snapshot_version == version + 3
+
+
+@pytest.mark.asyncio
+async def test_code_message_skips_deleted_files(temp_testbed, mock_code_context):
+    calculator_path = temp_testbed / "multifile_calculator" / "calculator.py"
+    mock_code_context.include(calculator_path)
+    assert "def calculate" in await mock_code_context.get_code_message(0)
+
+    # Deleted outside of Mentat, e.g. by a git checkout
+    calculator_path.unlink()
+    assert "def calculate" not in await mock_code_context.get_code_message(0)
+    assert calculator_path not in mock_code_context.include_files
+
+
+@pytest.mark.asyncio
+async def test_code_message_skips_undecodable_files(temp_testbed, mock_code_context):
+    # Only the start of a file is checked when it's included, so bytes past that can still fail to decode
+    late_invalid_path = temp_testbed / "late_invalid.txt"
+    late_invalid_path.write_bytes(b"a" * 9000 + b"\xff\xfe")
+    mock_code_context.include(late_invalid_path)
+    assert late_invalid_path in mock_code_context.include_files
+
+    await mock_code_context.get_code_message(0)
+    assert late_invalid_path not in mock_code_context.include_files
+
+
+@pytest.mark.asyncio
+async def test_file_watcher_skips_daemon_update(temp_testbed, mock_session_context):
+    mock_session_context.config.watch_files = True
+    code_context = CodeContext(mock_session_context.stream, temp_testbed)
+    try:
+        await code_context.refresh_daemon()
+        update = code_context.daemon.update
+        assert update.call_count == 1
+        for _ in range(100):
+            if not code_context.file_watcher.has_changes():
+                break
+            await asyncio.sleep(0.05)
+
+        # Nothing changed, so the daemon isn't updated again
+        await code_context.refresh_daemon()
+        assert update.call_count == 1
+
+        with open(temp_testbed / "new_file.py", "w") as f:
+            f.write("print('hello')\n")
+        for _ in range(100):
+            if code_context.file_watcher.dirty_paths:
+                break
+            await asyncio.sleep(0.05)
+        await code_context.refresh_daemon()
+        assert update.call_count == 2
+    finally:
+        await code_context.stop_file_watcher()
+
+
+@pytest.mark.asyncio
+async def test_file_watcher_updates_daemon_after_commit(temp_testbed, mock_session_context):
+    mock_session_context.config.watch_files = True
+    code_context = CodeContext(mock_session_context.stream, temp_testbed, diff="HEAD")
+    try:
+        await code_context.refresh_daemon()
+        update = code_context.daemon.update
+        for _ in range(100):
+            if not code_context.file_watcher.has_changes():
+                break
+            await asyncio.sleep(0.05)
+        await code_context.refresh_daemon()
+        assert update.call_count == 1
+
+        # The watcher ignores .git, so a commit only shows up in git's state
+        run_git_command(temp_testbed, "commit", "--allow-empty", "-m", "empty commit")
+        assert not code_context.file_watcher.has_changes()
+        await code_context.refresh_daemon()
+        assert update.call_count == 2
+    finally:
+        await code_context.stop_file_watcher()
+
+
+def _backdate_testbed(testbed: Path):
+    # A saved graph is only trusted if its files were last modified a while before it was built
+    modified = time.time() - 60
+    for root, _, files in os.walk(testbed):
+        for file in files:
+            os.utime(Path(root) / file, (modified, modified))
+
+
+@pytest.mark.asyncio
+async def test_saved_graph_skips_startup_update(mocker, tmp_path, temp_testbed, mock_session_context):
+    mocker.patch("mentat.code_context.graphs_dir", new=tmp_path)
+    _backdate_testbed(temp_testbed)
+
+    async def start_session():
+        code_context = CodeContext(mock_session_context.stream, temp_testbed)
+        await code_context.refresh_daemon()
+        return code_context
+
+    def end_session(code_context):
+        code_context.daemon.save()  # Daemon.update is mocked, so it didn't save the graph
+        code_context.save_graph_snapshot()
+
+    code_context = await start_session()
+    assert code_context.daemon.update.call_count == 1
+    assert code_context.daemon.graph_path.name.startswith("ragdaemon-testbed-")
+    snapshot_path = get_snapshot_path(code_context.daemon.graph_path)
+    end_session(code_context)
+    assert snapshot_path.exists()
+
+    # Nothing changed since the graph was saved, so a new session loads it instead of updating
+    code_context = await start_session()
+    assert code_context.daemon.update.call_count == 1
+
+    # Committed and uncommitted changes both count as a delta
+    with open(temp_testbed / "scripts" / "calculator.py", "a") as f:
+        f.write("\n# new line\n")
+    end_session(code_context)
+    code_context = await start_session()
+    assert code_context.daemon.update.call_count == 2
+    # The update saved a graph the old snapshot doesn't describe
+    assert not snapshot_path.exists()
+
+    # A file that changed after the graph was built means no snapshot is saved
+    with open(temp_testbed / "scripts" / "echo.py", "a") as f:
+        f.write("\n# new line\n")
+    end_session(code_context)
+    assert not snapshot_path.exists()
+    _backdate_testbed(temp_testbed)
+    code_context = await start_session()
+    assert code_context.daemon.update.call_count == 3
+    end_session(code_context)
+    assert snapshot_path.exists()
+
+    run_git_command(temp_testbed, "commit", "-am", "commit change")
+    code_context = await start_session()
+    assert code_context.daemon.update.call_count == 4
+
+
+@pytest.mark.asyncio
+async def test_saved_graph_needs_its_documents(mocker, tmp_path, temp_testbed, mock_session_context):
+    mocker.patch("mentat.code_context.graphs_dir", new=tmp_path)
+    _backdate_testbed(temp_testbed)
+    # The database ragdaemon uses in tests only keeps documents in memory, so the sessions share one
+    db = LiteDB(temp_testbed, tmp_path)
+    mocker.patch("ragdaemon.daemon.get_db", return_value=db)
+
+    async def run_session():
+        code_context = CodeContext(mock_session_context.stream, temp_testbed)
+        await code_context.refresh_daemon()
+        code_context.daemon.graph.add_node("calculator", checksum="calculator_checksum")
+        code_context.daemon.save()
+        code_context.save_graph_snapshot()
+        return code_context
+
+    await run_session()
+    # The graph's document isn't in the database, so the graph can't be loaded
+    code_context = await run_session()
+    assert code_context.daemon.update.call_count == 2
+
+    db.upsert(ids="calculator_checksum", metadatas={}, documents="def calculate(): ...")
+    code_context = CodeContext(mock_session_context.stream, temp_testbed)
+    await code_context.refresh_daemon()
+    assert code_context.daemon.update.call_count == 2
+    assert code_context.daemon.graph.nodes["calculator"]["checksum"] == "calculator_checksum"
@@ -24,3 +24,14 @@ def test_consolidated_refs(temp_testbed):
     assert len(consolidated) == 2
     assert consolidated[0] == f"{scripts_dir / 'calculator.py'}:1-10,10-20,30-40"
     assert consolidated[1] == str(scripts_dir / "echo.py")
+
+
+def test_consolidated_refs_merge_overlapping(temp_testbed):
+    calculator_path = temp_testbed / "scripts" / "calculator.py"
+    features = [
+        CodeFeature(calculator_path, Interval(10, 20)),
+        CodeFeature(calculator_path, Interval(1, 5)),
+        CodeFeature(calculator_path, Interval(1, 6)),
+        CodeFeature(calculator_path, Interval(15, 25)),
+    ]
+    assert get_consolidated_feature_refs(features) == [f"{calculator_path}:1-6,10-25"]
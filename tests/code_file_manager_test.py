@@ -6,6 +6,7 @@ import pytest
 
 from mentat.parsers.file_edit import FileEdit, Replacement
 from mentat.session import Session
+from mentat.session_stream import SessionStream
 
 
 # Make sure we always give posix paths to GPT
@@ -281,3 +282,70 @@ async def test_changed_file(
     mock_collect_user_input.set_stream_messages(["y", "q"])
     await code_file_manager.write_changes_to_files([file_edit])
     assert file_path.read_text().splitlines() == ["I am a file", "with edited lines"]
+
+
+def test_directory_checksum(mock_session_context, temp_testbed):
+    code_file_manager = mock_session_context.code_file_manager
+    directory = temp_testbed / "multifile_calculator"
+    checksum = code_file_manager.get_file_checksum(directory)
+    scripts_checksum = code_file_manager.get_file_checksum(temp_testbed / "scripts")
+    assert checksum != ""
+
+    code_file_manager.create_file(directory / "new_file.py", "forty two")
+    assert code_file_manager.get_file_checksum(directory) != checksum
+    assert code_file_manager.get_file_checksum(temp_testbed / "scripts") == scripts_checksum
+    code_file_manager.delete_file(directory / "new_file.py")
+    assert code_file_manager.get_file_checksum(directory) == checksum
+
+
+def test_read_file_cache(mocker, mock_session_context, temp_testbed):
+    code_file_manager = mock_session_context.code_file_manager
+    file_path = temp_testbed / "multifile_calculator" / "operations.py"
+
+    lines = code_file_manager.read_file(file_path)
+    # Unchanged files are served from the cache
+    mock_open = mocker.patch("builtins.open", side_effect=AssertionError("file was reread"))
+    assert code_file_manager.read_file(file_path) == lines
+    assert not code_file_manager.has_changed(file_path)
+    mocker.stop(mock_open)
+
+    with open(file_path, "a") as f:
+        f.write("# change\n")
+    assert code_file_manager.has_changed(file_path)
+    assert code_file_manager.read_file(file_path) == lines.copy()[:-1] + ["# change", ""]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("action", ['"action": "delete-file"', '"action": "rename-file", "name": "renamed.py"'])
+async def test_turn_after_removing_file(mocker, mock_collect_user_input, mock_call_llm_api, action):
+    # The removed file has to leave the context as soon as it's removed, without any errors
+    send_spy = mocker.spy(SessionStream, "send")
+    file_name = Path("removed.py")
+    file_name.write_text("# Remove me!")
+    mock_collect_user_input.set_stream_messages(["Remove the file", "y", "Anything else?", "q"])
+    mock_call_llm_api.set_return_values(
+        [
+            dedent(
+                f"""\
+        Removing the file
+
+        @@start
+        {{
+            "file": "{file_name}",
+            {action}
+        }}
+        @@end"""
+            ),
+            "Nothing else",
+        ]
+    )
+
+    session = Session(cwd=Path.cwd(), paths=[file_name])
+    session.start()
+    await session.stream.recv(channel="client_exit")
+
+    assert not file_name.exists()
+    assert mock_call_llm_api.call_count == 2
+    assert Path.cwd() / file_name not in session.ctx.code_context.include_files
+    # Neither exclude()'s path validation nor the next turn should complain about the missing file
+    assert not [call for call in send_spy.call_args_list if "exist" in str(call.args[1])]
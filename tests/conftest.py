@@ -12,13 +12,14 @@ import pytest
 from spice import SpiceResponse
 from spice.spice import SpiceCallArgs
 
-from mentat import config
+from mentat import config, edit_history
 from mentat.agent_handler import AgentHandler
 from mentat.auto_completer import AutoCompleter
 from mentat.code_context import CodeContext
 from mentat.code_file_manager import CodeFileManager
 from mentat.config import Config, config_file_name
 from mentat.conversation import Conversation
+from mentat.git_service import close_git_services
 from mentat.llm_api_handler import LlmApiHandler
 from mentat.parsers.streaming_printer import StreamingPrinter
 from mentat.sampler.sampler import Sampler
@@ -283,6 +284,8 @@ def temp_testbed(mocker, monkeypatch, get_marks):
         m.chdir(temp_testbed)
         yield Path(temp_testbed)
 
+    # the persistent git processes hold the testbed open, which also makes rmtree fail on windows
+    close_git_services()
     shutil.rmtree(temp_dir, onerror=add_permissions)
 
 
@@ -293,6 +296,12 @@ def mock_user_config(mocker):
     config.user_config_path = Path(config_file_name)
 
 
+# Edits journal their history under ~/.mentat; keep tests from leaving journals there
+@pytest.fixture(autouse=True)
+def mock_edit_history_dir(mocker, tmp_path):
+    mocker.patch.object(edit_history, "edit_history_dir_path", tmp_path / "edit_history")
+
+
 @pytest.fixture(autouse=True)
 def mock_sleep_time(mocker):
     mocker.patch.object(StreamingPrinter, "sleep_time", new=lambda self: 0)
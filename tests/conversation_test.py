@@ -71,3 +71,27 @@ async def test_raise_if_context_exceeded():
     conversation = session_context.conversation
     with pytest.raises(ReturnToUser):
         await conversation.get_model_response()
+
+
+@pytest.mark.asyncio
+async def test_token_count_cache(mocker):
+    session_context = SESSION_CONTEXT.get()
+    config = session_context.config
+    conversation = session_context.conversation
+    llm_api_handler = session_context.llm_api_handler
+
+    conversation.add_user_message("Hello, World!")
+    messages = await conversation.get_messages()
+    expected = llm_api_handler.spice.count_prompt_tokens(messages, config.model, config.provider)
+    assert await conversation.count_tokens() == expected
+
+    # Only the new message is tokenized on the next count
+    spy = mocker.spy(llm_api_handler.spice, "count_prompt_tokens")
+    assert await conversation.count_tokens() == expected
+    assert spy.call_count == 0
+    conversation.add_user_message("Another message")
+    messages = await conversation.get_messages()
+    assert await conversation.count_tokens() == llm_api_handler.spice.count_prompt_tokens(
+        messages, config.model, config.provider
+    )
+    assert spy.call_count == 2
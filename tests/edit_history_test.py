@@ -0,0 +1,84 @@
+from textwrap import dedent
+
+import pytest
+
+from mentat.edit_history import EditHistory
+from mentat.parsers.file_edit import FileEdit, Replacement
+
+
+@pytest.mark.asyncio
+async def test_undo_after_restart(temp_testbed, mock_session_context):
+    code_file_manager = mock_session_context.code_file_manager
+    file_path = temp_testbed / "temp.py"
+    original_content = dedent(
+        """\
+        # This is a temporary file
+        # with 2 lines"""
+    )
+    file_path.write_text(original_content)
+
+    code_file_manager.read_file(file_path)
+    await code_file_manager.write_changes_to_files([FileEdit(file_path, [Replacement(1, 1, ["# inserted"])])])
+    assert file_path.read_text() == "# This is a temporary file\n# inserted\n# with 2 lines"
+    # Only the changed lines are kept for undo
+    history_edit = code_file_manager.history.edits[0].edits[0]
+    assert history_edit.file_edit.previous_file_lines is None
+    assert [(hunk.start, hunk.new_lines, hunk.old_lines) for hunk in history_edit.reverse_patch] == [
+        (1, ["# inserted"], [])
+    ]
+
+    # A new session can undo and redo the edit from the journal
+    code_file_manager.history = EditHistory()
+    assert code_file_manager.history.undo() == []
+    assert file_path.read_text() == original_content
+    code_file_manager.history = EditHistory()
+    assert await code_file_manager.history.redo() == []
+    assert file_path.read_text() == "# This is a temporary file\n# inserted\n# with 2 lines"
+    code_file_manager.history = EditHistory()
+    assert code_file_manager.history.undo() == []
+    assert file_path.read_text() == original_content
+    assert code_file_manager.history.undo() == ["No edits available to undo"]
+
+
+@pytest.mark.asyncio
+async def test_undo_rename_after_restart(temp_testbed, mock_session_context):
+    code_file_manager = mock_session_context.code_file_manager
+    code_context = mock_session_context.code_context
+    file_path = temp_testbed / "temp.py"
+    new_file_path = temp_testbed / "renamed.py"
+    file_path.write_text("first\nsecond")
+    code_context.include(file_path)
+
+    code_file_manager.read_file(file_path)
+    await code_file_manager.write_changes_to_files(
+        [FileEdit(file_path, [Replacement(1, 2, ["edited"])], rename_file_path=new_file_path)]
+    )
+    assert not file_path.exists()
+    assert new_file_path.read_text() == "first\nedited"
+
+    # The renamed file's lines haven't been read by the new session
+    code_file_manager.history = EditHistory()
+    code_file_manager.file_lines.clear()
+    assert code_file_manager.history.undo() == []
+    assert not new_file_path.exists()
+    assert file_path.read_text() == "first\nsecond"
+    assert file_path in code_context.include_files
+    assert new_file_path not in code_context.include_files
+
+
+def test_undo_changed_file(temp_testbed, mock_session_context):
+    code_file_manager = mock_session_context.code_file_manager
+    file_path = temp_testbed / "temp.py"
+    file_path.write_text("first\nsecond")
+
+    code_file_manager.read_file(file_path)
+    code_file_manager.write_to_file(file_path, ["first", "edited"])
+    code_file_manager.history.add_edit(
+        FileEdit(file_path, [Replacement(1, 2, ["edited"])], previous_file_lines=["first", "second"])
+    )
+    code_file_manager.history.push_edits()
+
+    # The lines the edit replaced were changed again, so it can't be undone
+    file_path.write_text("first\nchanged")
+    assert code_file_manager.history.undo() == [f"File {file_path} changed since it was edited; unable to undo edit"]
+    assert file_path.read_text() == "first\nchanged"
@@ -0,0 +1,25 @@
+import pytest
+
+from mentat.edit_preview import EditPreview
+from mentat.parsers.file_edit import FileEdit, Replacement
+
+
+@pytest.mark.asyncio
+async def test_edit_preview(mocker, mock_session_context):
+    send = mocker.patch.object(mock_session_context.stream, "send")
+    file_edit = FileEdit(mock_session_context.cwd / "new_file.py", [Replacement(0, 0, ["a", "b"])], is_creation=True)
+    other_edit = FileEdit(mock_session_context.cwd / "other_file.py", [Replacement(0, 0, ["x"])], is_creation=True)
+
+    edit_preview = EditPreview()
+    edit_preview.file_edit_updated(file_edit)
+    edit_preview.file_edit_updated(other_edit)
+    await edit_preview.finish()
+    assert send.call_args.kwargs["channel"] == "model_file_edits_preview"
+    assert [message["new_content"] for message in send.call_args.args[0]] == ["a\nb", "x"]
+
+    # An edit that was added to after its preview has its conflicts resolved again
+    other_edit.replacements.append(Replacement(0, 0, ["y"]))
+    edit_preview.resolve_conflicts(file_edit)
+    edit_preview.resolve_conflicts(other_edit)
+    assert file_edit.get_updated_file_lines([]) == ["a", "b"]
+    assert sorted(other_edit.get_updated_file_lines([])) == ["x", "y"]
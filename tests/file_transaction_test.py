@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+from mentat.file_transaction import FileTransaction
+
+
+def _write_files(directory, files):
+    for name, content in files.items():
+        (directory / name).write_text(content)
+
+
+def _read_files(directory):
+    return {path.name: path.read_text() for path in directory.iterdir()}
+
+
+def test_commit(tmp_path):
+    _write_files(tmp_path, {"edited.py": "old", "deleted.py": "deleted", "renamed.py": "renamed", "moved.py": "moved"})
+    os.chmod(tmp_path / "edited.py", 0o755)
+
+    transaction = FileTransaction()
+    transaction.write(tmp_path / "edited.py", "new")
+    transaction.delete(tmp_path / "deleted.py")
+    transaction.rename(tmp_path / "renamed.py", tmp_path / "renamed_to.py")
+    transaction.rename(tmp_path / "moved.py", tmp_path / "dir" / "moved.py", "moved and edited")
+    transaction.create(tmp_path / "created.py", "created")
+    transaction.commit()
+
+    assert {path.name for path in tmp_path.iterdir()} == {"edited.py", "renamed_to.py", "created.py", "dir"}
+    assert (tmp_path / "edited.py").read_text() == "new"
+    assert (tmp_path / "renamed_to.py").read_text() == "renamed"
+    assert (tmp_path / "created.py").read_text() == "created"
+    assert (tmp_path / "dir" / "moved.py").read_text() == "moved and edited"
+    assert os.stat(tmp_path / "edited.py").st_mode & 0o777 == 0o755
+
+
+def test_rollback(tmp_path):
+    files = {"edited.py": "old", "deleted.py": "deleted", "renamed.py": "renamed", "existing.py": "existing"}
+    _write_files(tmp_path, files)
+
+    transaction = FileTransaction()
+    transaction.write(tmp_path / "edited.py", "new")
+    transaction.delete(tmp_path / "deleted.py")
+    transaction.rename(tmp_path / "renamed.py", tmp_path / "renamed_to.py", "renamed and edited")
+    transaction.create(tmp_path / "existing.py", "created")
+    with pytest.raises(FileExistsError):
+        transaction.commit()
+
+    # Every file is back the way it was, with no temporary files left behind
+    assert _read_files(tmp_path) == files
@@ -1,7 +1,19 @@
+import builtins
 import os
 import subprocess
 
-from mentat.git_handler import get_git_diff, get_hexsha_active
+import pytest
+
+from mentat.git_handler import (
+    clear_git_root_cache,
+    commit,
+    get_git_diff,
+    get_git_diff_async,
+    get_git_root_for_path,
+    get_hexsha_active,
+)
+from mentat.include_files import get_paths_for_directory
+from tests.conftest import run_git_command
 
 
 def test_get_git_diff(temp_testbed, mock_session_context):
@@ -18,6 +30,38 @@ def test_get_git_diff(temp_testbed, mock_session_context):
     assert "forty two" not in get_git_diff("HEAD~1")
 
 
+def test_get_git_diff_leaves_index_untouched(temp_testbed, mock_session_context):
+    with open(temp_testbed / "staged_file.txt", "w") as f:
+        f.write("staged")
+    run_git_command(temp_testbed, "add", "staged_file.txt")
+    with open(temp_testbed / "untracked_file.txt", "w") as f:
+        f.write("untracked")
+    status = subprocess.check_output(["git", "status", "--porcelain"], text=True)
+
+    diff = get_git_diff("HEAD")
+    assert "staged_file.txt" in diff
+    assert "untracked_file.txt" in diff
+    assert subprocess.check_output(["git", "status", "--porcelain"], text=True) == status
+
+
+@pytest.mark.asyncio
+async def test_get_git_diff_async(temp_testbed, mock_session_context):
+    with open(temp_testbed / "test_file.txt", "w") as f:
+        f.write("forty two")
+    assert await get_git_diff_async("HEAD") == get_git_diff("HEAD")
+    assert "forty two" in await get_git_diff_async("HEAD")
+    # Untracked files are unstaged again afterwards
+    assert "test_file.txt" in subprocess.check_output(["git", "ls-files", "--others"], text=True)
+
+
+@pytest.mark.asyncio
+async def test_commit_reports_errors(mocker, temp_testbed, mock_session_context):
+    send_spy = mocker.spy(mock_session_context.stream, "send")
+    await commit("Nothing to see here")
+    assert "nothing to commit" in send_spy.call_args.args[0]
+    assert send_spy.call_args.kwargs["style"] == "error"
+
+
 def test_get_hexsha_active(temp_testbed):
     a = get_hexsha_active()
     with open("multifile_calculator/calculator.py", "a") as f:
@@ -29,3 +73,54 @@ def test_get_hexsha_active(temp_testbed):
     assert a != b
     assert b != c
     assert a != c
+
+
+def test_get_hexsha_active_empty_repo(temp_testbed, mock_session_context):
+    empty_repo = temp_testbed / "untracked" / "empty_repo"
+    empty_repo.mkdir(parents=True)
+    run_git_command(empty_repo, "init")
+    mock_session_context.cwd = empty_repo
+    assert get_hexsha_active() == ""
+
+    (empty_repo / "test_file.txt").write_text("forty two")
+    assert get_hexsha_active() != ""
+
+
+def test_get_hexsha_active_only_reads_changed_files(mocker, temp_testbed, mock_session_context):
+    a = get_hexsha_active()
+    open_spy = mocker.spy(builtins, "open")
+    assert get_hexsha_active() == a
+    assert open_spy.call_count == 0
+
+    calculator_path = temp_testbed / "multifile_calculator" / "calculator.py"
+    mock_session_context.code_file_manager.write_to_file(calculator_path, ["forty three"])
+    b = get_hexsha_active()
+    assert b != a
+    assert {call.args[0] for call in open_spy.call_args_list if call.args[1:] == ("rb",)} == {calculator_path}
+
+
+def test_git_root_lookups_are_shared(mocker, temp_testbed):
+    nested_repo = temp_testbed / "untracked" / "nested_repo"
+    nested_repo.mkdir(parents=True)
+    run_git_command(nested_repo, "init")
+
+    clear_git_root_cache()
+    check_output = mocker.spy(subprocess, "check_output")
+    assert get_git_root_for_path(temp_testbed / "multifile_calculator") == temp_testbed
+    assert get_git_root_for_path(temp_testbed / "scripts" / "calculator.py") == temp_testbed
+    assert get_git_root_for_path(nested_repo) == nested_repo
+    assert get_git_root_for_path(temp_testbed.parent, raise_error=False) is None
+    rev_parse_calls = [call for call in check_output.call_args_list if "rev-parse" in call.args[0]]
+    assert len(rev_parse_calls) == 2
+
+
+def test_get_paths_for_non_git_directory_skips_git(mocker, temp_testbed):
+    tree = temp_testbed.parent / "not_a_repo"
+    for i in range(20):
+        (tree / f"dir_{i}" / "inner").mkdir(parents=True)
+        (tree / f"dir_{i}" / "inner" / "file.txt").write_text("text")
+
+    check_output = mocker.spy(subprocess, "check_output")
+    paths = get_paths_for_directory(tree)
+    assert len(paths) == 20
+    assert check_output.call_count == 0
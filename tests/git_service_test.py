@@ -0,0 +1,105 @@
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import mentat.git_service as git_service_module
+from mentat.git_service import GitService
+from tests.conftest import run_git_command
+
+
+def test_lookups_share_one_process(mocker, temp_testbed):
+    git_service = GitService(temp_testbed)
+    head = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=temp_testbed, text=True).strip()
+    popen = mocker.spy(subprocess, "Popen")
+
+    assert git_service.head_exists()
+    assert git_service.lookup(["HEAD", "not_a_ref", "HEAD^{tree}"])[0].hexsha == head
+    assert git_service.lookup(["not_a_ref"]) == [None]
+    assert git_service.lookup(["HEAD^{tree}"])[0].object_type == "tree"
+    assert not git_service.is_branch("not_a_ref")
+    assert popen.call_count == 1
+    git_service.close()
+
+
+def test_commit_metadata_cache(temp_testbed):
+    git_service = GitService(temp_testbed)
+    assert git_service.get_commit_metadata(["HEAD"])[0]["summary"] == "add testbed"
+    assert git_service.get_commit_metadata(["not_a_ref"]) == [None]
+
+    # A new commit moves HEAD, so cached results are dropped
+    (temp_testbed / "test_file.txt").write_text("forty two")
+    run_git_command(temp_testbed, "add", ".")
+    run_git_command(temp_testbed, "commit", "-m", "test commit")
+    assert git_service.get_commit_metadata(["HEAD"])[0]["summary"] == "test commit"
+    git_service.close()
+
+
+def test_get_diff_state(temp_testbed):
+    git_service = GitService(temp_testbed)
+    with open(temp_testbed / "multifile_calculator" / "operations.py", "a") as f:
+        f.write("# change\n")
+    (temp_testbed / "untracked_dir").mkdir()
+    (temp_testbed / "untracked_dir" / "file.txt").write_text("text")
+
+    diff_state = git_service.get_diff_state("HEAD")
+    assert diff_state.diff_files == [temp_testbed / "multifile_calculator" / "operations.py"]
+    assert diff_state.untracked_files == [temp_testbed / "untracked_dir"]
+    assert git_service.get_diff_state("not_a_ref") is None
+    git_service.close()
+
+
+@pytest.mark.asyncio
+async def test_get_diff_stats(mocker, temp_testbed):
+    git_service = GitService(temp_testbed)
+    abs_path = temp_testbed / "multifile_calculator" / "operations.py"
+    with open(abs_path, "a") as f:
+        f.write("# change\n")
+
+    assert await git_service.get_diff_stats_async("HEAD", [abs_path]) == {abs_path: (1, 0)}
+    # Unchanged files reuse the cached stats
+    run_subprocess_async = mocker.spy(git_service_module, "run_subprocess_async")
+    assert await git_service.get_diff_stats_async("HEAD", [abs_path]) == {abs_path: (1, 0)}
+    assert run_subprocess_async.call_count == 0
+
+    with open(abs_path, "a") as f:
+        f.write("# another change\n")
+    assert await git_service.get_diff_stats_async("HEAD", [abs_path]) == {abs_path: (2, 0)}
+    git_service.close()
+
+
+@pytest.mark.asyncio
+async def test_full_diffs_use_separate_indexes(mocker, temp_testbed):
+    git_service = GitService(temp_testbed)
+    (temp_testbed / "untracked.txt").write_text("forty two\n")
+    run = mocker.spy(git_service, "_run")
+    run_async = mocker.spy(git_service, "_run_async")
+
+    # A blocking diff can run while an async one is waiting on git, so they can't share a temporary index
+    diff, async_diff = git_service.get_full_diff("HEAD"), await git_service.get_full_diff_async("HEAD")
+    assert diff == async_diff
+    assert "forty two" in diff
+    index_files = {call.kwargs["env"]["GIT_INDEX_FILE"] for call in run.call_args_list}
+    async_index_files = {call.kwargs["env"]["GIT_INDEX_FILE"] for call in run_async.call_args_list}
+    assert len(index_files) == 1 and len(async_index_files) == 1
+    assert index_files != async_index_files
+    git_service.close()
+
+
+def test_concurrent_snapshots(temp_testbed):
+    git_service = GitService(temp_testbed)
+    paths = [temp_testbed / f"untracked_{i}.txt" for i in range(2)]
+    for path in paths:
+        path.write_text(f"{path.name}\n")
+
+    # Each snapshot only contains the untracked paths it was given, even when they run at the same time
+    for _ in range(5):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            commits = list(executor.map(lambda path: git_service.create_snapshot_commit([path], "snapshot"), paths))
+        for path, commit in zip(paths, commits):
+            assert commit is not None
+            names = subprocess.check_output(
+                ["git", "ls-tree", "--name-only", commit], cwd=temp_testbed, text=True
+            ).split()
+            assert [name for name in names if name.startswith("untracked_")] == [path.name]
+    git_service.close()
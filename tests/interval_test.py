@@ -0,0 +1,42 @@
+from mentat.interval import INTERVAL_FILE_END, Interval, IntervalSet
+
+
+def test_interval_set_merges():
+    interval_set = IntervalSet([Interval(10, 20), Interval(1, 5), Interval(4, 8), Interval(20, 25)])
+    assert interval_set.intervals == [Interval(1, 8), Interval(10, 25)]
+
+    interval_set.add(Interval(7, 11))
+    assert interval_set.intervals == [Interval(1, 25)]
+
+    separate = IntervalSet([Interval(1, 10), Interval(10, 20), Interval(15, 30)], merge_adjacent=False)
+    assert separate.intervals == [Interval(1, 10), Interval(10, 30)]
+
+
+def test_interval_set_remove():
+    interval_set = IntervalSet([Interval(1, 10), Interval(20, 30), Interval(40, INTERVAL_FILE_END)])
+    interval_set.remove(Interval(5, 25))
+    assert interval_set.intervals == [Interval(1, 5), Interval(25, 30), Interval(40, INTERVAL_FILE_END)]
+    assert interval_set.difference([Interval(42, 43)]).intervals == [
+        Interval(1, 5),
+        Interval(25, 30),
+        Interval(40, 42),
+        Interval(43, INTERVAL_FILE_END),
+    ]
+    assert interval_set.union([Interval(5, 25)]).intervals == [Interval(1, 30), Interval(40, INTERVAL_FILE_END)]
+
+
+def test_interval_set_queries():
+    interval_set = IntervalSet([Interval(1, 10), Interval(10, 20), Interval(30, 40)], merge_adjacent=False)
+    assert interval_set.contains(1)
+    assert interval_set.contains(19)
+    assert not interval_set.contains(20)
+    assert not interval_set.contains(0)
+
+    assert interval_set.covers(Interval(5, 15))
+    assert interval_set.covers(Interval(30, 40))
+    assert interval_set.covers(Interval(25, 25))
+    assert not interval_set.covers(Interval(15, 31))
+    assert not interval_set.covers(Interval(20, 21))
+
+    assert interval_set.intersects(Interval(19, 30))
+    assert not interval_set.intersects(Interval(20, 30))
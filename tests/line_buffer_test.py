@@ -0,0 +1,26 @@
+from mentat.line_buffer import LineBuffer
+
+
+def test_line_buffer_matches_split():
+    for text in ["", "line", "line\n", "first\nsecond\n\nfourth"]:
+        lines = text.split("\n")
+        line_buffer = LineBuffer(text)
+        assert line_buffer == lines
+        assert len(line_buffer) == len(lines)
+        assert [line_buffer[i] for i in range(-len(lines), len(lines))] == lines + lines
+        for start in range(-3, 4):
+            for stop in range(-3, 4):
+                assert line_buffer[start:stop] == lines[start:stop]
+                assert line_buffer[start:stop].text == "\n".join(lines[start:stop])
+
+
+def test_line_buffer_copy():
+    line_buffer = LineBuffer("first\nsecond\nthird")
+    view = line_buffer[1:]
+    assert isinstance(view, LineBuffer)
+    assert view == LineBuffer("second\nthird")
+
+    lines = view.copy()
+    lines.append("fourth")
+    assert view == ["second", "third"]
+    assert line_buffer == ["first", "second", "third"]
@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from pathlib import Path
+
+import mentat.parsers.change_display_helper as change_display_helper
+from mentat.parsers.change_display_helper import DisplayInformation, FileActionType, get_lexer, highlight_text
+
+
+def _display_information(file_name: Path) -> DisplayInformation:
+    return DisplayInformation(file_name, [], ["print('hello')"], [], FileActionType.UpdateFile)
+
+
+def test_lexers_are_shared_by_file_name(mock_session_context):
+    lexer = get_lexer(Path("first") / "calculator.py")
+    assert get_lexer(Path("second") / "calculator.py") is lexer
+    assert get_lexer(Path("operations.py")) is not lexer
+    # Matched by full name, not just extension
+    assert get_lexer(Path("Makefile")).name == "Makefile"
+
+    display_information = _display_information(Path("first") / "calculator.py")
+    assert display_information.lexer is lexer
+    assert _display_information(Path("second") / "calculator.py").lexer is lexer
+
+
+def test_highlighting_is_cached(mocker):
+    mocker.patch.object(change_display_helper, "_highlight_cache", OrderedDict())
+    lexer = get_lexer(Path("calculator.py"))
+    lex = mocker.spy(change_display_helper, "lex")
+
+    highlighted = highlight_text("def add(a, b):\n    return a + b\n", lexer)
+    assert lex.call_count == 1
+    assert "".join(value for value, _ in highlighted) == "def add(a, b):\n    return a + b\n"
+
+    cached = highlight_text("def add(a, b):\n    return a + b\n", lexer)
+    assert lex.call_count == 1
+    assert cached == highlighted
+    # The printer modifies styles, so cached results aren't shared between callers
+    assert all(cached_style is not style for (_, cached_style), (_, style) in zip(cached, highlighted))
+
+    highlight_text("def subtract(a, b):\n", lexer)
+    assert lex.call_count == 2
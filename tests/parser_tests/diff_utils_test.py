@@ -0,0 +1,16 @@
+from mentat.parsers.diff_utils import HunkLocator
+
+
+def test_hunk_locator():
+    locator = HunkLocator(["def f():", "    return 1", "", "def g():", "", "    return 2"])
+    assert locator.find(["def g():"]) == 3
+    assert locator.find(["DEF G():"]) == 3
+    assert locator.find(["def f():", "return 1"]) == 0
+    assert locator.find(["def h():"]) == -1
+    # Blank lines are ignored last, and the match is placed where it was actually found
+    assert locator.find(["", "def g():", "    return 2"]) == 3
+
+
+def test_hunk_locator_blank():
+    assert HunkLocator(["", "  "]).find([""]) == 0
+    assert HunkLocator([]).find(["a"]) == -1
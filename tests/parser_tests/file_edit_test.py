@@ -46,3 +46,18 @@ async def test_replacement_conflict(mock_session_context):
     original_lines = ["O0", "O1", "O2", "O3", "O4", "O5", "O6"]
     new_lines = file_edit.get_updated_file_lines(original_lines)
     assert new_lines == ["L0", "L1", "O3", "L2", "L3"]
+
+
+@pytest.mark.asyncio
+async def test_updated_file_lines_cache(mock_session_context):
+    file_edit = FileEdit(
+        file_path=mock_session_context.cwd.joinpath("test.py"),
+        replacements=[Replacement(1, 2, ["L1"])],
+    )
+    original_lines = ["O0", "O1", "O2"]
+    new_lines = file_edit.get_updated_file_lines(original_lines)
+    assert file_edit.get_updated_file_lines(original_lines) is new_lines
+
+    file_edit.replacements.append(Replacement(5, 5, ["L5"]))
+    assert file_edit.get_updated_file_lines(original_lines) == ["O0", "L1", "O2", "", "", "L5"]
+    assert original_lines == ["O0", "O1", "O2"]
@@ -0,0 +1,88 @@
+import json
+from typing import AsyncIterator, Callable
+
+import pytest
+
+from mentat.parsers.file_edit import FileEdit, Replacement
+from mentat.parsers.json_parser import JsonParser
+
+
+def _edit(line: int, content: str) -> dict[str, str | int]:
+    return {
+        "type": "edit",
+        "filename": "multifile_calculator/calculator.py",
+        "starting-line": line,
+        "ending-line": line,
+        "content": content,
+    }
+
+
+async def _stream(chunks: list[str], after_chunk: Callable[[int], None]) -> AsyncIterator[str]:
+    for i, chunk in enumerate(chunks):
+        yield chunk
+        # Runs once the parser has handled the chunk and asks for the next one
+        after_chunk(i)
+
+
+def _split_after_item(text: str, item: dict[str, str | int]) -> list[str]:
+    item_end = text.index(json.dumps(item)) + len(json.dumps(item))
+    return [text[:item_end], text[item_end:]]
+
+
+@pytest.mark.asyncio
+async def test_edits_are_passed_on_as_items_complete(temp_testbed):
+    items = [{"type": "comment", "content": "Adding comments\n"}, _edit(1, "# forty two"), _edit(3, "# forty three")]
+    text = json.dumps({"content": items})
+    chunks = _split_after_item(text, items[1])
+
+    parser = JsonParser()
+    seen = list[FileEdit]()
+    seen_by_chunk = list[int]()
+    parsed = await parser.stream_and_parse_llm_response(
+        _stream(chunks, lambda _: seen_by_chunk.append(len(seen))), on_file_edit=seen.append
+    )
+
+    # The first edit is passed on before the rest of the response arrives
+    assert seen_by_chunk == [1, 2]
+    # Edits to the same file are merged into the one FileEdit
+    assert len(seen) == 2 and seen[0] is seen[1]
+    assert parsed.file_edits == [seen[0]]
+    assert parsed.file_edits[0].file_path == temp_testbed / "multifile_calculator" / "calculator.py"
+    assert parsed.file_edits[0].replacements == [
+        Replacement(2, 2, ["# forty three"]),
+        Replacement(0, 0, ["# forty two"]),
+    ]
+    assert parsed.conversation == "Adding comments\n"
+    assert not parsed.interrupted
+
+
+@pytest.mark.asyncio
+async def test_interrupted_response_uses_completed_items(temp_testbed):
+    items = [_edit(1, "# forty two"), _edit(3, "# forty three")]
+    text = json.dumps({"content": items})
+    chunks = _split_after_item(text, items[0])
+
+    parser = JsonParser()
+    parsed = await parser.stream_and_parse_llm_response(_stream(chunks, lambda _: parser.shutdown.set()))
+
+    assert parsed.interrupted
+    assert len(parsed.file_edits) == 1
+    assert parsed.file_edits[0].replacements == [Replacement(0, 0, ["# forty two"])]
+
+
+@pytest.mark.asyncio
+async def test_edits_are_rebuilt_when_items_differ(temp_testbed):
+    # Only the first array under the key is streamed, but the last duplicate key is the one json.loads keeps
+    text = (
+        f'{{"content": [{json.dumps(_edit(1, "# forty two"))}],'
+        f' "content": [{json.dumps(_edit(3, "# forty three"))}]}}'
+    )
+
+    parser = JsonParser()
+    seen = list[FileEdit]()
+    parsed = await parser.stream_and_parse_llm_response(_stream([text], lambda _: None), on_file_edit=seen.append)
+
+    # The edit passed on while streaming is superseded by the one built from the whole JSON
+    assert len(seen) == 1 and len(parsed.file_edits) == 1
+    assert parsed.file_edits[0] is not seen[0]
+    assert parsed.file_edits[0].replacements == [Replacement(2, 2, ["# forty three"])]
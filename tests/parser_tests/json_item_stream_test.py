@@ -0,0 +1,18 @@
+import json
+
+from mentat.parsers.json_item_stream import JsonItemStream
+
+
+def test_items_are_decoded_as_they_complete():
+    items = [
+        {"type": "comment", "content": 'Braces } and "quotes" in strings'},
+        {"type": "edit", "filename": "a.py", "content": "x = {'a': [1]}\\n"},
+    ]
+    text = json.dumps({"other": [{"type": "comment"}], "content": items})
+    first_end = text.index(json.dumps(items[0])) + len(json.dumps(items[0]))
+
+    stream = JsonItemStream()
+    # Nothing is decoded until an item's closing brace arrives
+    assert stream.feed(text[: first_end - 1]) == []
+    assert stream.feed(text[first_end - 1 : first_end + 5]) == [items[0]]
+    assert [item for i in range(first_end + 5, len(text), 3) for item in stream.feed(text[i : i + 3])] == [items[1]]
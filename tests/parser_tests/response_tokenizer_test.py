@@ -0,0 +1,32 @@
+from mentat.parsers.block_parser import BlockParser
+from mentat.parsers.response_tokenizer import (
+    BlockEnd,
+    BlockHeader,
+    LineText,
+    ResponseTokenizer,
+)
+
+
+def test_events():
+    tokenizer = ResponseTokenizer(BlockParser())
+    events = []
+    for content in ["Conv", "ersation\n", "@@start\n", '{"file": "a.py"}\n', "@@code\n"]:
+        events.extend(tokenizer.feed(content))
+    assert events == [
+        LineText("Conv", "Conv", True, False),
+        LineText("ersation\n", "Conversation\n", False, False),
+        BlockHeader(["@@start", '{"file": "a.py"}', "@@code"]),
+    ]
+
+    # The consumer decides whether a code block follows the header
+    tokenizer.in_code_lines = True
+    events = []
+    for content in ["x = 1\n", "y = 2\n", "@@", "end\n"]:
+        events.extend(tokenizer.feed(content))
+    assert events == [
+        LineText("x = 1\n", "x = 1\n", True, True),
+        LineText("y = 2\n", "y = 2\n", True, True),
+        BlockEnd(["x = 1", "y = 2", "@@end"]),
+    ]
+    assert tokenizer.finish() == []
+    assert tokenizer.message.endswith("y = 2\n@@end\n")
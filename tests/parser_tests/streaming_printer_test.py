@@ -0,0 +1,28 @@
+import pytest
+
+from mentat.parsers.streaming_printer import StreamingPrinter
+
+
+@pytest.mark.asyncio
+async def test_strings_are_combined(mocker, mock_session_context):
+    send = mocker.patch.object(mock_session_context.stream, "send")
+    printer = StreamingPrinter(throttle=False)
+    printer.add_string("Hello ", end="")
+    printer.add_string("world", end="")
+    printer.add_string(("code", {"color": "green"}))
+    printer.add_delimiter()
+    printer.wrap_it_up()
+    await printer.print_lines()
+
+    assert [call.args[0] for call in send.call_args_list] == ["Hello world", "code", "\n", ""]
+    assert send.call_args_list[1].kwargs["color"] == "green"
+    assert send.call_args_list[3].kwargs["delimiter"]
+
+
+def test_frame_size():
+    printer = StreamingPrinter()
+    printer.add_string("a" * 10)
+    slow_frame_size = printer.frame_size()
+    printer.add_string("a" * 20000)
+    # A backlog isn't printed one character at a time
+    assert printer.frame_size() * 60 >= printer.chars_to_print > slow_frame_size * 60
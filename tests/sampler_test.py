@@ -75,7 +75,7 @@ async def test_sample_from_context(
         ]
     )
     sampler = Sampler()
-    sampler.set_active_diff()
+    await sampler.set_active_diff()
     sample = await sampler.create_sample()
     assert sample.title == "test_title"
     assert sample.description == "test_description"
@@ -259,8 +259,15 @@ def test_get_active_snapshot_commit(temp_testbed):
     (temp_testbed / "scripts" / "echo.py").unlink()
     (temp_testbed / "scripts" / "graph_class.py").rename(temp_testbed / "scripts" / "graph.py")
 
+    status = repo.git.status("--porcelain")
+    branches = repo.git.branch()
     commit_active = get_active_snapshot_commit(repo)
 
+    # Confirm the index, branches and stash were left alone
+    assert repo.git.status("--porcelain") == status
+    assert repo.git.branch() == branches
+    assert repo.git.stash("list") == ""
+
     # Confirm all changes in diff
     diff = repo.git.diff("HEAD", commit_active)
     assert "# Inserted Line" in diff
@@ -1,6 +1,13 @@
+import builtins
+import subprocess
 from pathlib import Path
 
-from mentat.utils import get_relative_path
+from mentat.utils import (
+    TEXT_SNIFF_BYTES,
+    are_files_text_encoded,
+    get_relative_path,
+    is_file_text_encoded,
+)
 
 
 def test_get_relative_path(temp_testbed: Path):
@@ -18,3 +25,61 @@ def test_get_relative_path(temp_testbed: Path):
     path = Path("multifile_calculator/__init__.py")
     target = temp_testbed
     assert get_relative_path(path, target) == Path("multifile_calculator/__init__.py")
+
+
+def test_is_file_text_encoded(mocker, temp_testbed: Path):
+    text_path = temp_testbed / "text.txt"
+    text_path.write_text("hello\n")
+    nul_path = temp_testbed / "nul.txt"
+    nul_path.write_bytes(b"hello\0world")
+    # Only the start of the file is read, so invalid bytes past it don't matter
+    large_path = temp_testbed / "large.txt"
+    large_path.write_bytes(b"a" * TEXT_SNIFF_BYTES + bytes([0x81]))
+    attributes_path = temp_testbed / "data" / "marked_binary.txt"
+    attributes_path.parent.mkdir()
+    attributes_path.write_text("hello\n")
+    (temp_testbed / ".gitattributes").write_text("data/*.txt binary\nnul.txt text\n")
+
+    assert is_file_text_encoded(text_path)
+    assert is_file_text_encoded(large_path)
+    assert not is_file_text_encoded(attributes_path)
+    # Marked as text, so the NUL byte is allowed
+    assert is_file_text_encoded(nul_path)
+    (temp_testbed / ".gitattributes").write_text("data/*.txt binary\n")
+    assert not is_file_text_encoded(nul_path)
+
+    # Verdicts are cached until the file changes
+    open_spy = mocker.spy(builtins, "open")
+    assert is_file_text_encoded(text_path)
+    assert not any(call.args[0] == text_path for call in open_spy.call_args_list)
+    text_path.write_text("hello\0\n")
+    assert not is_file_text_encoded(text_path)
+
+
+def test_are_files_text_encoded(mocker, temp_testbed: Path):
+    paths = [temp_testbed / name for name in ["plain.txt", "generated.txt", "info.txt"]]
+    for path in paths:
+        path.write_text("hello\n")
+    # Macros and info/attributes are read the same way git reads them
+    (temp_testbed / ".gitattributes").write_text("[attr]generated -diff\ngenerated.txt generated\n")
+    (temp_testbed / ".git" / "info").mkdir(exist_ok=True)
+    (temp_testbed / ".git" / "info" / "attributes").write_text("info.txt binary\n")
+
+    # Every file's attributes come from a single git call
+    check_output_spy = mocker.spy(subprocess, "check_output")
+    assert are_files_text_encoded(paths) == [True, False, False]
+    assert len([call for call in check_output_spy.call_args_list if "check-attr" in call.args[0]]) == 1
+
+    # Attributes are cached until an attribute file that applies to the path changes
+    check_output_spy.reset_mock()
+    assert are_files_text_encoded(paths) == [True, False, False]
+    assert is_file_text_encoded(paths[0])
+    assert not any("check-attr" in call.args[0] for call in check_output_spy.call_args_list)
+    nested_path = temp_testbed / "nested" / "plain.txt"
+    nested_path.parent.mkdir()
+    nested_path.write_text("hello\n")
+    assert is_file_text_encoded(nested_path)
+    (nested_path.parent / ".gitattributes").write_text("plain.txt -text\n")
+    assert not is_file_text_encoded(nested_path)
+    (temp_testbed / ".git" / "info" / "attributes").write_text("")
+    assert are_files_text_encoded(paths) == [True, False, True]